@@ -0,0 +1,338 @@
+"""Air brakes flown by a controller at its sampling rate.
+
+``Rocket.add_air_brakes`` evaluates its drag coefficient curve, a scattered
+(deployment level, Mach) table, with a 2-D ``Function`` at every derivative
+evaluation of the flight. ``DragTable`` resamples the table once on a regular
+grid and looks it up with index arithmetic and bilinear interpolation, and
+``add_air_brakes`` swaps it in, so the air brakes cost little more per step
+than the rocket's own drag curves.
+
+The controller is any rocketpy controller function (``time, sampling_rate,
+state, state_history, observed_variables, air_brakes, sensors``) and is called
+at its ``sampling_rate`` by the flight. ``ApogeeController`` targets an apogee
+with a proportional law, sensor noise and a deployment rate limit, and
+``ActuationSchedule`` replays a recorded deployment, e.g.
+data/rockets/camoes/actuation.csv. ``ControllerTimer`` measures the compute
+time of each controller call, reported by ``Profiler.flight_stats``.
+
+Controlled flights must stop at every sampling time of their controllers.
+rocketpy's default LSODA solver steps past them, so its controllers run at
+irregular solver steps; ``ode_solver`` picks RK45, which stops on them, for
+rockets with controllers.
+
+For Monte Carlo campaigns, ``StochasticAirBrakes`` draws the controller
+parameters (gains, noise, ...) of each sample, see ``campaign.run_parallel``.
+"""
+
+import math
+import random
+from dataclasses import dataclass, fields, replace
+from functools import lru_cache
+from time import perf_counter
+
+import numpy as np
+
+from .config import data_path
+
+GRAVITY = 9.80665
+
+# Flight solver of rockets with controllers, see ode_solver
+CONTROLLED_ODE_SOLVER = "RK45"
+
+
+class DragTable:
+    """Drag coefficient of the air brakes on a regular (deployment level,
+    Mach) grid. Lookups outside the grid are clamped to its edges.
+
+    Parameters
+    ----------
+    deployment, mach : numpy.ndarray
+        Evenly spaced grid values, increasing.
+    cd : numpy.ndarray
+        Drag coefficients, shape (len(deployment), len(mach)).
+    """
+
+    def __init__(self, deployment, mach, cd):
+        self.deployment = np.asarray(deployment, dtype=float)
+        self.mach = np.asarray(mach, dtype=float)
+        self.cd = np.asarray(cd, dtype=float)
+        self._d0, self._m0 = float(self.deployment[0]), float(self.mach[0])
+        self._d_scale = (len(self.deployment) - 1) / (self.deployment[-1] - self.deployment[0])
+        self._m_scale = (len(self.mach) - 1) / (self.mach[-1] - self.mach[0])
+        self._d_last, self._m_last = len(self.deployment) - 1, len(self.mach) - 1
+        # rows and columns repeated once, so the upper neighbor of the last
+        # grid point exists; python floats are faster than numpy scalars here
+        padded = np.pad(self.cd, ((0, 1), (0, 1)), mode="edge")
+        self._rows = padded.tolist()
+
+    @classmethod
+    def from_file(cls, filename, points=None):
+        """Table of a "deployment_level, mach, cd" CSV file (header
+        optional, relative to the data folder).
+
+        Tables on a regular grid are used as is, the missing grid points
+        (if any) evaluated with the 2-D ``Function`` interpolation rocketpy
+        would use in flight. Other tables, or all of them if ``points``
+        (deployment, Mach) is given, are evaluated with it on a regular grid
+        of ``points`` values.
+        """
+        # pylint: disable=import-outside-toplevel
+        from rocketpy import Function
+
+        path = data_path(filename)
+        with open(path, "r", encoding="utf-8") as file:
+            header = not file.readline().split(",")[0].strip().replace(".", "", 1).isdigit()
+        data = np.loadtxt(path, delimiter=",", skiprows=int(header))
+        curve = Function(data)
+        deployment, mach = np.unique(data[:, 0]), np.unique(data[:, 1])
+        regular = points is None and all(
+            np.allclose(np.diff(values), np.diff(values)[0]) for values in (deployment, mach)
+        )
+        if not regular:
+            points = points or (len(deployment), len(mach))
+            deployment = np.linspace(deployment[0], deployment[-1], points[0])
+            mach = np.linspace(mach[0], mach[-1], points[1])
+        cd = np.full((len(deployment), len(mach)), np.nan)
+        if regular:
+            cd[np.searchsorted(deployment, data[:, 0]), np.searchsorted(mach, data[:, 1])] = data[:, 2]
+        for i, j in zip(*np.nonzero(np.isnan(cd))):
+            cd[i, j] = curve.get_value_opt(deployment[i], mach[j])
+        return cls(deployment, mach, cd)
+
+    @property
+    def curve(self):
+        """Grid points as a (deployment level, Mach, cd) array, e.g. the
+        ``drag_coefficient_curve`` of ``AirBrakes``."""
+        deployment, mach = np.meshgrid(self.deployment, self.mach, indexing="ij")
+        return np.column_stack([deployment.ravel(), mach.ravel(), self.cd.ravel()])
+
+    def get_value_opt(self, deployment, mach):
+        """Drag coefficient at a deployment level and Mach number."""
+        i = (deployment - self._d0) * self._d_scale
+        j = (mach - self._m0) * self._m_scale
+        i = 0.0 if i < 0 else self._d_last if i > self._d_last else i
+        j = 0.0 if j < 0 else self._m_last if j > self._m_last else j
+        i0, j0 = int(i), int(j)
+        di, dj = i - i0, j - j0
+        row, next_row = self._rows[i0], self._rows[i0 + 1]
+        low = row[j0] + (row[j0 + 1] - row[j0]) * dj
+        high = next_row[j0] + (next_row[j0 + 1] - next_row[j0]) * dj
+        return low + (high - low) * di
+
+    __call__ = get_value_opt
+
+
+def ode_solver(rocket, default="LSODA"):
+    """``Flight`` solver for ``rocket``: ``CONTROLLED_ODE_SOLVER`` if it has
+    controllers (e.g. air brakes), ``default`` otherwise."""
+    controlled = rocket._controllers  # pylint: disable=protected-access
+    return CONTROLLED_ODE_SOLVER if controlled else default
+
+
+@lru_cache(maxsize=None)
+def drag_table(filename):
+    """``DragTable.from_file``, read once per file."""
+    return DragTable.from_file(filename)
+
+
+class ControllerTimer:
+    """Controller function that times each call of ``controller``.
+
+    A flight calls its controllers twice at the sampling times shared with a
+    parachute, the repeated call is skipped.
+
+    Attributes
+    ----------
+    calls : int
+        Number of calls since it was built or ``reset``.
+    total_time, max_time : float
+        Total and longest wall time of the calls, in seconds.
+    """
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.reset()
+
+    def reset(self):
+        """Forgets the timings, e.g. before flying the rocket again."""
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self._last_time = None
+
+    # rocketpy checks the number of arguments of controller functions
+    # pylint: disable=too-many-arguments
+    def __call__(
+        self, time, sampling_rate, state, state_history, observed_variables, objects, sensors
+    ):
+        if time == self._last_time:
+            return None
+        self._last_time = time
+        start = perf_counter()
+        result = self.controller(
+            time, sampling_rate, state, state_history, observed_variables, objects, sensors
+        )
+        elapsed = perf_counter() - start
+        self.calls += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        return result
+
+    def stats(self):
+        """Calls, mean and longest call time (s) as a dictionary."""
+        return {
+            "controller_calls": self.calls,
+            "controller_mean_time": self.total_time / self.calls if self.calls else 0.0,
+            "controller_max_time": self.max_time,
+        }
+
+
+@dataclass(frozen=True)
+class ApogeeController:
+    """Proportional apogee controller.
+
+    After ``start_time`` (e.g. the motor burn out) and while climbing, the
+    apogee is predicted from the measured altitude above the launch point
+    and vertical speed, assuming a constant drag per unit mass
+    ``drag_per_mass`` (1/m, the drag force is ``drag_per_mass * m * v**2``;
+    0 for a drag-free prediction). The deployment level is ``gain`` times the
+    relative excess of the predicted apogee over ``target_apogee`` (m above
+    the launch point), changed by at most ``deployment_rate`` per second.
+    ``altitude_noise`` and ``speed_noise`` are the standard deviations (m,
+    m/s) of the sensor errors, drawn from ``random``.
+    """
+
+    target_apogee: float
+    gain: float = 10
+    start_time: float = 0
+    drag_per_mass: float = 0
+    deployment_rate: float = 2
+    altitude_noise: float = 0
+    speed_noise: float = 0
+
+    def predicted_apogee(self, altitude, vertical_speed):
+        """Apogee (m) reached from ``altitude`` climbing at
+        ``vertical_speed``."""
+        if self.drag_per_mass <= 0:
+            return altitude + vertical_speed**2 / (2 * GRAVITY)
+        return altitude + math.log1p(
+            self.drag_per_mass * vertical_speed**2 / GRAVITY
+        ) / (2 * self.drag_per_mass)
+
+    # pylint: disable=too-many-arguments,unused-argument
+    def __call__(
+        self, time, sampling_rate, state, state_history, observed_variables, air_brakes, sensors
+    ):
+        vertical_speed = state[5]
+        if self.speed_noise:
+            vertical_speed += random.gauss(0, self.speed_noise)
+        level = 0.0
+        if time >= self.start_time and vertical_speed > 0:
+            # above the first state of the flight, the launch point
+            altitude = state[2] - state_history[0][3]
+            if self.altitude_noise:
+                altitude += random.gauss(0, self.altitude_noise)
+            predicted = self.predicted_apogee(altitude, vertical_speed)
+            level = self.gain * (predicted - self.target_apogee) / self.target_apogee
+        step = self.deployment_rate / sampling_rate
+        current = air_brakes.deployment_level
+        air_brakes.deployment_level = min(max(level, current - step, 0.0), current + step, 1.0)
+        return (time, air_brakes.deployment_level)
+
+
+class ActuationSchedule:
+    """Controller replaying a recorded deployment: a "time, deployment
+    level" CSV file relative to the data folder, times from liftoff."""
+
+    def __init__(self, filename):
+        data = np.loadtxt(data_path(filename), delimiter=",", ndmin=2)
+        self.filename = filename
+        self.time, self.level = data[:, 0], data[:, 1]
+
+    # pylint: disable=too-many-arguments,unused-argument
+    def __call__(
+        self, time, sampling_rate, state, state_history, observed_variables, air_brakes, sensors
+    ):
+        air_brakes.deployment_level = float(np.interp(time, self.time, self.level))
+        return (time, air_brakes.deployment_level)
+
+
+def add_air_brakes(rocket, config, controller=None):
+    """Adds the air brakes of an ``AirBrakesConfig`` to ``rocket``.
+
+    Parameters
+    ----------
+    rocket : Rocket
+    config : AirBrakesConfig
+    controller : callable, optional
+        Controller function replacing ``config.controller``, e.g. a drawn one.
+
+    Returns
+    -------
+    air_brakes : AirBrakes
+        Looked up with the ``DragTable`` of ``config.drag_coefficient``.
+    timer : ControllerTimer
+        The controller function, with the timings of its calls.
+    """
+    table = drag_table(config.drag_coefficient)
+    timer = ControllerTimer(controller or config.controller)
+    air_brakes = rocket.add_air_brakes(
+        drag_coefficient_curve=table.curve,
+        controller_function=timer,
+        sampling_rate=config.sampling_rate,
+        reference_area=config.reference_area,
+        override_rocket_drag=config.override_rocket_drag,
+        name="Air Brakes",
+        controller_name="Air Brakes Controller",
+    )
+    # the Function stays for plots, flights use the table
+    air_brakes.drag_coefficient.get_value_opt = table.get_value_opt
+    return air_brakes, timer
+
+
+class StochasticAirBrakes:
+    """Air brakes whose controller parameters are drawn for each sample.
+
+    Parameters
+    ----------
+    config : AirBrakesConfig
+        Air brakes, with a dataclass controller (e.g. ``ApogeeController``)
+        giving the nominal parameters.
+    dispersions : dict
+        Controller parameter -> standard deviation, (mean, standard
+        deviation) or (mean, standard deviation, "normal" or "uniform"), as
+        the arguments of rocketpy's stochastic models. For "uniform" the
+        second value is the half width.
+
+    Attributes
+    ----------
+    last_rnd_dict : dict
+        Controller parameters of the last draw.
+    """
+
+    def __init__(self, config, **dispersions):
+        names = {field.name for field in fields(config.controller)}
+        unknown = set(dispersions) - names
+        if unknown:
+            raise ValueError(f"Unknown controller parameters: {', '.join(sorted(unknown))}")
+        self.config = config
+        self.dispersions = {}
+        for name, value in dispersions.items():
+            if not isinstance(value, tuple):
+                value = (getattr(config.controller, name), value)
+            self.dispersions[name] = value if len(value) == 3 else (*value, "normal")
+        self.last_rnd_dict = {}
+
+    def create_object(self, rocket):
+        """Adds drawn air brakes to ``rocket``, see ``add_air_brakes``."""
+        drawn = {}
+        for name, (mean, spread, kind) in self.dispersions.items():
+            if kind == "uniform":
+                drawn[name] = float(np.random.uniform(mean - spread, mean + spread))
+            else:
+                drawn[name] = float(np.random.normal(mean, spread))
+        controller = replace(self.config.controller, **drawn)
+        self.last_rnd_dict = {
+            field.name: getattr(controller, field.name) for field in fields(controller)
+        }
+        return add_air_brakes(rocket, self.config, controller)
@@ -0,0 +1,210 @@
+"""Site atmospheric profiles extracted from reanalysis and ensemble NetCDF
+files.
+
+``Environment.set_atmospheric_model`` parses the whole file for a single date.
+``AtmosphericProfiles.from_netcdf`` instead reads the file once and keeps the
+profile above the launch site for every time (and ensemble member) in it, so
+any number of Environments can later be built from plain arrays.
+"""
+
+from datetime import datetime
+
+import numpy as np
+from rocketpy import Environment
+
+STANDARD_GRAVITY = 9.80665
+
+# NetCDF variable names of the files found in data/weather (ERA5 before and
+# after the 2024 CDS migration) and of the GEFS ensemble
+_VARIABLE_NAMES = {
+    "time": ("time", "valid_time"),
+    "level": ("level", "pressure_level", "isobaric"),
+    "latitude": ("latitude", "lat"),
+    "longitude": ("longitude", "lon"),
+    "member": ("number", "ens"),
+    "geopotential": ("z",),
+    "geopotential_height": ("hgtprs", "gh"),
+    "temperature": ("t", "tmpprs"),
+    "wind_u": ("u", "ugrdprs"),
+    "wind_v": ("v", "vgrdprs"),
+}
+
+
+def _find_variable(dataset, key, required=True):
+    for name in _VARIABLE_NAMES[key]:
+        if name in dataset.variables:
+            return dataset.variables[name]
+    if required:
+        raise KeyError(
+            f"None of {_VARIABLE_NAMES[key]} found in the NetCDF file variables."
+        )
+    return None
+
+
+def _bracket(grid, value):
+    """Indices and weight of the grid points around ``value``, for grids in
+    either ascending or descending order."""
+    grid = np.asarray(grid, dtype=float)
+    ascending = grid[-1] > grid[0]
+    axis = grid if ascending else grid[::-1]
+    if not axis[0] <= value <= axis[-1]:
+        raise ValueError(f"{value} is outside of the file grid [{axis[0]}, {axis[-1]}].")
+    upper = min(int(np.searchsorted(axis, value)), len(axis) - 1)
+    lower = max(upper - 1, 0)
+    weight = 0.0 if upper == lower else (value - axis[lower]) / (axis[upper] - axis[lower])
+    if not ascending:
+        lower, upper = len(grid) - 1 - lower, len(grid) - 1 - upper
+    return lower, upper, weight
+
+
+class AtmosphericProfiles:
+    """Pressure-level profiles above one site for many times.
+
+    Attributes
+    ----------
+    times : list[datetime]
+        Time of each profile.
+    members : list[int]
+        Ensemble member of each profile, 0 for reanalysis files.
+    height : numpy.ndarray
+        Geopotential height above sea level of each level, in meters, with
+        shape (n_profiles, n_levels). Levels are sorted by increasing height.
+    pressure, temperature, wind_u, wind_v : numpy.ndarray
+        Pressure (Pa), temperature (K) and east/north wind (m/s) with the same
+        shape as ``height``.
+    latitude, longitude : float
+        Site the profiles were interpolated to.
+    """
+
+    fields = ("height", "pressure", "temperature", "wind_u", "wind_v")
+
+    def __init__(self, times, members, latitude, longitude, **arrays):
+        self.times = list(times)
+        self.members = list(members)
+        self.latitude = latitude
+        self.longitude = longitude
+        for field in self.fields:
+            setattr(self, field, np.asarray(arrays[field], dtype=float))
+
+    def __len__(self):
+        return len(self.times)
+
+    @classmethod
+    def from_netcdf(cls, filename, latitude, longitude):
+        """Reads every time and ensemble member of a reanalysis or ensemble
+        NetCDF file in one pass, bilinearly interpolated to the site."""
+        import netCDF4  # pylint: disable=import-outside-toplevel
+
+        with netCDF4.Dataset(filename) as dataset:
+            time = _find_variable(dataset, "time")
+            times = netCDF4.num2date(
+                time[:], time.units, only_use_cftime_datetimes=False,
+                only_use_python_datetimes=True,
+            )
+            levels = np.asarray(_find_variable(dataset, "level")[:], dtype=float)
+            lats = np.asarray(_find_variable(dataset, "latitude")[:], dtype=float)
+            lons = np.asarray(_find_variable(dataset, "longitude")[:], dtype=float)
+            site_lon = longitude % 360 if lons.max() > 180 else longitude
+            lat0, lat1, lat_w = _bracket(lats, latitude)
+            lon0, lon1, lon_w = _bracket(lons, site_lon)
+
+            def site_values(variable):
+                # (time, [member,] level, lat, lon) -> (time, member, level)
+                lat_slice = slice(min(lat0, lat1), max(lat0, lat1) + 1)
+                lon_slice = slice(min(lon0, lon1), max(lon0, lon1) + 1)
+                data = np.ma.filled(variable[..., lat_slice, lon_slice], np.nan)
+                data = data[..., [lat0 - lat_slice.start, lat1 - lat_slice.start], :]
+                data = data[..., [lon0 - lon_slice.start, lon1 - lon_slice.start]]
+                if data.ndim == 4:
+                    data = data[:, np.newaxis]
+                south_north = data[..., 0] * (1 - lon_w) + data[..., 1] * lon_w
+                return south_north[..., 0] * (1 - lat_w) + south_north[..., 1] * lat_w
+
+            geopotential = _find_variable(dataset, "geopotential", required=False)
+            if geopotential is not None:
+                height = site_values(geopotential) / STANDARD_GRAVITY
+            else:
+                height = site_values(_find_variable(dataset, "geopotential_height"))
+            temperature = site_values(_find_variable(dataset, "temperature"))
+            wind_u = site_values(_find_variable(dataset, "wind_u"))
+            wind_v = site_values(_find_variable(dataset, "wind_v"))
+
+        n_times, n_members, n_levels = height.shape
+        # pressure levels are given in hPa
+        pressure = np.broadcast_to(levels * 100, height.shape)
+        order = np.argsort(height, axis=-1)
+
+        def flat(array):
+            return np.take_along_axis(array, order, axis=-1).reshape(-1, n_levels)
+
+        return cls(
+            times=[t for t in times for _ in range(n_members)],
+            members=[m for _ in range(n_times) for m in range(n_members)],
+            latitude=latitude,
+            longitude=longitude,
+            height=flat(height),
+            pressure=flat(pressure),
+            temperature=flat(temperature),
+            wind_u=flat(wind_u),
+            wind_v=flat(wind_v),
+        )
+
+    def select(self, start=None, end=None, hours=None, member=None):
+        """Indices of the profiles between the ``start`` and ``end`` dates
+        (inclusive), at the given hours of day and ensemble member."""
+        indices = []
+        for index, (time, profile_member) in enumerate(zip(self.times, self.members)):
+            if start is not None and time < start:
+                continue
+            if end is not None and time > end:
+                continue
+            if hours is not None and time.hour not in hours:
+                continue
+            if member is not None and profile_member != member:
+                continue
+            indices.append(index)
+        return indices
+
+    def environment(
+        self, index, elevation, wind_factor_x=1.0, wind_factor_y=1.0, date=None
+    ):
+        """Builds a custom atmosphere Environment from profile ``index``.
+
+        Parameters
+        ----------
+        index : int
+            Profile index.
+        elevation : float
+            Launch site elevation above sea level, in meters.
+        wind_factor_x, wind_factor_y : float, optional
+            Factors multiplying the east and north wind components.
+        date : datetime, optional
+            Environment date, defaults to the profile time.
+
+        Returns
+        -------
+        Environment
+        """
+        date = date or self.times[index]
+        env = Environment(
+            date=(date.year, date.month, date.day, date.hour),
+            latitude=self.latitude,
+            longitude=self.longitude,
+            elevation=elevation,
+        )
+        height = self.height[index]
+        env.set_atmospheric_model(
+            type="custom_atmosphere",
+            pressure=np.column_stack([height, self.pressure[index]]),
+            temperature=np.column_stack([height, self.temperature[index]]),
+            wind_u=np.column_stack([height, wind_factor_x * self.wind_u[index]]),
+            wind_v=np.column_stack([height, wind_factor_y * self.wind_v[index]]),
+        )
+        return env
+
+    def label(self, index):
+        """Readable name of profile ``index``."""
+        label = datetime.strftime(self.times[index], "%Y-%m-%d %H:%M")
+        if any(self.members):
+            label += f" member {self.members[index]}"
+        return label
@@ -0,0 +1,417 @@
+"""Vectorized point-mass integration of many dispersed flights at once.
+
+The samples of a dispersion mostly differ by a few scalars (mass, rail
+inclination and heading, impulse, drag and parachute factors, wind factors).
+``BatchFlight`` advances all of them together with fixed step RK4 on NumPy
+state arrays of shape (n_samples, 9), through the rail, powered, coast and
+parachute phases, instead of integrating one ``rocketpy.Flight`` at a time.
+
+The model is a point mass with a body axis. Thrust acts along the body axis
+and drag against the relative wind. Off the rail the body axis turns towards
+the relative wind at a rate proportional to the air speed, set by the static
+margin, lift slope and pitch inertia of the rocket (weathercocking without
+overshoot). Under parachute it follows ``Flight.u_dot_parachute``. For stable
+rockets the apogee above ground level agrees with the 6 DOF ``Flight`` to
+within 0.1 % and the landing point to within 30 m, which the
+``batch_validation`` benchmark checks; use ``Flight`` for anything that depends
+on the attitude dynamics. ``campaign.run_batch`` flies a ``MonteCarlo``
+campaign with it.
+"""
+
+import numpy as np
+
+# constants of Flight.u_dot_parachute
+_PARACHUTE_ADDED_MASS_COEFFICIENT = 1
+_PARACHUTE_RADIUS = 1.5
+_PARACHUTE_GRAVITY = 9.8
+
+
+def _table(function, grid):
+    """Values of a rocketpy Function on ``grid``, for ``np.interp``."""
+    return np.asarray(function.get_value(grid), dtype=float)
+
+
+class BatchFlight:
+    """Simulates many dispersed flights of one rocket in one environment.
+
+    Parameters broadcast against each other, so any of them can be a scalar
+    or an array of one value per sample. The flights are integrated when the
+    object is created, as with ``rocketpy.Flight``.
+
+    Parameters
+    ----------
+    rocket : Rocket
+        Nominal rocket, with motor and parachutes. Parachute triggers must be
+        "apogee" or a height above ground level.
+    environment : Environment
+        Nominal environment.
+    rail_length : float
+        Launch rail length, in meters.
+    inclination, heading : float or array
+        Rail inclination and heading, in degrees.
+    mass_offset : float or array, optional
+        Added to the rocket mass, in kg. Default is 0.
+    impulse_factor : float or array, optional
+        Multiplies the thrust curve. Default is 1.
+    drag_factor : float or array, optional
+        Multiplies the power off drag curve, and the power on one unless
+        ``power_on_drag_factor`` is given. Default is 1.
+    power_on_drag_factor : float or array, optional
+        Multiplies the power on drag curve. Defaults to ``drag_factor``.
+    parachute_cd_s_factor : float or array, optional
+        Multiplies the drag area of all parachutes. Default is 1.
+    wind_factor_x, wind_factor_y : float or array, optional
+        Multiply the east and north wind profiles. Default is 1.
+    time_step : float, optional
+        Step until all flights are under an inflated parachute, in seconds.
+        Default is 0.01.
+    descent_time_step : float, optional
+        Step once all flights are under parachute, in seconds. Default is
+        0.1.
+    max_time : float, optional
+        Flights still in the air at this time are stopped. Default is 600.
+
+    Attributes
+    ----------
+    n : int
+        Number of samples.
+    apogee, apogee_time : numpy.ndarray
+        Apogee altitude above sea level (m) and time (s).
+    apogee_x, apogee_y : numpy.ndarray
+        Apogee position east and north of the rail, in meters.
+    out_of_rail_time, out_of_rail_velocity : numpy.ndarray
+        Time (s) and speed (m/s) at which the rocket leaves the rail.
+    x_impact, y_impact, t_final, impact_velocity : numpy.ndarray
+        Landing position east and north of the rail (m), time (s) and
+        vertical speed (m/s). NaN for flights stopped by ``max_time``.
+    max_speed : numpy.ndarray
+        Maximum speed of each flight, in m/s.
+    steps : int
+        Number of RK4 steps taken.
+    """
+
+    def __init__(
+        self,
+        rocket,
+        environment,
+        rail_length,
+        inclination,
+        heading,
+        mass_offset=0.0,
+        impulse_factor=1.0,
+        drag_factor=1.0,
+        parachute_cd_s_factor=1.0,
+        wind_factor_x=1.0,
+        wind_factor_y=1.0,
+        power_on_drag_factor=None,
+        time_step=0.01,
+        descent_time_step=0.1,
+        max_time=600.0,
+    ):
+        (
+            inclination,
+            heading,
+            self.mass_offset,
+            self.impulse_factor,
+            self.drag_factor,
+            self.parachute_cd_s_factor,
+            self.wind_factor_x,
+            self.wind_factor_y,
+            self.power_on_drag_factor,
+        ) = np.broadcast_arrays(
+            *[
+                np.atleast_1d(np.asarray(value, dtype=float))
+                for value in (
+                    inclination,
+                    heading,
+                    mass_offset,
+                    impulse_factor,
+                    drag_factor,
+                    parachute_cd_s_factor,
+                    wind_factor_x,
+                    wind_factor_y,
+                    drag_factor if power_on_drag_factor is None else power_on_drag_factor,
+                )
+            ]
+        )
+        self.rocket = rocket
+        self.env = environment
+        self.inclination = inclination
+        self.heading = heading
+        self.n = len(inclination)
+        self.time_step = time_step
+        self.descent_time_step = descent_time_step
+        self.max_time = max_time
+
+        self.__tabulate(rail_length)
+        self.__simulate()
+
+    def __tabulate(self, rail_length):
+        """Samples every Function the derivatives need on fixed grids."""
+        rocket, env = self.rocket, self.env
+        self.burn_out_time = rocket.motor.burn_out_time
+        self._time_grid = np.linspace(0, self.burn_out_time, 2001)
+        self._thrust = _table(rocket.motor.thrust, self._time_grid)
+        self._mass = _table(rocket.total_mass, self._time_grid)
+        self.dry_mass = rocket.dry_mass
+
+        self._mach_grid = np.linspace(0, 5, 1001)
+        self._power_on_drag = _table(rocket.power_on_drag, self._mach_grid)
+        self._power_off_drag = _table(rocket.power_off_drag, self._mach_grid)
+        self.area = rocket.area
+        # the body axis turns towards the relative wind with a time constant of
+        # weathercock_length / air speed, the inverse of the pitch natural
+        # frequency of the rocket at sea level density
+        margin = rocket.static_margin(0) * 2 * rocket.radius
+        lift_slope = rocket.total_lift_coeff_der.get_value_opt(0.3)
+        self.weathercock_length = np.sqrt(
+            2 * rocket.I_22(0) / (1.225 * self.area * lift_slope * max(margin, 1e-3))
+        )
+
+        self._height_grid = np.arange(
+            env.elevation - 100, env.max_expected_height, 5.0
+        )
+        self._density = _table(env.density, self._height_grid)
+        self._speed_of_sound = _table(env.speed_of_sound, self._height_grid)
+        self._gravity = _table(env.gravity, self._height_grid)
+        self._wind_x = _table(env.wind_velocity_x, self._height_grid)
+        self._wind_y = _table(env.wind_velocity_y, self._height_grid)
+
+        # parachutes in the order they were added, as Flight checks them
+        self._parachutes = []
+        for parachute in rocket.parachutes:
+            trigger = parachute.trigger
+            if isinstance(trigger, str) and trigger.lower() == "apogee":
+                trigger = None
+            elif not isinstance(trigger, (int, float)):
+                raise ValueError(
+                    f"Parachute '{parachute.name}' has a {type(trigger).__name__} "
+                    "trigger. BatchFlight only supports 'apogee' and height triggers."
+                )
+            self._parachutes.append((trigger, parachute.cd_s, parachute.lag))
+
+        # same definition as Flight.effective_1rl
+        try:
+            buttons = rocket.rail_buttons[0]
+            upper_button = (
+                buttons.component.buttons_distance * rocket._csys
+                + buttons.position.z
+            )
+        except IndexError:
+            upper_button = rocket.nozzle_position
+        self.effective_rail_length = rail_length - abs(
+            rocket.nozzle_position - upper_button
+        )
+        inclination = np.radians(self.inclination)
+        heading = np.radians(self.heading)
+        self.rail_direction = np.column_stack(
+            [
+                np.sin(heading) * np.cos(inclination),
+                np.cos(heading) * np.cos(inclination),
+                np.sin(inclination),
+            ]
+        )
+
+    def __atmosphere(self, z):
+        grid = self._height_grid
+        return (
+            np.interp(z, grid, self._density),
+            np.interp(z, grid, self._speed_of_sound),
+            np.interp(z, grid, self._gravity),
+            np.interp(z, grid, self._wind_x) * self.wind_factor_x,
+            np.interp(z, grid, self._wind_y) * self.wind_factor_y,
+        )
+
+    def __derivative(self, t, state, on_rail, cd_s):
+        """Time derivative of the (n, 9) state of positions, velocities and
+        body axes. ``cd_s`` is the drag area of the inflated parachute of each
+        sample, 0 before inflation."""
+        z, velocity, axis = state[:, 2], state[:, 3:6], state[:, 6:]
+        rho, speed_of_sound, gravity, wind_x, wind_y = self.__atmosphere(z)
+        air_velocity = velocity - np.column_stack([wind_x, wind_y, np.zeros_like(z)])
+        air_speed = np.linalg.norm(air_velocity, axis=1)
+
+        burning = t < self.burn_out_time
+        mach = air_speed / speed_of_sound
+        if burning:
+            drag_curve, drag_factor = self._power_on_drag, self.power_on_drag_factor
+        else:
+            drag_curve, drag_factor = self._power_off_drag, self.drag_factor
+        drag_coefficient = np.interp(mach, self._mach_grid, drag_curve) * drag_factor
+        drag = 0.5 * rho * air_speed**2 * self.area * drag_coefficient
+        thrust = np.interp(t, self._time_grid, self._thrust, right=0.0) * self.impulse_factor
+        mass = np.interp(t, self._time_grid, self._mass) + self.mass_offset
+
+        # powered and coasting flight
+        air_direction = air_velocity / np.maximum(air_speed, 1e-9)[:, None]
+        acceleration = (thrust / mass)[:, None] * axis - (drag / mass)[:, None] * air_direction
+        acceleration[:, 2] -= gravity
+        alignment = np.sum(air_direction * axis, axis=1)
+        axis_rate = (air_speed / self.weathercock_length)[:, None] * (
+            air_direction - alignment[:, None] * axis
+        )
+        axis_rate[on_rail] = 0
+
+        # the rocket stays on the rail until thrust overcomes its weight
+        rail_acceleration = (thrust - drag) / mass - gravity * self.rail_direction[:, 2]
+        acceleration[on_rail] = (
+            np.maximum(rail_acceleration, 0)[:, None] * self.rail_direction
+        )[on_rail]
+
+        # under parachute, as in Flight.u_dot_parachute
+        descending = cd_s > 0
+        if descending.any():
+            dry_mass = self.dry_mass + self.mass_offset
+            added_mass = (
+                _PARACHUTE_ADDED_MASS_COEFFICIENT
+                * rho
+                * (4 / 3)
+                * np.pi
+                * _PARACHUTE_RADIUS**3
+            )
+            pseudo_drag = -0.5 * rho * cd_s * air_speed
+            parachute = (pseudo_drag[:, None] * air_velocity) / (dry_mass + added_mass)[
+                :, None
+            ]
+            parachute[:, 2] -= _PARACHUTE_GRAVITY * dry_mass / (dry_mass + added_mass)
+            acceleration[descending] = parachute[descending]
+            axis_rate[descending] = 0
+
+        return np.hstack([velocity, acceleration, axis_rate])
+
+    def __simulate(self):
+        n = self.n
+        state = np.zeros((n, 9))
+        state[:, 2] = self.env.elevation
+        state[:, 6:] = self.rail_direction
+        active = np.ones(n, dtype=bool)
+        on_rail = np.ones(n, dtype=bool)
+        cd_s = np.zeros(n)
+        triggered = np.zeros((len(self._parachutes), n), dtype=bool)
+        inflation_time = np.full((len(self._parachutes), n), np.inf)
+
+        self.apogee = np.full(n, self.env.elevation, dtype=float)
+        self.apogee_time = np.zeros(n)
+        self.apogee_x = np.zeros(n)
+        self.apogee_y = np.zeros(n)
+        self.out_of_rail_time = np.full(n, np.nan)
+        self.out_of_rail_velocity = np.full(n, np.nan)
+        self.x_impact = np.full(n, np.nan)
+        self.y_impact = np.full(n, np.nan)
+        self.t_final = np.full(n, np.nan)
+        self.impact_velocity = np.full(n, np.nan)
+        self.max_speed = np.zeros(n)
+
+        t, steps = 0.0, 0
+        apogee_reached = np.zeros(n, dtype=bool)
+        while active.any() and t < self.max_time:
+            descent = (cd_s[active] > 0).all()
+            dt = self.descent_time_step if descent else self.time_step
+            if t < self.burn_out_time:
+                # land on the burn out, where the thrust and drag curves jump
+                dt = min(dt, self.burn_out_time - t)
+
+            k1 = self.__derivative(t, state, on_rail, cd_s)
+            k2 = self.__derivative(t + dt / 2, state + dt / 2 * k1, on_rail, cd_s)
+            k3 = self.__derivative(t + dt / 2, state + dt / 2 * k2, on_rail, cd_s)
+            k4 = self.__derivative(t + dt, state + dt * k3, on_rail, cd_s)
+            new_state = state + dt / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+            new_state[:, 6:] /= np.linalg.norm(new_state[:, 6:], axis=1)[:, None]
+            new_state[~active] = state[~active]
+            previous, state = state, new_state
+            t += dt
+            steps += 1
+            speed = np.linalg.norm(state[:, 3:6], axis=1)
+            self.max_speed = np.maximum(self.max_speed, speed)
+
+            # rail exit, interpolated on the distance travelled along the rail
+            rail_distance = np.linalg.norm(
+                state[:, :3] - [0, 0, self.env.elevation], axis=1
+            )
+            leaving = on_rail & (rail_distance >= self.effective_rail_length)
+            if leaving.any():
+                previous_distance = np.linalg.norm(
+                    previous[leaving, :3] - [0, 0, self.env.elevation], axis=1
+                )
+                fraction = (self.effective_rail_length - previous_distance) / (
+                    rail_distance[leaving] - previous_distance
+                )
+                previous_speed = np.linalg.norm(previous[leaving, 3:6], axis=1)
+                self.out_of_rail_time[leaving] = t - dt + fraction * dt
+                self.out_of_rail_velocity[leaving] = previous_speed + fraction * (
+                    speed[leaving] - previous_speed
+                )
+                on_rail &= ~leaving
+
+            # apogee, from the vertical speed sign change
+            peaking = active & ~on_rail & ~apogee_reached & (state[:, 5] <= 0)
+            if peaking.any():
+                vz0, vz1 = previous[peaking, 5], state[peaking, 5]
+                fraction = vz0 / np.maximum(vz0 - vz1, 1e-12)
+                self.apogee[peaking] = previous[peaking, 2] + 0.5 * vz0 * fraction * dt
+                self.apogee_time[peaking] = t - dt + fraction * dt
+                self.apogee_x[peaking] = previous[peaking, 0] + fraction * (
+                    state[peaking, 0] - previous[peaking, 0]
+                )
+                self.apogee_y[peaking] = previous[peaking, 1] + fraction * (
+                    state[peaking, 1] - previous[peaking, 1]
+                )
+                apogee_reached |= peaking
+
+            # parachute triggers, checked while descending
+            height = state[:, 2] - self.env.elevation
+            for index, (trigger, parachute_cd_s, lag) in enumerate(self._parachutes):
+                triggering = active & apogee_reached & ~triggered[index]
+                if trigger is not None:
+                    triggering &= height < trigger
+                if triggering.any():
+                    triggered[index] |= triggering
+                    inflation_time[index, triggering] = t + lag
+            inflated = inflation_time <= t
+            if inflated.any():
+                # the last inflated parachute replaces the previous one
+                latest = np.where(inflated, inflation_time, -np.inf).argmax(axis=0)
+                parachute_cd_s = np.array([cd for _, cd, _ in self._parachutes])
+                cd_s = np.where(
+                    inflated.any(axis=0),
+                    parachute_cd_s[latest] * self.parachute_cd_s_factor,
+                    0.0,
+                )
+
+            # landing, interpolated on the height above ground level
+            landing = active & ~on_rail & (height <= 0) & (state[:, 5] < 0)
+            if landing.any():
+                h0 = previous[landing, 2] - self.env.elevation
+                fraction = h0 / np.maximum(h0 - height[landing], 1e-12)
+                self.x_impact[landing] = previous[landing, 0] + fraction * (
+                    state[landing, 0] - previous[landing, 0]
+                )
+                self.y_impact[landing] = previous[landing, 1] + fraction * (
+                    state[landing, 1] - previous[landing, 1]
+                )
+                self.t_final[landing] = t - dt + fraction * dt
+                self.impact_velocity[landing] = state[landing, 5]
+                active &= ~landing
+        self.steps = steps
+
+    @property
+    def drift(self):
+        """Horizontal distance from the rail to the landing point, in m."""
+        return np.hypot(self.x_impact, self.y_impact)
+
+    def results(self):
+        """Per sample outputs as a dictionary of arrays, with the names of the
+        ``MonteCarlo`` export list where they exist."""
+        return {
+            "apogee": self.apogee,
+            "apogee_time": self.apogee_time,
+            "apogee_x": self.apogee_x,
+            "apogee_y": self.apogee_y,
+            "out_of_rail_time": self.out_of_rail_time,
+            "out_of_rail_velocity": self.out_of_rail_velocity,
+            "max_speed": self.max_speed,
+            "x_impact": self.x_impact,
+            "y_impact": self.y_impact,
+            "t_final": self.t_final,
+            "impact_velocity": self.impact_velocity,
+        }
@@ -0,0 +1,364 @@
+"""Drag curve calibration against recorded flights.
+
+sim.py flies the power off and power on drag curves as given. A
+``DragCalibration`` fits the scale factors of both curves (the
+``power_off_drag_factor`` and ``power_on_drag_factor`` of the Monte Carlo
+inputs) to the altitude, and acceleration where recorded, of a measured
+ascent. Candidate factors are flown in parallel batches (see
+``parallel.parallel_map``) on a grid that is narrowed around the best
+candidate after every batch. Each trial flight ends at apogee, or as soon as
+it leaves the measured apogee window: a controller stops it when it climbs
+past the measured apogee or is still climbing after the measured apogee time,
+so too draggy and too slick candidates cost only part of an ascent.
+
+``RECORDS`` lists the recorded flights of the data folder with the drag
+curves flown for them. The vehicle flown against a record must be the one
+that made it (mass, motor, geometry), e.g. a ``VehicleConfig`` with the
+record's drag curves (``with_record_drag``).
+
+Usage, from the repository root::
+
+    python -m GBDP2024.calibration Hybrid --motor Solid --record camoes
+"""
+
+import argparse
+import csv
+import warnings
+from dataclasses import dataclass, replace
+
+import numpy as np
+from rocketpy import Environment, Flight
+from rocketpy.control.controller import _Controller
+
+from .config import build_rocket, data_path
+from .parallel import parallel_map, worker_state
+
+FACTORS = ("power_off_drag_factor", "power_on_drag_factor")
+
+
+@dataclass(frozen=True)
+class FlightRecord:
+    """Recorded flight: a CSV file with a header, its time and altitude
+    above ground (m) columns and optionally its vertical acceleration
+    (m/s^2) column, and the drag curves simulated for it."""
+
+    filename: str
+    time: str
+    altitude: str
+    power_off_drag: str
+    power_on_drag: str
+    acceleration: str = None
+
+    def load(self):
+        """Ascent of the record, from liftoff (t >= 0) to apogee.
+
+        Returns
+        -------
+        dict
+            "time", "altitude" and, if recorded, "acceleration" arrays.
+        """
+        with open(data_path(self.filename), "r", encoding="utf-8") as file:
+            reader = csv.reader(file)
+            header = [name.strip() for name in next(reader)]
+            rows = np.array([[float(value) for value in row] for row in reader if row])
+        columns = {"time": rows[:, header.index(self.time)]}
+        columns["altitude"] = rows[:, header.index(self.altitude)]
+        if self.acceleration:
+            columns["acceleration"] = rows[:, header.index(self.acceleration)]
+        ascent = (columns["time"] >= 0) & (columns["time"] <= columns["time"][np.argmax(columns["altitude"])])
+        return {name: values[ascent] for name, values in columns.items()}
+
+
+RECORDS = {
+    "andromeda": FlightRecord(
+        "rockets/andromeda/flight_data.csv", time="t(s)", altitude="alt(m)",
+        power_off_drag="rockets/andromeda/drag_coefficient.csv",
+        power_on_drag="rockets/andromeda/drag_coefficient.csv",
+    ),
+    "erebus11": FlightRecord(
+        "rockets/erebus11/flight_data_filtered.csv", time="t", altitude="alt",
+        power_off_drag="rockets/erebus11/drag_curve.csv",
+        power_on_drag="rockets/erebus11/drag_curve.csv",
+    ),
+    "camoes": FlightRecord(
+        "rockets/camoes/flight_data.csv", time="ts", altitude="filtered_altitude_AGL",
+        acceleration="filtered_acceleration",
+        power_off_drag="rockets/camoes/drag_coefficient_power_off.csv",
+        power_on_drag="rockets/camoes/drag_coefficient_power_on.csv",
+    ),
+}
+
+
+def with_record_drag(config, record):
+    """``VehicleConfig`` flying the drag curves of ``record``."""
+    rocket = replace(
+        config.rocket, power_off_drag=record.power_off_drag, power_on_drag=record.power_on_drag
+    )
+    return replace(config, rocket=rocket)
+
+
+class _Diverged(Exception):
+    """Raised by the window controller to stop a trial flight. Holds the
+    solution flown so far."""
+
+    def __init__(self, solution):
+        super().__init__("left the measured apogee window")
+        self.solution = solution
+
+
+def _window_controller(elevation, apogee, apogee_time, window):
+    """Controller function stopping a flight that climbs above
+    ``apogee * (1 + window)`` or past ``apogee_time * (1 + window)``."""
+    ceiling = elevation + apogee * (1 + window)
+    deadline = apogee_time * (1 + window)
+
+    # pylint: disable=unused-argument,too-many-arguments
+    def control(time, sampling_rate, state, state_history, observed_variables, objects, sensors):
+        if state[2] > ceiling or (time > deadline and state[5] > 0):
+            raise _Diverged(np.array(state_history, dtype=float))
+
+    return control
+
+
+def fit_error(solution, elevation, measured, acceleration_weight=1.0):
+    """Normalized error of a flown ascent against the measured one.
+
+    Altitudes are compared at the measured times, a flight that ended (at
+    its apogee, or stopped out of the window) keeping its last altitude. The
+    RMS altitude error is divided by the measured apogee and, with a
+    recorded acceleration, the RMS vertical acceleration error divided by
+    the measured peak is added with ``acceleration_weight``.
+    """
+    time, altitude, vertical_speed = solution[:, 0], solution[:, 3] - elevation, solution[:, 6]
+    error = np.sqrt(np.mean((np.interp(measured["time"], time, altitude) - measured["altitude"]) ** 2))
+    error /= measured["altitude"].max()
+    if "acceleration" in measured and acceleration_weight:
+        acceleration = np.gradient(vertical_speed, time)
+        flown = measured["time"] <= time[-1]
+        simulated = np.interp(measured["time"][flown], time, acceleration)
+        error += acceleration_weight * np.sqrt(
+            np.mean((simulated - measured["acceleration"][flown]) ** 2)
+        ) / np.abs(measured["acceleration"]).max()
+    return float(error)
+
+
+def _trial(factors):
+    """Worker: flies one candidate (power off, power on factors)."""
+    state = worker_state()
+    environment, measured = state["environment"], state["measured"]
+    try:
+        rocket, _ = build_rocket(state["config"].rocket)
+        rocket.power_off_drag *= factors[0]
+        rocket.power_on_drag *= factors[1]
+        rocket._add_controllers(  # pylint: disable=protected-access
+            _Controller(
+                [],
+                _window_controller(
+                    environment.elevation,
+                    measured["altitude"].max(),
+                    measured["time"][-1],
+                    state["window"],
+                ),
+                sampling_rate=state["sampling_rate"],
+                name="apogee window",
+            )
+        )
+        diverged = False
+        try:
+            with warnings.catch_warnings():
+                # controllers turn time_overshoot off, as intended here
+                warnings.filterwarnings("ignore", "time_overshoot", UserWarning)
+                flight = Flight(
+                    rocket=rocket,
+                    environment=environment,
+                    rail_length=state["config"].rail_length,
+                    inclination=state["config"].inclination,
+                    heading=state["config"].heading,
+                    terminate_on_apogee=True,
+                    verbose=False,
+                )
+            solution = np.array(flight.solution, dtype=float)
+        except _Diverged as stop:
+            solution, diverged = stop.solution, True
+        return {
+            FACTORS[0]: float(factors[0]),
+            FACTORS[1]: float(factors[1]),
+            "error": fit_error(
+                solution, environment.elevation, measured, state["acceleration_weight"]
+            ),
+            "apogee": float(solution[:, 3].max() - environment.elevation),
+            "flight_time": float(solution[-1, 0]),
+            "diverged": diverged,
+        }
+    except Exception as error:  # pylint: disable=broad-except
+        return {
+            FACTORS[0]: float(factors[0]),
+            FACTORS[1]: float(factors[1]),
+            "error": np.inf,
+            "failure": f"{type(error).__name__}: {error}",
+        }
+
+
+class DragCalibration:
+    """Fits the drag curve factors of a vehicle to a recorded ascent.
+
+    Parameters
+    ----------
+    config : VehicleConfig
+        Vehicle that flew the record, with the drag curves to calibrate.
+    record : FlightRecord or str
+        Recorded flight, or a key of ``RECORDS``.
+    environment : Environment, optional
+        Atmosphere of the recorded flight. Defaults to the standard
+        atmosphere at the vehicle's site, without wind.
+    window : float, optional
+        Relative margin of the apogee window: trial flights climbing above
+        the measured apogee, or past the measured apogee time, by more than
+        this fraction are stopped.
+    acceleration_weight : float, optional
+        Weight of the acceleration error, see ``fit_error``.
+    tied : bool, optional
+        Fit one factor for both curves, e.g. when the record has a single
+        drag curve.
+    workers : int, optional
+        Worker processes, defaults to all cores.
+    sampling_rate : float, optional
+        Rate (Hz) at which trial flights are checked against the window.
+    """
+
+    def __init__(
+        self,
+        config,
+        record,
+        environment=None,
+        window=0.1,
+        acceleration_weight=1.0,
+        tied=False,
+        workers=None,
+        sampling_rate=10,
+    ):
+        self.config = config
+        self.record = RECORDS[record] if isinstance(record, str) else record
+        self.measured = self.record.load()
+        if environment is None:
+            site = config.site
+            environment = Environment(
+                latitude=site.latitude, longitude=site.longitude, elevation=site.elevation
+            )
+        self.environment = environment
+        self.window = window
+        self.acceleration_weight = acceleration_weight
+        self.tied = tied
+        self.workers = workers
+        self.sampling_rate = sampling_rate
+        self.trials = []
+
+    def evaluate(self, candidates):
+        """Flies (power off, power on) factor pairs as one parallel batch.
+        Returns their trial results, also added to ``trials``. Pairs flown
+        before are not flown again."""
+        flown = {(trial[FACTORS[0]], trial[FACTORS[1]]): trial for trial in self.trials}
+        candidates = [tuple(float(value) for value in candidate) for candidate in candidates]
+        new = list(dict.fromkeys(candidate for candidate in candidates if candidate not in flown))
+        state = {
+            "config": self.config,
+            "environment": self.environment,
+            "measured": self.measured,
+            "window": self.window,
+            "acceleration_weight": self.acceleration_weight,
+            "sampling_rate": self.sampling_rate,
+        }
+        results = parallel_map(_trial, new, state=state, workers=self.workers)
+        self.trials.extend(results)
+        flown.update(zip(new, results))
+        return [flown[candidate] for candidate in candidates]
+
+    def run(self, bounds=(0.5, 1.5), points=5, rounds=4, shrink=0.4):
+        """Grid search, narrowed around the best candidate after each batch.
+
+        Parameters
+        ----------
+        bounds : tuple[float, float], optional
+            Initial range of both factors.
+        points : int, optional
+            Grid points per factor; a batch has ``points`` candidates with
+            ``tied``, ``points ** 2`` otherwise.
+        rounds : int, optional
+            Number of batches.
+        shrink : float, optional
+            Each new range is this fraction of the previous one, centered on
+            the best candidate.
+
+        Returns
+        -------
+        dict
+            Best trial: factors, "error", "apogee", ...
+        """
+        low, high = np.array([bounds[0]] * 2, dtype=float), np.array([bounds[1]] * 2, dtype=float)
+        best = None
+        for batch in range(rounds):
+            axes = [np.linspace(low[i], high[i], points) for i in range(2)]
+            if self.tied:
+                candidates = [(value, value) for value in axes[0]]
+            else:
+                candidates = [(off, on) for off in axes[0] for on in axes[1]]
+            results = self.evaluate(candidates)
+            best = min([best, *results] if best else results, key=lambda trial: trial["error"])
+            center = np.array([best[FACTORS[0]], best[FACTORS[1]]])
+            half = (high - low) * shrink / 2
+            low, high = np.maximum(center - half, 1e-3), center + half
+            stopped = sum(trial.get("diverged", False) for trial in results)
+            print(
+                f"Batch {batch + 1}/{rounds}: best error {best['error']:.4f} at "
+                f"{best[FACTORS[0]]:.3f}/{best[FACTORS[1]]:.3f}, {stopped} of "
+                f"{len(results)} trials stopped out of the window"
+            )
+        return best
+
+    def print_summary(self, best=None):
+        """Prints the trials sorted by error (the ten best) and the measured
+        apogee."""
+        trials = sorted(self.trials, key=lambda trial: trial["error"])
+        print(
+            f"{len(trials)} trials, measured apogee {self.measured['altitude'].max():.1f} m "
+            f"at {self.measured['time'][-1]:.2f} s"
+        )
+        print(f"{'power off':>10} {'power on':>10} {'error':>10} {'apogee':>10} {'stopped':>8}")
+        for trial in ([best] if best else []) + trials[:10]:
+            print(
+                f"{trial[FACTORS[0]]:>10.3f} {trial[FACTORS[1]]:>10.3f} {trial['error']:>10.4f} "
+                f"{trial.get('apogee', np.nan):>10.1f} {str(trial.get('diverged', '-')):>8}"
+            )
+
+
+def main():
+    # pylint: disable=import-outside-toplevel
+    from .vehicles import VEHICLES
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("vehicle", choices=sorted(VEHICLES))
+    parser.add_argument("--motor", help="motor option of the vehicle, e.g. Solid")
+    parser.add_argument("--record", choices=sorted(RECORDS), required=True)
+    parser.add_argument(
+        "--record-drag", action="store_true", help="fly the drag curves of the record"
+    )
+    parser.add_argument("--tied", action="store_true", help="one factor for both curves")
+    parser.add_argument("--points", type=int, default=5)
+    parser.add_argument("--rounds", type=int, default=4)
+    parser.add_argument("--window", type=float, default=0.1)
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+
+    config = VEHICLES[args.vehicle].with_motor(args.motor)
+    if args.record_drag:
+        config = with_record_drag(config, RECORDS[args.record])
+    calibration = DragCalibration(
+        config, args.record, window=args.window, tied=args.tied, workers=args.workers
+    )
+    best = calibration.run(points=args.points, rounds=args.rounds)
+    calibration.print_summary()
+    print(f"{FACTORS[0]} = {best[FACTORS[0]]:.3f}, {FACTORS[1]} = {best[FACTORS[1]]:.3f}")
+
+
+if __name__ == "__main__":
+    main()
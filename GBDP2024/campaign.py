@@ -0,0 +1,956 @@
+"""Parallel execution of ``rocketpy.MonteCarlo`` campaigns.
+
+``MonteCarlo.simulate`` flies the samples one after the other and stops at the
+first exception. ``run_parallel`` flies them in forked worker processes (see
+``parallel.parallel_imap``) that inherit the stochastic models, so with a
+``SharedStochasticEnvironment`` the environment profiles are never pickled.
+Each sample is written as soon as it and the ones before it are done, and the
+inputs, outputs and errors files keep the ``MonteCarlo`` format and sample
+order, so ``MonteCarlo.results`` and the results scripts are unchanged. Lines
+of the errors file also hold the sample index and where the sample failed,
+see ``triage``. For recovery studies, ``descents`` branches several descents
+from the apogee state of each ascent instead of flying every sample from the
+rail. Air brakes, which ``StochasticRocket`` leaves out, are added to every
+sample with ``air_brakes``. ``distributed.run_distributed`` flies the samples
+on the workers of a job queue instead, and writes them the same way. With a
+``memory_budget`` nothing grows with the number of samples in memory: the
+flight time series and sample profiles are spilled to disk as they arrive,
+failures are only counted, and the peak memory of the workers is checked
+against the budget. ``run_batch`` flies the main scalars of each sample with
+the vectorized point-mass ``BatchFlight`` instead, to the same files.
+"""
+
+import json
+import os
+import random
+import socket
+from itertools import chain
+from time import perf_counter, process_time, time
+
+import numpy as np
+from rocketpy import Flight, MonteCarlo, Rocket
+from rocketpy._encoders import RocketPyEncoder
+
+from .air_brakes import add_air_brakes, ode_solver
+from .batch_flight import BatchFlight
+from .config import AirBrakesConfig
+from .parallel import default_workers, parallel_imap, worker_state
+from .payload import fly_payload, payload_outputs
+from .profiling import Profiler, current_rss_mb, peak_rss_mb
+from .stability import draw_rocket, static_margins
+from .terrain import land
+from .triage import failure_phase
+
+PRECHECK_CHUNK = 1000
+
+# results waiting to be written per worker with a memory budget, and the
+# results between two checks of the budget
+MEMORY_WINDOW = 4
+MEMORY_CHECK = 100
+
+# outputs of a descent branch that come from its descent, the others are the
+# ones of its ascent
+DESCENT_OUTPUTS = ("t_final", "x_impact", "y_impact", "z_impact", "impact_velocity")
+
+
+def _seed(entropy, index, branch=None):
+    """Seeds the global generators used by the stochastic models, so sample
+    ``index`` (or descent ``branch`` of ascent ``index``) draws the same
+    inputs whatever worker flies it."""
+    key = (index,) if branch is None else (index, branch)
+    sequence = np.random.SeedSequence(entropy, spawn_key=key)
+    np.random.seed(sequence.generate_state(4))
+    random.seed(int(sequence.generate_state(1)[0]))
+
+
+class DeferredMonteCarlo(MonteCarlo):
+    """``MonteCarlo`` that does not read its inputs, outputs and errors files
+    when it is built.
+
+    ``MonteCarlo`` parses the whole campaign in its constructor, so appending
+    a batch to a large campaign would cost as much as reading all of it.
+    ``run_parallel`` only needs the file names, and the results come from
+    ``RunningStatistics``. Call ``import_results()`` to load the files.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._deferred = True
+        try:
+            super().__init__(*args, **kwargs)
+        finally:
+            self._deferred = False
+
+    # while building, behave as if the files did not exist: MonteCarlo then
+    # only sets their names
+    def import_inputs(self, filename=None):
+        if self._deferred:
+            raise FileNotFoundError
+        super().import_inputs(filename)
+
+    def import_outputs(self, filename=None):
+        if self._deferred:
+            raise FileNotFoundError
+        super().import_outputs(filename)
+
+    def import_errors(self, filename=None):
+        if self._deferred:
+            raise FileNotFoundError
+        super().import_errors(filename)
+
+
+def _count_lines(filename):
+    try:
+        with open(filename, "rb") as file:
+            return sum(chunk.count(b"\n") for chunk in iter(lambda: file.read(1 << 20), b""))
+    except FileNotFoundError:
+        return 0
+
+
+def unstable_file(monte_carlo):
+    """File of the samples skipped by the static margin precheck."""
+    return f"{monte_carlo.filename}.unstable.txt"
+
+
+def next_index(monte_carlo):
+    """Index of the next sample of a campaign. Every sample already drawn
+    has one line in the inputs, errors or unstable file, so failed and
+    skipped samples are never given the same index (and seed) again."""
+    return (
+        _count_lines(monte_carlo._input_file)
+        + _count_lines(monte_carlo._error_file)
+        + _count_lines(unstable_file(monte_carlo))
+    )
+
+
+def precheck(monte_carlo, indices, entropy, window):
+    """Splits sample indices by the static margin at ignition of their
+    rockets, computed from the drawn inputs without building or flying them
+    (see ``stability``).
+
+    Parameters
+    ----------
+    monte_carlo : MonteCarlo
+        Campaign whose stochastic rocket is drawn.
+    indices : iterable[int]
+        Sample indices.
+    entropy : int
+        Campaign seed entropy, as given to the workers.
+    window : tuple[float, float]
+        Lowest and highest acceptable static margin, in calibers.
+
+    Returns
+    -------
+    stable : list[int]
+        Indices to fly.
+    unstable : list[dict]
+        Index, static margin, center of pressure and center of mass of every
+        other sample, with its drawn rocket inputs.
+    """
+    stable, unstable = [], []
+    indices = list(indices)
+    # in chunks, so the drawn inputs of a large campaign are never all in memory
+    for start in range(0, len(indices), PRECHECK_CHUNK):
+        chunk = indices[start : start + PRECHECK_CHUNK]
+        draws = []
+        for index in chunk:
+            _seed(entropy, index)
+            draws.append(draw_rocket(monte_carlo.rocket))
+        margins, pressure, mass = static_margins(draws)
+        for i, index in enumerate(chunk):
+            if window[0] <= margins[i] <= window[1]:
+                stable.append(index)
+            else:
+                unstable.append(
+                    {
+                        "index": index,
+                        "static_margin": float(margins[i]),
+                        "center_of_pressure": float(pressure[i]),
+                        "center_of_mass": float(mass[i]),
+                        "inputs": draws[i],
+                    }
+                )
+    return stable, unstable
+
+
+def _draw(monte_carlo, inputs):
+    """Draws the rocket, environment and flight settings of a sample, in the
+    order of ``MonteCarlo``, and adds their inputs to ``inputs``."""
+    rocket = monte_carlo.rocket.create_object()
+    environment = monte_carlo.environment.create_object()
+    settings = {
+        "rail_length": monte_carlo.flight._randomize_rail_length(),
+        "inclination": monte_carlo.flight._randomize_inclination(),
+        "heading": monte_carlo.flight._randomize_heading(),
+    }
+    for model in (monte_carlo.environment, monte_carlo.rocket, monte_carlo.flight):
+        inputs.update(model.last_rnd_dict)
+    return rocket, environment, settings
+
+
+def _draw_payload(payload, inputs):
+    """Payload rocket of a sample: drawn, with its inputs added to
+    ``inputs`` under "payload", if ``payload`` is a ``StochasticRocket``."""
+    if payload is None or isinstance(payload, Rocket):
+        return payload
+    rocket = payload.create_object()
+    inputs["payload"] = payload.last_rnd_dict
+    return rocket
+
+
+def _draw_air_brakes(air_brakes, rocket, inputs):
+    """Adds the air brakes to the rocket of a sample: an ``AirBrakesConfig``,
+    or drawn from a ``StochasticAirBrakes`` with its controller parameters
+    added to ``inputs`` under "air_brakes"."""
+    if air_brakes is None:
+        return
+    if isinstance(air_brakes, AirBrakesConfig):
+        add_air_brakes(rocket, air_brakes)
+        return
+    air_brakes.create_object(rocket)
+    inputs["air_brakes"] = air_brakes.last_rnd_dict
+
+
+def _process():
+    """Host and process id of this worker, and its peak memory so far."""
+    return {"process": f"{socket.gethostname()}:{os.getpid()}", "peak_rss_mb": peak_rss_mb()}
+
+
+def _land(flight):
+    """Moves the impact of a worker's flight onto the campaign's terrain, if
+    it has one."""
+    terrain = worker_state()["terrain"]
+    return flight if terrain is None else land(flight, terrain)
+
+
+def _simulate(index):
+    """Worker: flies sample ``index`` and returns its serialized inputs and
+    outputs lines, or its errors line (inputs, index and error record, see
+    ``triage``) and the error message."""
+    state = worker_state()
+    monte_carlo = state["monte_carlo"]
+    _seed(state["entropy"], index)
+    start_wall, start_cpu = perf_counter(), process_time()
+    inputs, stage = {}, "sampling"
+    try:
+        # known before flying, so a failed flight can be traced to its inputs
+        rocket, environment, settings = _draw(monte_carlo, inputs)
+        payload = _draw_payload(state["payload"], inputs)
+        _draw_air_brakes(state["air_brakes"], rocket, inputs)
+        stage = "flight"
+        flight = Flight(
+            rocket=rocket,
+            environment=environment,
+            initial_solution=monte_carlo.flight.initial_solution,
+            terminate_on_apogee=monte_carlo.flight.terminate_on_apogee,
+            ode_solver=ode_solver(rocket),
+            **settings,
+        )
+        _land(flight)
+        stage = "outputs"
+        outputs = {item: getattr(flight, item) for item in monte_carlo.export_list}
+        for key, callback in (monte_carlo.data_collector or {}).items():
+            outputs[key] = callback(flight)
+        if payload is not None:
+            stage = "payload"
+            outputs.update(
+                payload_outputs(_land(fly_payload(flight, payload, state["payload_separation"])))
+            )
+        result = {
+            "index": index,
+            "inputs": json.dumps(inputs, cls=RocketPyEncoder, **state["export"]),
+            "outputs": json.dumps(outputs, cls=RocketPyEncoder, **state["export"]),
+            "sample": {
+                "wall_time": perf_counter() - start_wall,
+                "cpu_time": process_time() - start_cpu,
+                **Profiler.flight_stats(flight),
+            },
+        }
+        if state["flight_data"] is not None:
+            result["flight_data"] = state["flight_data"].resample(flight)
+        result["sample"].update(_process())
+        return result
+    except Exception as error:  # pylint: disable=broad-except
+        return _failure(index, inputs, error, stage, state["export"])
+
+
+def _failure(index, inputs, error, stage, export):
+    """Errors file result of sample ``index``, see ``triage``."""
+    phase, flight_time = failure_phase(error, stage)
+    record = {
+        "type": type(error).__name__,
+        "message": str(error),
+        "phase": phase,
+        "time": flight_time,
+    }
+    return {
+        "index": index,
+        "inputs": json.dumps(
+            {**inputs, "index": index, "error": record}, cls=RocketPyEncoder, **export
+        ),
+        "error": f"{record['type']} in {phase}: {error}",
+    }
+
+
+def _simulate_descents(ascent):
+    """Worker: flies ascent ``ascent`` up to apogee, then its descents from
+    the apogee state, each with newly drawn parachutes. Returns the results
+    of its samples, as ``_simulate``; an ascent that fails fails them all."""
+    state = worker_state()
+    monte_carlo, descents = state["monte_carlo"], state["descents"]
+    indices = range(ascent * descents, (ascent + 1) * descents)
+    _seed(state["entropy"], ascent)
+    start_wall, start_cpu = perf_counter(), process_time()
+    inputs, stage = {}, "sampling"
+    try:
+        rocket, environment, settings = _draw(monte_carlo, inputs)
+        _draw_air_brakes(state["air_brakes"], rocket, inputs)
+        stage = "flight"
+        ascent_flight = Flight(
+            rocket=rocket,
+            environment=environment,
+            initial_solution=monte_carlo.flight.initial_solution,
+            terminate_on_apogee=True,
+            ode_solver=ode_solver(rocket),
+            **settings,
+        )
+        stage = "outputs"
+        ascent_outputs = {
+            item: getattr(ascent_flight, item)
+            for item in monte_carlo.export_list
+            if item not in DESCENT_OUTPUTS
+        }
+        ascent_data = None
+        if state["flight_data"] is not None:
+            ascent_data = state["flight_data"].resample(ascent_flight)
+    except Exception as error:  # pylint: disable=broad-except
+        return [_failure(index, inputs, error, stage, state["export"]) for index in indices]
+    # the ascent's cost is booked on its first descent
+    ascent_wall, ascent_cpu = perf_counter() - start_wall, process_time() - start_cpu
+    ascent_controllers = {
+        name: value
+        for name, value in Profiler.flight_stats(ascent_flight).items()
+        if name.startswith("controller_")
+    }
+    # air brakes are stowed from apogee on, and rocketpy can't start a
+    # controlled flight from another one
+    rocket._controllers, rocket.air_brakes = [], []  # pylint: disable=protected-access
+
+    results = []
+    for branch, index in enumerate(indices):
+        _seed(state["entropy"], ascent, branch)
+        start_wall, start_cpu = perf_counter(), process_time()
+        sample_inputs, stage = {**inputs, "parachutes": []}, "sampling"
+        try:
+            rocket.parachutes = []
+            for model in monte_carlo.rocket.parachutes:
+                parachute = model.create_object()
+                sample_inputs["parachutes"].append(model.last_rnd_dict)
+                rocket.add_parachute(
+                    name=parachute.name,
+                    cd_s=parachute.cd_s,
+                    trigger=parachute.trigger,
+                    sampling_rate=parachute.sampling_rate,
+                    lag=parachute.lag,
+                    noise=parachute.noise,
+                )
+            payload = _draw_payload(state["payload"], sample_inputs)
+            stage = "flight"
+            flight = Flight(
+                rocket=rocket,
+                environment=environment,
+                initial_solution=ascent_flight,
+                ode_solver=ode_solver(rocket),
+                **settings,
+            )
+            _land(flight)
+            stage = "outputs"
+            outputs = dict(ascent_outputs)
+            for item in DESCENT_OUTPUTS:
+                if item in monte_carlo.export_list:
+                    outputs[item] = getattr(flight, item)
+            for key, callback in (monte_carlo.data_collector or {}).items():
+                outputs[key] = callback(flight)
+            if payload is not None:
+                stage = "payload"
+                # the ascent ends at apogee, later events are in the descent
+                source = ascent_flight if state["payload_separation"] == "apogee" else flight
+                outputs.update(
+                    payload_outputs(
+                        _land(fly_payload(source, payload, state["payload_separation"]))
+                    )
+                )
+            result = {
+                "index": index,
+                "inputs": json.dumps(sample_inputs, cls=RocketPyEncoder, **state["export"]),
+                "outputs": json.dumps(outputs, cls=RocketPyEncoder, **state["export"]),
+                "sample": {
+                    "wall_time": perf_counter() - start_wall + (ascent_wall if branch == 0 else 0),
+                    "cpu_time": process_time() - start_cpu + (ascent_cpu if branch == 0 else 0),
+                    **Profiler.flight_stats(flight),
+                    **(ascent_controllers if branch == 0 else {}),
+                },
+            }
+            if ascent_data is not None:
+                descent_data = state["flight_data"].resample(flight)
+                result["flight_data"] = {
+                    name: np.concatenate([ascent_data[name], descent_data[name][1:]])
+                    for name in ascent_data
+                }
+            result["sample"].update(_process())
+            results.append(result)
+        except Exception as error:  # pylint: disable=broad-except
+            results.append(_failure(index, sample_inputs, error, stage, state["export"]))
+    return results
+
+
+def run_parallel(
+    monte_carlo,
+    number_of_simulations,
+    append=False,
+    workers=None,
+    seed=None,
+    profiler=None,
+    flight_data=None,
+    statistics=None,
+    static_margin=None,
+    descents=None,
+    payload=None,
+    payload_separation="apogee",
+    air_brakes=None,
+    memory_budget=None,
+    terrain=None,
+    **kwargs,
+):
+    """Runs a MonteCarlo campaign in parallel worker processes.
+
+    Parameters
+    ----------
+    monte_carlo : MonteCarlo
+        Campaign with its stochastic models, export list and data collector.
+        Data collector callbacks run in the workers.
+    number_of_simulations : int
+        Total number of simulations, as in ``MonteCarlo.simulate``. With
+        ``append=True`` the simulations already in the files, failed ones
+        included, count towards it (see ``next_index``).
+    append : bool, optional
+        If True, new results are appended to the existing files.
+    workers : int, optional
+        Number of worker processes, defaults to all cores.
+    seed : int, optional
+        Seed of the campaign. Each sample is seeded from it and its index, so a
+        seeded campaign is reproducible for any number of workers.
+    profiler : Profiler, optional
+        If given, the timings and solver statistics of each sample are added
+        to it.
+    flight_data : FlightDataExport, optional
+        If given, each flight is resampled in its worker and the flights are
+        saved to its file. With ``append=True`` the flights already in the
+        file are kept.
+    statistics : RunningStatistics, optional
+        If given, it is updated with each sample as it is written and saved,
+        and the files are not re-imported into ``monte_carlo``, whose
+        ``results`` then keep what was loaded before this run. Use the
+        statistics instead, e.g. with a ``DeferredMonteCarlo``.
+    static_margin : tuple[float, float], optional
+        If given, samples whose static margin at ignition is outside this
+        window (calibers) are not flown. They are written to the unstable
+        file (see ``unstable_file``) with their margin and rocket inputs.
+    descents : int, optional
+        Recovery study mode: each ascent is flown once, up to apogee, and
+        ``descents`` descents are flown from its apogee state, each with its
+        own parachute draw (``StochasticParachute`` cd_s, lag, ...). Samples
+        ``k * descents`` to ``(k + 1) * descents - 1`` share ascent ``k``:
+        environment, rocket and flight inputs, and the outputs not in
+        ``DESCENT_OUTPUTS``. The number of simulations is rounded up to whole
+        ascents. Parachutes must not deploy before apogee. Data collector
+        callbacks and flight data get each descent, the flight data from
+        the launch.
+    payload : Rocket or StochasticRocket, optional
+        Payload carried by the rocket. It is flown from the state of each
+        sample's flight at ``payload_separation`` (see ``payload``), drawn
+        per sample if stochastic, and its ``PAYLOAD_OUTPUTS`` (impact point,
+        velocity and time) are added to the outputs.
+    payload_separation : str, optional
+        "apogee" (default) or the name of the parachute whose deployment
+        releases the payload.
+    air_brakes : AirBrakesConfig or StochasticAirBrakes, optional
+        Air brakes added to every sample's rocket (``StochasticRocket`` does
+        not draw them), with their controller parameters drawn per sample if
+        stochastic. The controller timings are added to the samples' profile.
+        With ``descents``, they only fly the ascents.
+    memory_budget : float, optional
+        Memory of the campaign on this machine, in MB. The flights of
+        ``flight_data`` are spilled to its ``TrajectoryStore`` and the
+        samples of ``profiler`` to ``{filename}.samples.jsonl`` as they
+        arrive, at most ``MEMORY_WINDOW`` results per worker wait to be
+        written, and a warning is printed when this process and the peaks
+        of the workers add up to more than the budget. Needs
+        ``statistics``, the files are not loaded back. Every sample records
+        the peak memory of its worker process in any case, see ``Profiler``.
+    terrain : ElevationGrid, optional
+        If given, the flights and payload descents impact on its terrain
+        instead of the launch elevation (see ``terrain.land``). The
+        environment's elevation should be its ``pad`` height.
+    kwargs : dict
+        Export options of the inputs file, see ``MonteCarlo.simulate``.
+
+    Returns
+    -------
+    list[tuple[int, str]] or int
+        Index and error message of each failed sample, or with a
+        ``memory_budget`` their number. Failed samples are written to the
+        errors file with their inputs, index, exception type and phase (see
+        ``triage``), and do not stop the campaign.
+    """
+    start_wall, start_cpu = time(), process_time()
+    state, indices, unstable = _prepare(
+        monte_carlo,
+        number_of_simulations,
+        append,
+        seed,
+        flight_data,
+        statistics,
+        static_margin,
+        descents,
+        payload,
+        payload_separation,
+        air_brakes,
+        kwargs,
+        profiler,
+        memory_budget,
+        terrain,
+    )
+    if descents:
+        print(
+            f"Starting Monte Carlo analysis of {descents} descents per ascent on "
+            f"{workers or 'all'} worker(s)"
+        )
+    else:
+        print(f"Starting Monte Carlo analysis on {workers or 'all'} worker(s)")
+    window = MEMORY_WINDOW * (workers or default_workers()) if memory_budget else None
+    results = fly(state, indices, workers, window)
+    completed, failures, worker_cpu_time, processes = _write(
+        monte_carlo, results, append, unstable, profiler, flight_data, statistics, memory_budget
+    )
+    _finish(
+        monte_carlo,
+        number_of_simulations,
+        time() - start_wall,
+        # worker CPU time is not seen by this process, sum the samples' instead
+        process_time() - start_cpu + worker_cpu_time,
+        completed,
+        failures,
+        flight_data,
+        statistics,
+        processes,
+        memory_budget,
+    )
+    return failures
+
+
+def _prepare(
+    monte_carlo,
+    number_of_simulations,
+    append,
+    seed,
+    flight_data,
+    statistics,
+    static_margin,
+    descents,
+    payload,
+    payload_separation,
+    air_brakes,
+    export,
+    profiler=None,
+    memory_budget=None,
+    terrain=None,
+):
+    """Checks a campaign run (see ``run_parallel``) and sets up its files,
+    statistics and spilling.
+
+    Returns
+    -------
+    state : dict
+        State of the workers.
+    indices : list[int]
+        Indices to fly, of ascents with ``descents``.
+    unstable : list[dict]
+        Records of the samples skipped by the static margin precheck.
+    """
+    first = next_index(monte_carlo) if append else 0
+    if descents and monte_carlo.flight.terminate_on_apogee:
+        raise ValueError("The descents of a flight terminated on apogee can't be flown.")
+    if descents and first % descents:
+        raise ValueError(
+            f"The campaign has {first} samples, not whole ascents of {descents} descents."
+        )
+    if memory_budget and statistics is None:
+        raise ValueError(
+            "A memory budget needs RunningStatistics, the campaign files would be loaded back."
+        )
+    monte_carlo._export_config = export
+    if memory_budget:
+        if flight_data is not None:
+            flight_data.spill()  # before loading the flights to append to
+        if profiler is not None:
+            profiler.spill_samples(f"{monte_carlo.filename}.samples.jsonl")
+    if statistics is not None:
+        if append:
+            statistics.sync(monte_carlo._output_file)  # samples it has not seen yet
+        else:
+            statistics.reset()
+    if flight_data is not None and append:
+        flight_data.load()
+    state = {
+        "monte_carlo": monte_carlo,
+        "entropy": np.random.SeedSequence(seed).entropy,
+        "export": export,
+        "flight_data": flight_data,
+        "descents": descents,
+        "payload": payload,
+        "payload_separation": payload_separation,
+        "air_brakes": air_brakes,
+        "terrain": terrain,
+    }
+    # with descents, the precheck and the workers get ascent indices
+    step = descents or 1
+    last = -(-number_of_simulations // step) * step
+    indices = range(first // step, last // step)
+    unstable = []
+    if static_margin is not None:
+        indices, unstable = precheck(monte_carlo, indices, state["entropy"], static_margin)
+        # one record per sample, the indices are counted in lines (next_index)
+        unstable = [
+            {**record, "index": index}
+            for record in unstable
+            for index in range(record["index"] * step, (record["index"] + 1) * step)
+        ]
+        print(
+            f"{len(unstable)} of {last - first} samples have a static margin outside "
+            f"{static_margin} and are not flown"
+        )
+    return state, list(indices), unstable
+
+
+def fly(state, indices, workers=None, window=None):
+    """Flies the samples (ascents with descents) ``indices`` of a campaign
+    on ``workers`` forked processes and yields their results in order.
+
+    ``state`` is the workers' state of ``run_parallel``. The results are the
+    ones written to the campaign files, see ``_simulate``. ``window`` bounds
+    the tasks waiting to be yielded, see ``parallel_imap``.
+    """
+    if state["descents"]:
+        return chain.from_iterable(
+            parallel_imap(_simulate_descents, indices, state=state, workers=workers, window=window)
+        )
+    return parallel_imap(_simulate, indices, state=state, workers=workers, window=window)
+
+
+def _check_memory(processes, memory_budget):
+    """Prints a warning and returns True if this process and the peaks of
+    the other ``processes`` of this machine add up to more than
+    ``memory_budget``. Pages the forked workers share with this process are
+    counted in each of them, so this overestimates."""
+    host = socket.gethostname()
+    this = f"{host}:{os.getpid()}"
+    workers = [
+        peak
+        for process, peak in processes.items()
+        if process.rsplit(":", 1)[0] == host and process != this
+    ]
+    coordinator = current_rss_mb()
+    if coordinator + sum(workers) <= memory_budget:
+        return False
+    fitting = int((memory_budget - coordinator) // max(workers)) if workers else 0
+    print(
+        f"Warning: {coordinator + sum(workers):.0f} MB used, over the memory budget of "
+        f"{memory_budget:.0f} MB (this process {coordinator:.0f} MB, {len(workers)} workers up "
+        f"to {max(workers, default=0.0):.0f} MB). At most {max(fitting, 0)} workers fit."
+    )
+    return True
+
+
+def _write(
+    monte_carlo,
+    results,
+    append,
+    unstable,
+    profiler,
+    flight_data,
+    statistics,
+    memory_budget=None,
+):
+    """Writes ``results`` to the campaign files as they arrive, and the
+    ``unstable`` records to the unstable file. Returns the number of
+    results, the failures, the workers' CPU time of the samples and the peak
+    memory of each worker process, in MB. The ``memory_budget`` is checked
+    until it is first exceeded. With a budget the failures are counted, they
+    are in the errors file."""
+    failures = 0 if memory_budget else []
+    completed = 0
+    worker_cpu_time = 0.0
+    processes = {}
+    checking = bool(memory_budget)
+    open_mode = "a" if append else "w"
+    try:
+        if unstable or not append:
+            with open(unstable_file(monte_carlo), open_mode, encoding="utf-8") as file:
+                for record in unstable:
+                    file.write(json.dumps(record, cls=RocketPyEncoder) + "\n")
+        with open(monte_carlo._input_file, open_mode, encoding="utf-8") as input_file, open(
+            monte_carlo._output_file, open_mode, encoding="utf-8"
+        ) as output_file, open(
+            monte_carlo._error_file, open_mode, encoding="utf-8"
+        ) as error_file:
+            # written as they arrive, so an interrupted campaign keeps its samples
+            for result in results:
+                completed += 1
+                if "error" in result:
+                    error_file.write(result["inputs"] + "\n")
+                    error_file.flush()
+                    if memory_budget:
+                        failures += 1
+                    else:
+                        failures.append((result["index"], result["error"]))
+                    print(f"Error on iteration {result['index'] + 1}: {result['error']}")
+                    continue
+                input_file.write(result["inputs"] + "\n")
+                output_file.write(result["outputs"] + "\n")
+                input_file.flush()
+                output_file.flush()
+                worker_cpu_time += result["sample"]["cpu_time"]
+                process = result["sample"]["process"]
+                new = process not in processes
+                processes[process] = max(
+                    processes.get(process, 0.0), result["sample"]["peak_rss_mb"]
+                )
+                if checking and (new or completed % MEMORY_CHECK == 0):
+                    checking = not _check_memory(processes, memory_budget)
+                if profiler is not None:
+                    profiler.add_sample({"sample": result["index"], **result["sample"]})
+                if flight_data is not None:
+                    flight_data.add(result["index"], result["flight_data"])
+                if statistics is not None:
+                    statistics.add_line(result["outputs"])
+    finally:
+        # consistent with the lines written so far, even after an interruption
+        if statistics is not None:
+            statistics.save()
+        if flight_data is not None and flight_data.store is not None:
+            flight_data.store.flush()
+    return completed, failures, worker_cpu_time, processes
+
+
+def _count(failures):
+    """Number of failed samples, listed or counted (see ``_write``)."""
+    return failures if isinstance(failures, int) else len(failures)
+
+
+def _finish(
+    monte_carlo,
+    number_of_simulations,
+    wall_time,
+    cpu_time,
+    completed,
+    failures,
+    flight_data,
+    statistics,
+    processes=None,
+    memory_budget=None,
+):
+    """Sets the campaign totals, points ``monte_carlo`` to its files (unless
+    the ``statistics`` hold the results), prints the peak memory of this
+    process and of the workers and saves the flight data."""
+    monte_carlo.number_of_simulations = number_of_simulations
+    monte_carlo.total_wall_time = wall_time
+    monte_carlo.total_cpu_time = cpu_time
+    print(
+        f"Completed {completed} iterations ({_count(failures)} failed). Total CPU "
+        f"time: {monte_carlo.total_cpu_time:.1f} s. Total wall time: "
+        f"{monte_carlo.total_wall_time:.1f} s"
+    )
+    if processes:
+        peaks = list(processes.values())
+        print(
+            f"Peak memory: this process {peak_rss_mb():.0f} MB, {len(peaks)} worker processes "
+            f"up to {max(peaks):.0f} MB (mean {sum(peaks) / len(peaks):.0f} MB)"
+            + (f", budget {memory_budget:.0f} MB" if memory_budget else "")
+        )
+    if statistics is not None:
+        monte_carlo.num_of_loaded_sims = statistics.samples
+        print(f"Statistics saved to {statistics.filename}")
+    else:
+        # reload the files to compute the results
+        monte_carlo.input_file = f"{monte_carlo.filename}.inputs.txt"
+        monte_carlo.output_file = f"{monte_carlo.filename}.outputs.txt"
+        monte_carlo.error_file = f"{monte_carlo.filename}.errors.txt"
+    print(f"Results saved to {monte_carlo._output_file}")
+    if flight_data is not None:
+        flight_data.save()
+        print(f"Flight time series saved to {flight_data.filename}")
+
+
+def run_batch(
+    monte_carlo,
+    number_of_simulations,
+    append=False,
+    seed=None,
+    statistics=None,
+    batch_size=10000,
+    max_time=600.0,
+    **kwargs,
+):
+    """Runs a MonteCarlo campaign with ``BatchFlight``, tens of times faster
+    than ``run_parallel`` for the apogee and landing dispersion.
+
+    Each sample draws from the stochastic models of ``monte_carlo``: its
+    environment (ensemble member or profile, and wind factors), the rocket
+    mass and drag factors, the total impulse of its motor, the drag areas of
+    its parachutes and the rail inclination and heading. Everything else is
+    the nominal rocket and flight's, the rail length included, and all
+    parachutes are scaled by the mean ratio of their drawn to nominal drag
+    area. The samples are written to the campaign files as by
+    ``run_parallel``, with these inputs and the ``BatchFlight.results``
+    outputs. Flights still in the air at ``max_time`` are failures.
+
+    Parameters
+    ----------
+    monte_carlo : MonteCarlo
+        Campaign with its stochastic models. The environment must be a
+        ``SharedStochasticEnvironment`` or ``ClimatologyStochasticEnvironment``.
+        The export list and data collector are not used.
+    number_of_simulations : int
+        Total number of simulations, see ``run_parallel``.
+    append : bool, optional
+        If True, new results are appended to the existing files.
+    seed : int, optional
+        Seed of the campaign, see ``run_parallel``.
+    statistics : RunningStatistics, optional
+        If given, it is updated with each sample as it is written and saved,
+        see ``run_parallel``.
+    batch_size : int, optional
+        Samples drawn and flown at once, in this process. Default is 10000.
+    max_time : float, optional
+        Flight time limit, in seconds. Default is 600.
+    kwargs : dict
+        Export options of the inputs file, see ``MonteCarlo.simulate``.
+
+    Returns
+    -------
+    list[tuple[int, str]]
+        Index and error message of each failed sample.
+    """
+    start_wall, start_cpu = time(), process_time()
+    state, indices, _ = _prepare(
+        monte_carlo,
+        number_of_simulations,
+        append,
+        seed,
+        None,
+        statistics,
+        None,
+        None,
+        None,
+        "apogee",
+        None,
+        kwargs,
+    )
+    print(f"Starting batch Monte Carlo analysis of {len(indices)} samples")
+    results = chain.from_iterable(
+        _fly_batch(state, indices[start : start + batch_size], max_time)
+        for start in range(0, len(indices), batch_size)
+    )
+    completed, failures, _, _ = _write(monte_carlo, results, append, [], None, None, statistics)
+    _finish(
+        monte_carlo,
+        number_of_simulations,
+        time() - start_wall,
+        process_time() - start_cpu,
+        completed,
+        failures,
+        None,
+        statistics,
+    )
+    return failures
+
+
+def _draw_scalars(monte_carlo, entropy, index):
+    """Draws the ``BatchFlight`` inputs of sample ``index``. Returns its
+    environment, whose wind is scaled by the drawn factors, and inputs."""
+    _seed(entropy, index)
+    model = monte_carlo.rocket
+    environment = monte_carlo.environment.create_object()
+    if not hasattr(environment, "_base_wind"):
+        raise TypeError(
+            "run_batch needs a SharedStochasticEnvironment or ClimatologyStochasticEnvironment, "
+            f"not a {type(monte_carlo.environment).__name__}."
+        )
+    rocket = next(model.dict_generator())
+    motor = next(model.motors[0].component.dict_generator())
+    ratios = [next(chute.dict_generator())["cd_s"] / chute.obj.cd_s for chute in model.parachutes]
+    inputs = {
+        **monte_carlo.environment.last_rnd_dict,
+        "mass": rocket["mass"],
+        "power_off_drag_factor": rocket["power_off_drag_factor"],
+        "power_on_drag_factor": rocket["power_on_drag_factor"],
+        "total_impulse": motor.get("total_impulse", model.obj.motor.total_impulse),
+        "parachute_cd_s_factor": float(np.mean(ratios)) if ratios else 1.0,
+        "inclination": monte_carlo.flight._randomize_inclination(),
+        "heading": monte_carlo.flight._randomize_heading(),
+    }
+    return environment, inputs
+
+
+def _fly_batch(state, indices, max_time):
+    """Draws the samples ``indices``, flies them with one ``BatchFlight`` per
+    environment and returns their results in order, as ``_simulate``."""
+    monte_carlo = state["monte_carlo"]
+    rocket = monte_carlo.rocket.obj
+    start_wall, start_cpu = perf_counter(), process_time()
+    groups = {}
+    for index in indices:
+        environment, inputs = _draw_scalars(monte_carlo, state["entropy"], index)
+        groups.setdefault(id(environment), (environment, []))[1].append((index, inputs))
+    results = {}
+    for environment, samples in groups.values():
+        # the cached environment of the last draw, unscaled for the batch
+        environment.wind_velocity_x, environment.wind_velocity_y = environment._base_wind
+        draws = {key: np.array([inputs[key] for _, inputs in samples]) for key in samples[0][1]}
+        batch = BatchFlight(
+            rocket,
+            environment,
+            monte_carlo.flight.obj.rail_length,
+            draws["inclination"],
+            draws["heading"],
+            mass_offset=draws["mass"] - rocket.mass,
+            impulse_factor=draws["total_impulse"] / rocket.motor.total_impulse,
+            drag_factor=draws["power_off_drag_factor"],
+            power_on_drag_factor=draws["power_on_drag_factor"],
+            parachute_cd_s_factor=draws["parachute_cd_s_factor"],
+            wind_factor_x=draws["wind_velocity_x_factor"],
+            wind_factor_y=draws["wind_velocity_y_factor"],
+            max_time=max_time,
+        )
+        outputs = batch.results()
+        for i, (index, inputs) in enumerate(samples):
+            if np.isnan(outputs["t_final"][i]):
+                error = RuntimeError(f"Still in the air after {max_time} s.")
+                results[index] = _failure(index, inputs, error, "flight", state["export"])
+                continue
+            sample_outputs = {key: float(values[i]) for key, values in outputs.items()}
+            results[index] = {
+                "index": index,
+                "inputs": json.dumps(inputs, cls=RocketPyEncoder, **state["export"]),
+                "outputs": json.dumps(sample_outputs, cls=RocketPyEncoder, **state["export"]),
+            }
+    # the batch is flown at once, its time is shared by its samples
+    sample = {
+        "wall_time": (perf_counter() - start_wall) / len(indices),
+        "cpu_time": (process_time() - start_cpu) / len(indices),
+        **_process(),
+    }
+    for index in indices:
+        if "error" not in results[index]:
+            results[index]["sample"] = sample
+        yield results[index]
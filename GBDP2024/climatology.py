@@ -0,0 +1,278 @@
+"""Launch site climatology: every hourly profile of several reanalysis files
+in one memory-mapped bank.
+
+``SharedStochasticEnvironment`` draws the members of one date's reanalysis or
+forecast. A ``ProfileBank`` extracts the site profiles (see
+``AtmosphericProfiles``) of every time of every file once, e.g. all the EuRoC
+launch windows of data/weather, and saves them as one float64 array with a
+JSON index next to it. Opening the bank memory-maps the array, so forked
+Monte Carlo workers share its pages and no NetCDF file is read again.
+``ClimatologyStochasticEnvironment`` draws a historical profile per sample,
+optionally restricted to some years, launch windows (days) or hours, plus
+the wind factors.
+"""
+
+import json
+import os
+from datetime import datetime
+from random import choice
+
+import numpy as np
+from rocketpy import Environment
+
+from .atmosphere import AtmosphericProfiles
+from .shared_environment import _distribution
+
+FIELDS = AtmosphericProfiles.fields
+
+
+class ProfileBank:
+    """Site profiles of many times, memory-mapped from ``{path}.npy``.
+
+    The array has shape (n_profiles, n_fields, n_levels) with the fields of
+    ``AtmosphericProfiles`` (height, pressure, temperature, wind_u, wind_v).
+    Profiles with fewer levels are padded with NaN, ``levels`` gives their
+    number.
+
+    Attributes
+    ----------
+    data : numpy.memmap
+        The profiles.
+    times : list[datetime]
+        Time of each profile.
+    members : list[int]
+        Ensemble member of each profile, 0 for reanalysis files.
+    sources : list[int]
+        Index in ``index["sources"]`` of the file of each profile.
+    levels : list[int]
+        Number of levels of each profile.
+    index : dict
+        The JSON index: site, source files (with their size and modification
+        time) and the lists above.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(f"{path}.json", "r", encoding="utf-8") as file:
+            self.index = json.load(file)
+        self.data = np.load(f"{path}.npy", mmap_mode="r")
+        self.times = [datetime.fromisoformat(time) for time in self.index["times"]]
+        self.members = self.index["members"]
+        self.sources = self.index["sources_of_profiles"]
+        self.levels = self.index["levels"]
+        self.latitude = self.index["latitude"]
+        self.longitude = self.index["longitude"]
+        self._environments = {}
+
+    def __len__(self):
+        return len(self.times)
+
+    @staticmethod
+    def _stamp(filename):
+        stat = os.stat(filename)
+        return {"file": os.path.abspath(filename), "size": stat.st_size, "mtime": stat.st_mtime}
+
+    @classmethod
+    def build(cls, filenames, latitude, longitude, path):
+        """Extracts the site profiles of every time (and member) of the
+        NetCDF ``filenames`` and saves them to ``{path}.npy`` and
+        ``{path}.json``.
+
+        Returns
+        -------
+        ProfileBank
+            The saved bank, memory-mapped.
+        """
+        extracted = [
+            AtmosphericProfiles.from_netcdf(filename, latitude, longitude) for filename in filenames
+        ]
+        n_levels = max(profiles.height.shape[1] for profiles in extracted)
+        data = np.full((sum(map(len, extracted)), len(FIELDS), n_levels), np.nan)
+        index = {
+            "latitude": latitude,
+            "longitude": longitude,
+            "fields": FIELDS,
+            "sources": [cls._stamp(filename) for filename in filenames],
+            "times": [],
+            "members": [],
+            "sources_of_profiles": [],
+            "levels": [],
+        }
+        start = 0
+        for source, profiles in enumerate(extracted):
+            count, levels = profiles.height.shape
+            for field, name in enumerate(FIELDS):
+                data[start : start + count, field, :levels] = getattr(profiles, name)
+            index["times"] += [time.isoformat() for time in profiles.times]
+            index["members"] += profiles.members
+            index["sources_of_profiles"] += [source] * count
+            index["levels"] += [levels] * count
+            start += count
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        np.save(f"{path}.npy", data)
+        with open(f"{path}.json", "w", encoding="utf-8") as file:
+            json.dump(index, file)
+        return cls(path)
+
+    @classmethod
+    def load(cls, filenames, latitude, longitude, path):
+        """Opens the bank at ``path``, built again first if it is missing or
+        was built from other files, site or file versions."""
+        try:
+            bank = cls(path)
+        except FileNotFoundError:
+            return cls.build(filenames, latitude, longitude, path)
+        current = (latitude, longitude, [cls._stamp(filename) for filename in filenames])
+        if (bank.latitude, bank.longitude, bank.index["sources"]) != current:
+            bank.close()
+            return cls.build(filenames, latitude, longitude, path)
+        return bank
+
+    def select(self, years=None, windows=None, hours=None, members=None):
+        """Indices of the profiles of the given years, launch windows (days,
+        as ``date`` objects), hours of day and ensemble members. None keeps
+        all."""
+        return [
+            index
+            for index, (time, member) in enumerate(zip(self.times, self.members))
+            if (years is None or time.year in years)
+            and (windows is None or time.date() in windows)
+            and (hours is None or time.hour in hours)
+            and (members is None or member in members)
+        ]
+
+    @property
+    def windows(self):
+        """Launch windows (days) of the bank, in order."""
+        return sorted({time.date() for time in self.times})
+
+    def profile(self, field, index):
+        """Heights and values of a field of profile ``index``, views of the
+        memory map."""
+        levels = self.levels[index]
+        return self.data[index, 0, :levels], self.data[index, FIELDS.index(field), :levels]
+
+    def environment(self, index, elevation):
+        """Custom atmosphere Environment of profile ``index`` at the site.
+
+        Environments are cached per profile in each process, so a worker
+        builds each at most once. Their base winds are kept in
+        ``_base_wind``, ``ClimatologyStochasticEnvironment`` scales them.
+        """
+        key = (index, elevation)
+        if key not in self._environments:
+            time = self.times[index]
+            env = Environment(
+                date=(time.year, time.month, time.day, time.hour),
+                latitude=self.latitude,
+                longitude=self.longitude,
+                elevation=elevation,
+            )
+            env.set_atmospheric_model(
+                type="custom_atmosphere",
+                pressure=np.column_stack(self.profile("pressure", index)),
+                temperature=np.column_stack(self.profile("temperature", index)),
+                wind_u=np.column_stack(self.profile("wind_u", index)),
+                wind_v=np.column_stack(self.profile("wind_v", index)),
+            )
+            env._base_wind = (env.wind_velocity_x, env.wind_velocity_y)
+            self._environments[key] = env
+        return self._environments[key]
+
+    def label(self, index):
+        """Readable name of profile ``index``."""
+        label = datetime.strftime(self.times[index], "%Y-%m-%d %H:%M")
+        if any(self.members):
+            label += f" member {self.members[index]}"
+        return label
+
+    def close(self):
+        """Releases the memory map and the cached Environments."""
+        self._environments.clear()
+        mapping = getattr(self.data, "_mmap", None)
+        self.data = None
+        if mapping is not None:
+            mapping.close()
+
+
+class ClimatologyStochasticEnvironment:
+    """Stochastic environment drawing a historical profile of a
+    ``ProfileBank`` and the wind factors.
+
+    It can replace ``rocketpy.stochastic.StochasticEnvironment`` in a
+    ``MonteCarlo``. Pickling it (for independently started processes) only
+    pickles the bank path, which is memory-mapped again.
+
+    Parameters
+    ----------
+    bank : ProfileBank
+    elevation : float
+        Launch site elevation above sea level, in meters.
+    profiles : list[int], optional
+        Profiles to draw from, e.g. ``bank.select(hours=range(10, 17))``.
+        Defaults to all.
+    wind_velocity_x_factor, wind_velocity_y_factor : tuple, optional
+        (mean, std) or (mean, std, distribution name) of the factors
+        multiplying the wind components. Default is (1, 0).
+    """
+
+    def __init__(
+        self,
+        bank,
+        elevation,
+        profiles=None,
+        wind_velocity_x_factor=(1, 0),
+        wind_velocity_y_factor=(1, 0),
+    ):
+        self.bank = bank
+        self.elevation = elevation
+        self.profiles = list(range(len(bank))) if profiles is None else list(profiles)
+        if not self.profiles:
+            raise ValueError("No profile of the bank to draw from.")
+        self.wind_velocity_x_factor = _distribution(wind_velocity_x_factor)
+        self.wind_velocity_y_factor = _distribution(wind_velocity_y_factor)
+        self.last_rnd_dict = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["bank"] = self.bank.path
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.bank = ProfileBank(state["bank"])
+
+    def create_object(self):
+        """Returns the Environment of a randomly drawn profile with randomly
+        scaled wind."""
+        index = choice(self.profiles)
+        factor_x = self.wind_velocity_x_factor[2](*self.wind_velocity_x_factor[:2])
+        factor_y = self.wind_velocity_y_factor[2](*self.wind_velocity_y_factor[:2])
+        env = self.bank.environment(index, self.elevation)
+        wind_x, wind_y = env._base_wind
+        env.wind_velocity_x = wind_x * factor_x
+        env.wind_velocity_y = wind_y * factor_y
+        time = self.bank.times[index]
+        self.last_rnd_dict = {
+            "profile": index,
+            "date": time.isoformat(),
+            "year": time.year,
+            "hour": time.hour,
+            "ensemble_member": self.bank.members[index],
+            "wind_velocity_x_factor": factor_x,
+            "wind_velocity_y_factor": factor_y,
+        }
+        return env
+
+    def visualize_attributes(self):
+        print("Climatology profiles:")
+        windows = sorted({self.bank.times[index].date() for index in self.profiles})
+        hours = sorted({self.bank.times[index].hour for index in self.profiles})
+        print(f"\tprofiles: {len(self.profiles)} of {len(self.bank)} in {self.bank.path}")
+        print(f"\twindows: {', '.join(str(window) for window in windows)}")
+        print(f"\thours: {hours}")
+        for name in ("wind_velocity_x_factor", "wind_velocity_y_factor"):
+            mean, std, function = getattr(self, name)
+            print(f"\t{name}: {mean:.5f} ± {std:.5f} ({function.__name__})")
@@ -0,0 +1,394 @@
+"""Comparison of Monte Carlo campaigns, e.g. the Hybrid and COTS dispersions.
+
+Each campaign's outputs file is read lazily, on first access, into one float
+array per output variable (cached in ``<filename>.columns.npz`` until the
+outputs file changes), so campaigns with different export lists line up by
+variable name. Differences of each statistic against the first campaign get
+percentile bootstrap confidence intervals. Means, standard deviations and
+impact covariances of all resamples come from one matrix product of resample
+counts, and percentiles are drawn from their exact order statistic
+distributions, so 2000 resamples of two 100k sample campaigns take seconds.
+
+Usage, from the repository root::
+
+    python -m GBDP2024.compare Hybrid/MonteCarlo/MonteCarlo_TestDispersion \\
+        COTS/MonteCarlo/MonteCarlo --names Hybrid COTS --plot comparison.png
+"""
+
+import argparse
+import csv
+import json
+import os
+
+import numpy as np
+
+VARIABLES = ("apogee", "max_mach_number", "out_of_rail_velocity", "impact_distance")
+
+PERCENTILES = {"median": 50, "p05": 5, "p95": 95}
+STATISTICS = ("mean", "std", *PERCENTILES)
+
+
+class CampaignOutputs:
+    """Outputs of one Monte Carlo campaign as arrays, loaded on first use.
+
+    Parameters
+    ----------
+    filename : str
+        Campaign filename as given to ``MonteCarlo``, or its outputs file.
+    name : str, optional
+        Label of the campaign, defaults to the filename.
+
+    Samples missing a variable get NaN. ``impact_distance`` is derived from
+    ``x_impact`` and ``y_impact``.
+    """
+
+    def __init__(self, filename, name=None):
+        if not filename.endswith(".outputs.txt"):
+            filename = f"{filename}.outputs.txt"
+        self.filename = filename
+        self.name = name or filename[: -len(".outputs.txt")]
+        self._columns = None
+
+    @property
+    def columns(self):
+        if self._columns is None:
+            self._columns = self._load()
+        return self._columns
+
+    def _load(self):
+        cache = self.filename[: -len(".outputs.txt")] + ".columns.npz"
+        if os.path.exists(cache) and os.path.getmtime(cache) >= os.path.getmtime(self.filename):
+            with np.load(cache) as data:
+                return {name: data[name] for name in data.files}
+        columns = {}
+        with open(self.filename, "r", encoding="utf-8") as rows:
+            for index, line in enumerate(rows):
+                for key, value in json.loads(line).items():
+                    if isinstance(value, (int, float)) and not isinstance(value, bool):
+                        columns.setdefault(key, {})[index] = value
+        count = index + 1 if columns else 0
+        arrays = {}
+        for key, values in columns.items():
+            array = np.full(count, np.nan)
+            array[list(values)] = list(values.values())
+            arrays[key] = array
+        if "x_impact" in arrays and "y_impact" in arrays:
+            arrays["impact_distance"] = np.hypot(arrays["x_impact"], arrays["y_impact"])
+        np.savez(cache, **arrays)
+        return arrays
+
+    @property
+    def variables(self):
+        return list(self.columns)
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()), ()))
+
+    def __getitem__(self, variable):
+        values = self.columns[variable]
+        return values[np.isfinite(values)]
+
+    def impacts(self):
+        """(n, 2) array of the finite impact points."""
+        return np.column_stack(list(self.complete(["x_impact", "y_impact"]).values()))
+
+    def complete(self, variables):
+        """Columns of ``variables`` restricted to the samples where all of
+        them are finite."""
+        columns = {variable: self.columns[variable] for variable in variables}
+        finite = np.all([np.isfinite(values) for values in columns.values()], axis=0)
+        return {variable: values[finite] for variable, values in columns.items()}
+
+
+def statistic(values, name):
+    """Point estimate of statistic ``name`` (see ``STATISTICS``). The
+    standard deviation is the population one, as in ``MonteCarlo``."""
+    if name == "mean":
+        return float(np.mean(values))
+    if name == "std":
+        return float(np.std(values))
+    return float(np.percentile(values, PERCENTILES[name]))
+
+
+def bootstrap_means(columns, resamples, rng, block_elements=2**22):
+    """Means of each row of ``columns`` (m, n) over bootstrap resamples of
+    the n samples, as an (m, resamples) array.
+
+    Each resample is turned into counts of how often every sample was drawn,
+    so all rows share the same resamples and cost one matrix product.
+    Resamples are drawn in blocks of at most ``block_elements`` indices, so
+    memory does not grow with the number of resamples.
+    """
+    columns = np.atleast_2d(columns)
+    count = columns.shape[1]
+    block = max(1, block_elements // count)
+    means = []
+    for start in range(0, resamples, block):
+        rows = min(block, resamples - start)
+        index = rng.integers(0, count, (rows, count)) + count * np.arange(rows)[:, None]
+        weights = np.bincount(index.ravel(), minlength=rows * count).reshape(rows, count)
+        means.append(columns @ weights.T.astype(float) / count)
+    return np.concatenate(means, axis=1)
+
+
+def bootstrap_percentiles(values, percentile, resamples, rng):
+    """``np.percentile(values, percentile)`` over bootstrap resamples.
+
+    The k-th order statistic of a resample is the empirical quantile of the
+    k-th order statistic of n uniforms, which is Beta(k, n - k + 1)
+    distributed. Drawing it directly is exact and costs O(resamples)
+    instead of O(resamples * n).
+    """
+    values = np.sort(values)
+    count = len(values)
+    position = (count - 1) * percentile / 100
+    k = int(position)
+    fraction = position - k
+    # uniform order statistics k + 1 and k + 2 (1-based) of the resample
+    lower = rng.beta(k + 1, count - k, resamples)
+    upper = lower + (1 - lower) * rng.beta(1, count - k - 1, resamples) if k + 1 < count else lower
+
+    def inverse(uniform):
+        return values[np.clip(np.ceil(count * uniform).astype(int) - 1, 0, count - 1)]
+
+    return inverse(lower) + fraction * (inverse(upper) - inverse(lower))
+
+
+def _bhattacharyya(mean_a, cov_a, mean_b, cov_b):
+    """Bhattacharyya coefficient of two 2D normal distributions, batched
+    over leading dimensions."""
+    cov = (cov_a + cov_b) / 2
+    delta = mean_b - mean_a
+    mahalanobis = np.einsum("...i,...i->...", delta, np.linalg.solve(cov, delta[..., None])[..., 0])
+    distance = mahalanobis / 8 + 0.5 * np.log(
+        np.linalg.det(cov) / np.sqrt(np.linalg.det(cov_a) * np.linalg.det(cov_b))
+    )
+    return np.exp(-distance)
+
+
+def ellipse_overlap(points_a, points_b):
+    """Bhattacharyya coefficient of the normal distributions fitted to two
+    sets of (n, 2) points: 1 for identical dispersion ellipses, 0 for
+    disjoint ones."""
+    return float(
+        _bhattacharyya(
+            points_a.mean(axis=0),
+            np.cov(points_a.T, bias=True),
+            points_b.mean(axis=0),
+            np.cov(points_b.T, bias=True),
+        )
+    )
+
+
+def _bootstrap(campaign, variables, statistics, resamples, rng):
+    """Point estimates and bootstrap replicates of every (variable,
+    statistic) of a campaign, plus the replicated impact means and
+    covariances under the "impact" key.
+
+    Means, standard deviations and the impact moments all come from one
+    shared set of resamples of the complete samples.
+    """
+    impact = "x_impact" in campaign.columns and "y_impact" in campaign.columns
+    columns = campaign.complete(list(variables) + (["x_impact", "y_impact"] if impact else []))
+    estimates, replicates = {}, {}
+    # centered values and their squares (and the impact cross product) go through
+    # bootstrap_means, which gives the means, variances and covariances
+    moments = [variable for variable in variables if {"mean", "std"} & set(statistics)]
+    centered = {name: values - values.mean() for name, values in columns.items()}
+    rows = [centered[variable] for variable in moments]
+    rows += [centered[variable] ** 2 for variable in moments]
+    if impact:
+        x, y = centered["x_impact"], centered["y_impact"]
+        rows += [x, y, x * x, y * y, x * y]
+    means = bootstrap_means(np.array(rows), resamples, rng) if rows else None
+    for index, variable in enumerate(moments):
+        first, second = means[index], means[len(moments) + index]
+        replicates[variable, "mean"] = columns[variable].mean() + first
+        replicates[variable, "std"] = np.sqrt(np.maximum(second - first**2, 0))
+    for variable in variables:
+        for name in statistics:
+            estimates[variable, name] = statistic(columns[variable], name)
+            if name in PERCENTILES:
+                replicates[variable, name] = bootstrap_percentiles(
+                    columns[variable], PERCENTILES[name], resamples, rng
+                )
+    if impact:
+        mean_x, mean_y, xx, yy, xy = means[-5:]
+        center = np.array([columns["x_impact"].mean(), columns["y_impact"].mean()])
+        replicates["impact"] = (
+            center + np.column_stack([mean_x, mean_y]),
+            np.stack(
+                [
+                    np.column_stack([xx - mean_x**2, xy - mean_x * mean_y]),
+                    np.column_stack([xy - mean_x * mean_y, yy - mean_y**2]),
+                ],
+                axis=1,
+            ),
+        )
+    return estimates, replicates
+
+
+def compare_campaigns(
+    campaigns,
+    variables=VARIABLES,
+    statistics=("mean", "std", "p95"),
+    resamples=2000,
+    confidence=0.95,
+    seed=None,
+):
+    """Compares every campaign against the first one, with percentile
+    bootstrap confidence intervals of the differences.
+
+    Parameters
+    ----------
+    campaigns : list[CampaignOutputs]
+        Campaigns to compare, the first is the reference.
+    variables : list[str], optional
+        Output variables. Those missing from any campaign are skipped, and
+        only samples where all of them are finite are used.
+    statistics : list[str], optional
+        Statistics to compare, see ``STATISTICS``.
+    resamples : int, optional
+        Number of bootstrap resamples of each campaign, default 2000.
+    confidence : float, optional
+        Confidence level of the intervals, default 0.95.
+    seed : int, optional
+        Seed of the resampling.
+
+    Returns
+    -------
+    list[dict]
+        One row per campaign, variable and statistic, with the difference
+        campaign - reference, plus one "impact ellipse overlap" row per
+        campaign whose interval is that of the overlap itself.
+    """
+    variables = [
+        variable for variable in variables if all(variable in c.columns for c in campaigns)
+    ]
+    rng = np.random.default_rng(seed)
+    reference, *others = campaigns
+    reference_estimates, reference_replicates = _bootstrap(
+        reference, variables, statistics, resamples, rng
+    )
+    tail = 50 * (1 - confidence)
+    rows = []
+    for campaign in others:
+        estimates, replicates = _bootstrap(campaign, variables, statistics, resamples, rng)
+        for variable in variables:
+            for name in statistics:
+                key = (variable, name)
+                low, high = np.percentile(
+                    replicates[key] - reference_replicates[key], [tail, 100 - tail]
+                )
+                rows.append(
+                    {
+                        "campaign": campaign.name,
+                        "variable": variable,
+                        "statistic": name,
+                        "reference": reference_estimates[key],
+                        "value": estimates[key],
+                        "difference": estimates[key] - reference_estimates[key],
+                        "low": float(low),
+                        "high": float(high),
+                    }
+                )
+        if "impact" in replicates and "impact" in reference_replicates:
+            overlaps = _bhattacharyya(*reference_replicates["impact"], *replicates["impact"])
+            low, high = np.percentile(overlaps, [tail, 100 - tail])
+            rows.append(
+                {
+                    "campaign": campaign.name,
+                    "variable": "impact ellipse",
+                    "statistic": "overlap",
+                    "reference": 1.0,
+                    "value": ellipse_overlap(reference.impacts(), campaign.impacts()),
+                    "difference": np.nan,
+                    "low": float(low),
+                    "high": float(high),
+                }
+            )
+    return rows
+
+
+def print_table(rows, reference_name):
+    """Prints one line per row, flagging with * the differences whose
+    interval excludes zero."""
+    print(f"Reference: {reference_name}")
+    print(
+        f"{'campaign':<16}{'variable':<24}{'stat':<9}{'reference':>12}{'value':>12}"
+        f"{'difference':>13}{'CI low':>12}{'CI high':>12}"
+    )
+    for row in rows:
+        significant = row["statistic"] != "overlap" and (row["low"] > 0 or row["high"] < 0)
+        print(
+            f"{row['campaign']:<16}{row['variable']:<24}{row['statistic']:<9}"
+            f"{row['reference']:>12.3f}{row['value']:>12.3f}{row['difference']:>13.3f}"
+            f"{row['low']:>12.3f}{row['high']:>12.3f} {'*' if significant else ''}"
+        )
+
+
+def plot_comparison(campaigns, variables=VARIABLES, filename=None):
+    """Overlays the distributions of ``variables`` and the impact points of
+    all campaigns.
+
+    If ``filename`` is given the figure is saved instead of shown.
+    """
+    import matplotlib.pyplot as plt  # pylint: disable=import-outside-toplevel
+
+    variables = [
+        variable for variable in variables if all(variable in c.columns for c in campaigns)
+    ]
+    fig, axes = plt.subplots(1, len(variables) + 1, figsize=(4.5 * (len(variables) + 1), 4))
+    for ax, variable in zip(axes, variables):
+        bins = np.histogram_bin_edges(np.concatenate([c[variable] for c in campaigns]), bins=40)
+        for campaign in campaigns:
+            ax.hist(campaign[variable], bins=bins, density=True, alpha=0.5, label=campaign.name)
+        ax.set_title(variable)
+    axes[0].legend()
+    for campaign in campaigns:
+        if "x_impact" in campaign.columns:
+            points = campaign.impacts()
+            axes[-1].scatter(*points.T, s=4, alpha=0.4, label=campaign.name)
+    axes[-1].plot(0, 0, "k*")
+    axes[-1].set_aspect("equal", adjustable="datalim")
+    axes[-1].set_title("Impact points")
+    axes[-1].legend()
+    fig.tight_layout()
+    if filename:
+        fig.savefig(filename)
+        plt.close(fig)
+    else:
+        plt.show()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("campaigns", nargs="+", help="campaign filenames, the first is the reference")
+    parser.add_argument("--names", nargs="+", help="campaign labels")
+    parser.add_argument("--variables", nargs="+", default=list(VARIABLES))
+    parser.add_argument("--statistics", nargs="+", default=["mean", "std", "p95"], choices=STATISTICS)
+    parser.add_argument("--resamples", type=int, default=2000)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--csv", help="save the table to this CSV file")
+    parser.add_argument("--plot", help="save the distributions plot to this file")
+    args = parser.parse_args()
+
+    names = args.names or [None] * len(args.campaigns)
+    campaigns = [CampaignOutputs(filename, name) for filename, name in zip(args.campaigns, names)]
+    for campaign in campaigns:
+        print(f"{campaign.name}: {len(campaign)} simulations")
+    rows = compare_campaigns(
+        campaigns, args.variables, args.statistics, args.resamples, seed=args.seed
+    )
+    print_table(rows, campaigns[0].name)
+    if args.csv:
+        with open(args.csv, "w", newline="", encoding="utf-8") as file:
+            writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+    if args.plot:
+        plot_comparison(campaigns, args.variables, args.plot)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,441 @@
+"""Declarative vehicle and launch site configuration, and its builder.
+
+Hybrid/sim.py and COTS/COTS_sim.py used to build their rockets statement by
+statement with only the constants changed. A ``VehicleConfig`` holds those
+constants as frozen dataclasses and ``build_rocket`` turns it into a rocketpy
+``Rocket``, so both pipelines share one builder. Parts are memoized by their
+configuration: configurations that share a motor, a drag curve or an
+aerodynamic surface (a design study, the Solid and Hybrid options of one
+vehicle) build it once. Parachutes are always new, ``Flight`` keeps their
+sensor signals.
+
+File names are relative to the repository data folder. rocketpy is only
+imported by the builders, so reading the configurations (e.g. a site's
+coordinates in a results script) does not load it.
+"""
+
+import os
+from dataclasses import dataclass, field, replace
+from functools import lru_cache
+
+import numpy as np
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+
+
+def data_path(filename):
+    """Absolute path of a file of the data folder."""
+    return os.path.join(DATA, filename)
+
+
+@dataclass(frozen=True)
+class SiteConfig:
+    """Launch site. ``reanalysis`` is the NetCDF file used for past dates,
+    ``terrain`` an optional NASADEM elevation file around the site (see
+    ``terrain.site_grid``)."""
+
+    latitude: float
+    longitude: float
+    elevation: float
+    reanalysis: str = "weather/data_stream-oper_stepType-instant.nc"
+    terrain: str = None
+
+
+@dataclass(frozen=True)
+class SolidMotorConfig:
+    thrust_source: str
+    dry_mass: float
+    dry_inertia: tuple
+    nozzle_radius: float
+    grain_number: int
+    grain_density: float
+    grain_outer_radius: float
+    grain_initial_inner_radius: float
+    grain_initial_height: float
+    grain_separation: float
+    grains_center_of_mass_position: float
+    center_of_dry_mass_position: float
+    burn_time: float
+    throat_radius: float
+    nozzle_position: float = 0
+    coordinate_system_orientation: str = "nozzle_to_combustion_chamber"
+
+
+@dataclass(frozen=True)
+class TankConfig:
+    """Cylindrical N2O tank emptied at a constant liquid mass flow rate."""
+
+    radius: float
+    height: float
+    flux_time: float
+    initial_liquid_mass: float
+    final_liquid_mass: float
+    liquid_density: float
+    gas_density: float
+    position: float
+
+
+@dataclass(frozen=True)
+class HybridMotorConfig:
+    """Hybrid motor. ``thrust_source`` is a file name or ((time, thrust), ...)
+    points, interpolated linearly."""
+
+    thrust_source: object
+    dry_mass: float
+    dry_inertia: tuple
+    nozzle_radius: float
+    grain_number: int
+    grain_separation: float
+    grain_outer_radius: float
+    grain_initial_inner_radius: float
+    grain_initial_height: float
+    grain_density: float
+    grains_center_of_mass_position: float
+    center_of_dry_mass_position: float
+    burn_time: float
+    throat_radius: float
+    tank: TankConfig
+    nozzle_position: float = 0
+
+
+@dataclass(frozen=True)
+class NoseConfig:
+    length: float
+    kind: str
+    position: float
+
+
+@dataclass(frozen=True)
+class FinsConfig:
+    """Trapezoidal fin set. ``airfoil`` is (file name, angle unit) or None for
+    flat plates."""
+
+    n: int
+    root_chord: float
+    tip_chord: float
+    span: float
+    position: float
+    cant_angle: float = 0
+    airfoil: tuple = None
+
+
+@dataclass(frozen=True)
+class TailConfig:
+    top_radius: float
+    bottom_radius: float
+    length: float
+    position: float
+
+
+@dataclass(frozen=True)
+class RailButtonsConfig:
+    upper_button_position: float
+    lower_button_position: float
+    angular_position: float = 45
+
+
+@dataclass(frozen=True)
+class ParachuteConfig:
+    name: str
+    cd_s: float
+    trigger: object
+    sampling_rate: float = 100
+    lag: float = 0
+    noise: tuple = (0, 0, 0)
+
+
+@dataclass(frozen=True)
+class AirBrakesConfig:
+    """Air brakes: a (deployment level, Mach, cd) table file and the
+    controller function flying them at ``sampling_rate`` (Hz), see
+    ``air_brakes``. ``reference_area`` defaults to the rocket's."""
+
+    drag_coefficient: str
+    controller: object
+    sampling_rate: float = 20
+    reference_area: float = None
+    override_rocket_drag: bool = False
+
+
+@dataclass(frozen=True)
+class RocketConfig:
+    """Rocket and its parts. Drag curves are file names or constants. A
+    rocket without ``motor`` (e.g. a payload) has no nose, fins or tail
+    either unless given."""
+
+    radius: float
+    mass: float
+    inertia: tuple
+    power_off_drag: object
+    power_on_drag: object
+    center_of_mass_without_motor: float
+    motor: object = None
+    motor_position: float = 0
+    rail_buttons: RailButtonsConfig = None
+    nose: NoseConfig = None
+    fins: FinsConfig = None
+    tail: TailConfig = None
+    parachutes: tuple = ()
+    air_brakes: AirBrakesConfig = None
+    coordinate_system_orientation: str = "tail_to_nose"
+
+
+@dataclass(frozen=True)
+class VehicleConfig:
+    """Everything a pipeline needs to fly one vehicle from one site.
+
+    ``motors`` maps the motor options of the sim scripts (e.g. "Solid",
+    "Hybrid") to motor configurations, ``rocket.motor`` is the default one.
+    The ``payload`` leaves the rocket at ``payload_separation``, "apogee" or
+    the deployment of the named parachute (see ``payload``).
+    """
+
+    name: str
+    site: SiteConfig
+    rocket: RocketConfig
+    motors: dict = field(default_factory=dict, hash=False, compare=False)
+    payload: RocketConfig = None
+    payload_separation: str = "apogee"
+    rail_length: float = 5.2
+    inclination: float = 85
+    heading: float = 0
+
+    def with_motor(self, option):
+        """Same vehicle with motor ``option``. Unknown options keep the
+        default motor."""
+        if option not in self.motors:
+            return self
+        return replace(self, rocket=replace(self.rocket, motor=self.motors[option]))
+
+    def with_air_brakes(self, air_brakes):
+        """Same vehicle with ``air_brakes`` (an ``AirBrakesConfig``, None
+        for none)."""
+        return replace(self, rocket=replace(self.rocket, air_brakes=air_brakes))
+
+
+## PARTS (memoized)
+
+
+@lru_cache(maxsize=None)
+def _curve(source):
+    """Drag or thrust curve: a file is read once, constants pass through."""
+    if isinstance(source, str):
+        return np.loadtxt(data_path(source), delimiter=",")
+    if isinstance(source, tuple):
+        return np.array(source, dtype=float)
+    return source
+
+
+@lru_cache(maxsize=None)
+def build_motor(config):
+    """Motor of ``config``, shared by every rocket configured with it."""
+    # pylint: disable=import-outside-toplevel
+    from rocketpy import CylindricalTank, Fluid, HybridMotor, MassFlowRateBasedTank, SolidMotor
+
+    if isinstance(config, SolidMotorConfig):
+        return SolidMotor(
+            thrust_source=data_path(config.thrust_source),
+            dry_mass=config.dry_mass,
+            dry_inertia=config.dry_inertia,
+            nozzle_radius=config.nozzle_radius,
+            grain_number=config.grain_number,
+            grain_density=config.grain_density,
+            grain_outer_radius=config.grain_outer_radius,
+            grain_initial_inner_radius=config.grain_initial_inner_radius,
+            grain_initial_height=config.grain_initial_height,
+            grain_separation=config.grain_separation,
+            grains_center_of_mass_position=config.grains_center_of_mass_position,
+            center_of_dry_mass_position=config.center_of_dry_mass_position,
+            nozzle_position=config.nozzle_position,
+            burn_time=config.burn_time,
+            throat_radius=config.throat_radius,
+            coordinate_system_orientation=config.coordinate_system_orientation,
+        )
+    tank = config.tank
+    oxidizer_tank = MassFlowRateBasedTank(
+        name="oxidizer tank",
+        geometry=CylindricalTank(tank.radius, tank.height),
+        flux_time=tank.flux_time,
+        initial_liquid_mass=tank.initial_liquid_mass,
+        initial_gas_mass=0,
+        liquid_mass_flow_rate_in=0,
+        liquid_mass_flow_rate_out=(tank.initial_liquid_mass - tank.final_liquid_mass)
+        / tank.flux_time,
+        gas_mass_flow_rate_in=0,
+        gas_mass_flow_rate_out=0,
+        liquid=Fluid(name="N2O_l", density=tank.liquid_density),
+        gas=Fluid(name="N2O_g", density=tank.gas_density),
+    )
+    thrust_source = config.thrust_source
+    motor = HybridMotor(
+        thrust_source=(
+            data_path(thrust_source) if isinstance(thrust_source, str) else _curve(thrust_source)
+        ),
+        dry_mass=config.dry_mass,
+        dry_inertia=config.dry_inertia,
+        nozzle_radius=config.nozzle_radius,
+        grain_number=config.grain_number,
+        grain_separation=config.grain_separation,
+        grain_outer_radius=config.grain_outer_radius,
+        grain_initial_inner_radius=config.grain_initial_inner_radius,
+        grain_initial_height=config.grain_initial_height,
+        grain_density=config.grain_density,
+        grains_center_of_mass_position=config.grains_center_of_mass_position,
+        center_of_dry_mass_position=config.center_of_dry_mass_position,
+        nozzle_position=config.nozzle_position,
+        burn_time=config.burn_time,
+        throat_radius=config.throat_radius,
+    )
+    motor.add_tank(tank=oxidizer_tank, position=tank.position)
+    return motor
+
+
+@lru_cache(maxsize=None)
+def build_surface(config, rocket_radius):
+    """Nose cone, fin set or tail of ``config`` for a body of
+    ``rocket_radius``. Surfaces are not changed by the rockets using them."""
+    from rocketpy import NoseCone, Tail, TrapezoidalFins  # pylint: disable=import-outside-toplevel
+
+    if isinstance(config, NoseConfig):
+        return NoseCone(
+            length=config.length, kind=config.kind, base_radius=rocket_radius,
+            rocket_radius=rocket_radius, name="Nose Cone",
+        )
+    if isinstance(config, FinsConfig):
+        airfoil = None
+        if config.airfoil is not None:
+            airfoil = (data_path(config.airfoil[0]), config.airfoil[1])
+        return TrapezoidalFins(
+            n=config.n, root_chord=config.root_chord, tip_chord=config.tip_chord,
+            span=config.span, rocket_radius=rocket_radius, cant_angle=config.cant_angle,
+            airfoil=airfoil, name="Fins",
+        )
+    return Tail(
+        top_radius=config.top_radius, bottom_radius=config.bottom_radius,
+        length=config.length, rocket_radius=rocket_radius, name="Tail",
+    )
+
+
+def clear_cache():
+    """Forgets the memoized parts, e.g. after a data file changed."""
+    # pylint: disable=import-outside-toplevel
+    from .air_brakes import drag_table
+
+    for function in (_curve, build_motor, build_surface, drag_table):
+        function.cache_clear()
+
+
+## ROCKETS
+
+
+def build_rocket(config):
+    """Builds the rocket of a ``RocketConfig``.
+
+    Returns
+    -------
+    rocket : Rocket
+    components : dict
+        The motor, rail buttons, nose cone, fin set, tail, air brakes and
+        their controller timer (see ``air_brakes.add_air_brakes``) and
+        parachutes (by name), named as in the sim scripts. Missing parts are
+        None.
+    """
+    from rocketpy import Rocket  # pylint: disable=import-outside-toplevel
+
+    rocket = Rocket(
+        radius=config.radius,
+        mass=config.mass,
+        inertia=config.inertia,
+        power_off_drag=_curve(config.power_off_drag),
+        power_on_drag=_curve(config.power_on_drag),
+        center_of_mass_without_motor=config.center_of_mass_without_motor,
+        coordinate_system_orientation=config.coordinate_system_orientation,
+    )
+    components = {"motor": None, "rail_buttons": None}
+    if config.motor is not None:
+        components["motor"] = build_motor(config.motor)
+        rocket.add_motor(components["motor"], position=config.motor_position)
+    if config.rail_buttons is not None:
+        components["rail_buttons"] = rocket.set_rail_buttons(
+            upper_button_position=config.rail_buttons.upper_button_position,
+            lower_button_position=config.rail_buttons.lower_button_position,
+            angular_position=config.rail_buttons.angular_position,
+        )
+    # all surfaces in one call, the static margin is evaluated once
+    surfaces, positions = [], []
+    for name, surface in (("nose_cone", config.nose), ("fin_set", config.fins), ("tail", config.tail)):
+        components[name] = None
+        if surface is not None:
+            components[name] = build_surface(surface, config.radius)
+            surfaces.append(components[name])
+            positions.append(surface.position)
+    if surfaces:
+        rocket.add_surfaces(surfaces, positions)
+    for parachute in config.parachutes:
+        components[parachute.name] = rocket.add_parachute(
+            name=parachute.name,
+            cd_s=parachute.cd_s,
+            trigger=parachute.trigger,
+            sampling_rate=parachute.sampling_rate,
+            lag=parachute.lag,
+            noise=parachute.noise,
+        )
+    components["air_brakes"], components["air_brakes_controller"] = None, None
+    if config.air_brakes is not None:
+        # pylint: disable=import-outside-toplevel
+        from .air_brakes import add_air_brakes
+
+        components["air_brakes"], components["air_brakes_controller"] = add_air_brakes(
+            rocket, config.air_brakes
+        )
+    return rocket, components
+
+
+def site_environment(site, date, today=None):
+    """Environment of the sim scripts at noon of ``date``: the reanalysis file
+    of the site for past dates, the GEFS ensemble forecast otherwise.
+
+    Parameters
+    ----------
+    site : SiteConfig
+    date : datetime
+    today : datetime, optional
+        Defaults to now.
+    """
+    # pylint: disable=import-outside-toplevel
+    from datetime import datetime
+
+    from rocketpy import Environment
+
+    elevation = launch_elevation(site)
+    if date < (today or datetime.today()):
+        print("Using past data...")
+        env = Environment(
+            date=(date.year, date.month, date.day, 12),
+            latitude=site.latitude, longitude=site.longitude, elevation=elevation,
+        )
+        env.set_atmospheric_model(
+            type="Reanalysis", file=data_path(site.reanalysis), dictionary="ECMWF",
+        )
+    else:
+        print("Predicting weather data...")
+        #Code won't work at 6 and 12
+        env = Environment(
+            date=(date.year, date.month, date.day, 0),
+            latitude=site.latitude, longitude=site.longitude, elevation=elevation,
+        )
+        env.set_atmospheric_model(type="Ensemble", file="GEFS")
+    return env
+
+
+def launch_elevation(site):
+    """Ground elevation of the launch pad: the terrain grid's height at the
+    site if it has one, ``site.elevation`` otherwise."""
+    if site.terrain is None:
+        return site.elevation
+    from .terrain import site_grid  # pylint: disable=import-outside-toplevel
+
+    grid = site_grid(site)
+    elevation = grid.pad
+    grid.close()
+    return elevation
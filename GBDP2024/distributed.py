@@ -0,0 +1,596 @@
+"""Monte Carlo campaigns flown by workers on several machines.
+
+``run_parallel`` is bound to the cores of one machine. ``run_distributed``
+shards the sample indices of a campaign into jobs of a ``JobQueue``, a
+directory (e.g. on a network share) where workers claim jobs, fly them and
+return each job's results as one compressed batch. The coordinator writes
+the batches to the campaign files in sample order, exactly as
+``run_parallel`` would, so the results scripts, the statistics and the
+profile are unchanged.
+
+rocketpy models can't be sent to the workers, so each worker builds the
+campaign itself, e.g. by running the same Monte Carlo script in worker mode,
+and ``run_worker`` takes the seed entropy and the export options from the
+queue: every sample draws the same inputs whichever worker flies it. The
+coordinator also puts a fingerprint of its models in the queue (environment
+profiles, rocket, flight, payload, air brakes and terrain, nominal values
+and uncertainties), and a worker whose own models differ, e.g. another date,
+motor or forecast download, refuses to serve. A job whose worker stops
+sending heartbeats is given to another worker, up to ``retries`` times, then
+flown by the coordinator. ``local_workers`` forks workers on the
+coordinator's machine, which inherit its models; with the queue on a local
+disk that is also how to try the whole pipeline on one host.
+
+Queue layout::
+
+    campaign.json                 seed, export options, descents, fingerprint
+    pending/000012.json           job 12: sample indices and attempt
+    running/000012@worker.json    claimed by "worker", touched as heartbeat
+    results/000012@worker.json.gz batch of results of job 12
+    closed                        all jobs are in, workers stop
+"""
+
+import gzip
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import socket
+import threading
+from dataclasses import is_dataclass
+from time import perf_counter, process_time, sleep, time
+
+import numpy as np
+
+from .campaign import _finish, _prepare, _write, fly
+from .parallel import default_workers
+from .shared_environment import SharedEnvironmentProfiles
+
+QUEUE_DIRECTORIES = ("pending", "running", "results")
+# worker state entries set by the coordinator, the same on every worker
+CAMPAIGN_SETTINGS = ("entropy", "export", "descents", "payload_separation")
+# worker state entries built by each worker, compared through their fingerprint
+CAMPAIGN_MODELS = ("environment", "rocket", "flight", "outputs", "payload", "air_brakes", "terrain")
+# model attributes that differ between identical campaigns: the nominal
+# object (its values are in the model's parameters) and the last draw
+FINGERPRINT_SKIP = ("obj", "last_rnd_dict")
+
+
+def _json_default(value):
+    """Arrays and NumPy scalars of the results, as lists and numbers."""
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _write_atomic(filename, data, compress=False):
+    """Writes ``data`` (JSON serializable) so that readers never see a
+    partial file."""
+    temporary = f"{filename}.{os.getpid()}.tmp"
+    opener = gzip.open if compress else open
+    with opener(temporary, "wt", encoding="utf-8") as file:
+        json.dump(data, file, default=_json_default)
+    os.replace(temporary, filename)
+
+
+def _read(filename):
+    opener = gzip.open if filename.endswith(".gz") else open
+    with opener(filename, "rt", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def _job_name(job):
+    return f"{job:06d}"
+
+
+def _split(filename):
+    """Job number and worker of a running or results file name."""
+    job, worker = os.path.basename(filename).split(".json")[0].split("@", 1)
+    return int(job), worker
+
+
+class JobQueue:
+    """Jobs of sample indices in a directory shared by a coordinator and
+    its workers.
+
+    Claiming renames the job file, which only one worker can do, so no lock
+    is needed. Files are written to a temporary name and renamed.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, *parts):
+        return os.path.join(self.directory, *parts)
+
+    @classmethod
+    def create(cls, directory, campaign, jobs):
+        """New queue in ``directory``, emptied first, with the ``campaign``
+        settings and one pending job per list of indices of ``jobs``."""
+        queue = cls(directory)
+        for name in (*QUEUE_DIRECTORIES, "closed", "campaign.json"):
+            path = queue._path(name)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
+        for name in QUEUE_DIRECTORIES:
+            os.makedirs(queue._path(name))
+        _write_atomic(queue._path("campaign.json"), campaign)
+        for job, indices in enumerate(jobs):
+            queue.submit(job, indices)
+        return queue
+
+    @property
+    def campaign(self):
+        """Campaign settings given by the coordinator."""
+        return _read(self._path("campaign.json"))
+
+    @property
+    def closed(self):
+        """True once the coordinator has all the results."""
+        return os.path.exists(self._path("closed"))
+
+    def close(self):
+        _write_atomic(self._path("closed"), time())
+
+    def submit(self, job, indices, attempt=0):
+        _write_atomic(
+            self._path("pending", f"{_job_name(job)}.json"),
+            {"job": job, "indices": list(indices), "attempt": attempt},
+        )
+
+    def claim(self, worker):
+        """Claims the first pending job for ``worker``. Returns the job (a
+        dict with its "indices"), or None if none is pending."""
+        for name in sorted(os.listdir(self._path("pending"))):
+            if not name.endswith(".json"):
+                continue
+            running = self._path("running", f"{name[:-5]}@{worker}.json")
+            try:
+                os.rename(self._path("pending", name), running)
+            except FileNotFoundError:
+                continue  # claimed by another worker meanwhile
+            os.utime(running)
+            return _read(running)
+        return None
+
+    def heartbeat(self, job, worker):
+        """Marks ``job`` as alive. Returns False if it was taken back."""
+        try:
+            os.utime(self._path("running", f"{_job_name(job)}@{worker}.json"))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def complete(self, job, worker, batch):
+        """Returns the ``batch`` of results of ``job``."""
+        _write_atomic(
+            self._path("results", f"{_job_name(job)}@{worker}.json.gz"), batch, compress=True
+        )
+        try:
+            os.remove(self._path("running", f"{_job_name(job)}@{worker}.json"))
+        except FileNotFoundError:
+            pass  # taken back meanwhile, the first batch of the job is kept
+
+    def batches(self):
+        """Pops the returned batches."""
+        results = self._path("results")
+        for name in sorted(os.listdir(results)):
+            if name.endswith(".json.gz"):
+                batch = _read(os.path.join(results, name))
+                os.remove(os.path.join(results, name))
+                yield batch
+
+    def stale(self, timeout):
+        """Takes back the jobs without heartbeat for ``timeout`` seconds.
+        Returns them (dicts as from ``claim``) with their worker."""
+        taken = []
+        now = time()
+        for name in sorted(os.listdir(self._path("running"))):
+            path = self._path("running", name)
+            try:
+                if now - os.path.getmtime(path) < timeout:
+                    continue
+                job = _read(path)
+                os.remove(path)
+            except FileNotFoundError:
+                continue  # completed meanwhile
+            taken.append((job, _split(name)[1]))
+        return taken
+
+    def discard(self, job):
+        """Removes ``job`` wherever it is, once its results are in."""
+        name = _job_name(job)
+        for directory in ("pending", "running"):
+            for file in os.listdir(self._path(directory)):
+                if file.startswith(name):
+                    try:
+                        os.remove(self._path(directory, file))
+                    except FileNotFoundError:
+                        pass
+
+
+def _describe(value):
+    """JSON description of a campaign model for its fingerprint: the
+    parameters of stochastic models and configurations, arrays (tabulated
+    Functions, shared profiles, climatology and terrain grids) by digest and
+    functions by name. Other objects, such as the nominal rocketpy objects
+    whose values the models hold, are named by their type."""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest()
+    if isinstance(value, SharedEnvironmentProfiles):
+        # the block's name is this machine's, its profiles are the forecast
+        handle = {key: item for key, item in value.handle.items() if key != "name"}
+        return {"handle": _describe(handle), "data": _describe(value.data)}
+    if isinstance(value, dict):
+        return {str(key): _describe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)) or hasattr(value, "get_components"):
+        return [_describe(item) for item in value]
+    if isinstance(value, (set, frozenset)):
+        return sorted((_describe(item) for item in value), key=repr)
+    if hasattr(value, "last_rnd_dict") or is_dataclass(value) and not isinstance(value, type):
+        return {
+            "type": type(value).__name__,
+            **{
+                key: _describe(item)
+                for key, item in vars(value).items()
+                if not key.startswith("_") and key not in FINGERPRINT_SKIP
+            },
+        }
+    source = getattr(value, "source", None)  # rocketpy Function
+    if isinstance(source, np.ndarray) or callable(source):
+        return {"type": type(value).__name__, "source": _describe(source)}
+    data = getattr(value, "data", None)  # ProfileBank, ElevationGrid
+    if isinstance(data, np.ndarray):
+        return {"type": type(value).__name__, "data": _describe(data)}
+    if callable(value):
+        return getattr(value, "__qualname__", type(value).__name__)
+    return type(value).__name__
+
+
+def campaign_fingerprint(state):
+    """Digest of each model of a worker ``state`` (see ``CAMPAIGN_MODELS``),
+    the same on every machine that built the same campaign."""
+    monte_carlo = state["monte_carlo"]
+    models = {
+        "environment": monte_carlo.environment,
+        "rocket": monte_carlo.rocket,
+        "flight": monte_carlo.flight,
+        "outputs": [monte_carlo.export_list, sorted(monte_carlo.data_collector or {})],
+        "payload": state.get("payload"),
+        "air_brakes": state.get("air_brakes"),
+        "terrain": state.get("terrain"),
+    }
+    return {
+        name: hashlib.sha256(
+            json.dumps(_describe(model), sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        for name, model in models.items()
+    }
+
+
+def worker_name():
+    """Default worker name: host and process."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _fly_job(queue, state, job, worker, workers, heartbeat):
+    """Flies the samples of ``job`` on ``workers`` cores while a thread
+    sends its heartbeats. Returns its batch of results."""
+    alive = threading.Event()
+
+    def beat():
+        while not alive.wait(heartbeat):
+            queue.heartbeat(job["job"], worker)
+
+    if queue is not None:
+        threading.Thread(target=beat, daemon=True).start()
+    start_wall, start_cpu = perf_counter(), process_time()
+    try:
+        results = list(fly(state, job["indices"], workers))
+    finally:
+        alive.set()
+    return {
+        "job": job["job"],
+        "worker": worker,
+        "indices": job["indices"],
+        "wall_time": perf_counter() - start_wall,
+        "cpu_time": process_time() - start_cpu,
+        "results": results,
+    }
+
+
+def _serve(queue, state, worker, workers, poll):
+    """Claims and flies jobs until the queue is closed. Returns the number
+    of jobs flown."""
+    jobs = 0
+    while not queue.closed:
+        job = queue.claim(worker)
+        if job is None:
+            sleep(poll)
+            continue
+        campaign = queue.campaign
+        state.update({name: campaign[name] for name in CAMPAIGN_SETTINGS})
+        batch = _fly_job(queue, state, job, worker, workers, campaign["heartbeat"])
+        queue.complete(job["job"], worker, batch)
+        jobs += 1
+    return jobs
+
+
+def run_worker(
+    directory,
+    monte_carlo,
+    payload=None,
+    air_brakes=None,
+    flight_data=None,
+    terrain=None,
+    workers=None,
+    name=None,
+    poll=1.0,
+):
+    """Flies jobs of the queue in ``directory`` until its coordinator has
+    all the results. Raises ValueError, before claiming any job, if the
+    campaign's models differ from the coordinator's (see
+    ``campaign_fingerprint``).
+
+    Parameters
+    ----------
+    directory : str
+        Queue directory of the coordinator's ``run_distributed``.
+    monte_carlo : MonteCarlo
+        The campaign, built as on the coordinator: same stochastic models,
+        export list and data collector.
+    payload, air_brakes, flight_data, terrain : optional
+        As given to the coordinator.
+    workers : int, optional
+        Cores used for each job, defaults to all.
+    name : str, optional
+        Worker name in the throughput report, defaults to ``worker_name()``.
+    poll : float, optional
+        Seconds between looks at the queue while it is empty.
+
+    Returns
+    -------
+    int
+        Number of jobs flown.
+    """
+    queue = JobQueue(directory)
+    while not os.path.exists(queue._path("campaign.json")):
+        sleep(poll)  # the coordinator has not started yet
+    # the campaign settings come with each job
+    state = {
+        "monte_carlo": monte_carlo,
+        "flight_data": flight_data,
+        "payload": payload,
+        "air_brakes": air_brakes,
+        "terrain": terrain,
+    }
+    name = name or worker_name()
+    expected, fingerprint = queue.campaign["fingerprint"], campaign_fingerprint(state)
+    different = [model for model in CAMPAIGN_MODELS if fingerprint[model] != expected[model]]
+    if different:
+        raise ValueError(
+            f"Worker {name} built another campaign than the coordinator of {directory} "
+            f"(different {', '.join(different)}). Answer the script's questions as on the "
+            "coordinator, with the same data files."
+        )
+    print(f"Worker {name} flying jobs of {directory} on {workers or default_workers()} core(s)")
+    jobs = _serve(queue, state, name, workers, poll)
+    print(f"Worker {name} done: {jobs} job(s)")
+    return jobs
+
+
+def _start_local_workers(queue, state, count, poll):
+    """Forks ``count`` one-core workers, which inherit ``state``."""
+    if count and "fork" not in multiprocessing.get_all_start_methods():
+        print("Local workers need fork, none started")
+        return []
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(
+            target=_serve, args=(queue, state, f"{socket.gethostname()}-local{i}", 1, poll)
+        )
+        for i in range(count)
+    ]
+    for process in processes:
+        process.start()
+    return processes
+
+
+def _collect(queue, state, jobs, timeout, retries, poll, throughput):
+    """Yields the results of ``jobs`` in order as their batches come in,
+    giving lost jobs to other workers and flying the ones lost more than
+    ``retries`` times. Each batch is booked in ``throughput``."""
+    received = {}
+    for job in range(len(jobs)):
+        while job not in received:
+            arrived = False
+            for batch in queue.batches():
+                if batch["job"] < job or batch["job"] in received:
+                    continue  # late batch of a job that was taken back
+                received[batch["job"]] = batch
+                queue.discard(batch["job"])
+                _book(throughput, batch)
+                arrived = True
+            for lost, worker in queue.stale(timeout):
+                if lost["job"] in received:
+                    continue
+                throughput.setdefault(worker, _new_entry())["lost"] += 1
+                if lost["attempt"] < retries:
+                    print(f"Job {lost['job']} lost by {worker}, given back to the queue")
+                    queue.submit(lost["job"], lost["indices"], lost["attempt"] + 1)
+                else:
+                    print(f"Job {lost['job']} lost {lost['attempt'] + 1} times, flying it here")
+                    batch = _fly_job(None, state, lost, "coordinator", None, None)
+                    received[lost["job"]] = batch
+                    _book(throughput, batch)
+            if job not in received and not arrived:
+                sleep(poll)
+        batch = received.pop(job)
+        for result in batch["results"]:
+            if "sample" in result:
+                result["sample"]["worker"] = batch["worker"]
+            if "flight_data" in result:
+                result["flight_data"] = {
+                    name: np.asarray(values) for name, values in result["flight_data"].items()
+                }
+            yield result
+
+
+def _new_entry():
+    return {"jobs": 0, "samples": 0, "busy_time": 0.0, "lost": 0, "peak_rss_mb": 0.0}
+
+
+def _book(throughput, batch):
+    entry = throughput.setdefault(batch["worker"], _new_entry())
+    entry["jobs"] += 1
+    entry["samples"] += len(batch["results"])
+    entry["busy_time"] += batch["wall_time"]
+    # of the worker's busiest process
+    entry["peak_rss_mb"] = max(
+        [entry["peak_rss_mb"]]
+        + [result["sample"]["peak_rss_mb"] for result in batch["results"] if "sample" in result]
+    )
+
+
+def print_throughput(throughput, wall_time):
+    """Prints the jobs, samples, samples per second and peak memory of the
+    busiest process of each worker."""
+    print(
+        f"{'worker':<32}{'jobs':>6}{'samples':>9}{'busy [s]':>10}{'samples/s':>11}{'lost':>6}"
+        f"{'peak [MB]':>11}"
+    )
+    for worker, entry in sorted(throughput.items()):
+        rate = entry["samples"] / entry["busy_time"] if entry["busy_time"] else 0.0
+        print(
+            f"{worker:<32}{entry['jobs']:>6}{entry['samples']:>9}{entry['busy_time']:>10.1f}"
+            f"{rate:>11.2f}{entry['lost']:>6}{entry['peak_rss_mb']:>11.0f}"
+        )
+    samples = sum(entry["samples"] for entry in throughput.values())
+    print(f"campaign: {samples / wall_time if wall_time else 0.0:.2f} samples/s")
+
+
+def run_distributed(
+    monte_carlo,
+    number_of_simulations,
+    directory,
+    job_size=100,
+    local_workers=0,
+    timeout=120.0,
+    retries=2,
+    poll=0.5,
+    append=False,
+    seed=None,
+    profiler=None,
+    flight_data=None,
+    statistics=None,
+    static_margin=None,
+    descents=None,
+    payload=None,
+    payload_separation="apogee",
+    air_brakes=None,
+    memory_budget=None,
+    terrain=None,
+    **kwargs,
+):
+    """Runs a MonteCarlo campaign on the workers of a job queue.
+
+    Parameters
+    ----------
+    monte_carlo, number_of_simulations : MonteCarlo, int
+        As in ``campaign.run_parallel``.
+    directory : str
+        Queue directory, shared with the workers (see ``run_worker``). Its
+        previous jobs and results are deleted.
+    job_size : int, optional
+        Samples per job (ascents with ``descents``).
+    local_workers : int, optional
+        One-core workers forked on this machine, next to the remote ones.
+    timeout : float, optional
+        Seconds without heartbeat after which a job is lost. Workers send
+        one every quarter of it.
+    retries : int, optional
+        Times a lost job is given back to the queue before this process
+        flies it.
+    poll : float, optional
+        Seconds between looks at the queue while waiting.
+    append, seed, profiler, flight_data, statistics, static_margin, descents,
+    payload, payload_separation, air_brakes, memory_budget, terrain, kwargs : optional
+        As in ``campaign.run_parallel``. Each sample's profile also names
+        its "worker". The memory budget is checked against this process and
+        the local workers.
+
+    Returns
+    -------
+    list[tuple[int, str]] or int
+        Index and error message of each failed sample, or with a
+        ``memory_budget`` their number.
+    """
+    start_wall, start_cpu = time(), process_time()
+    state, indices, unstable = _prepare(
+        monte_carlo,
+        number_of_simulations,
+        append,
+        seed,
+        flight_data,
+        statistics,
+        static_margin,
+        descents,
+        payload,
+        payload_separation,
+        air_brakes,
+        kwargs,
+        profiler,
+        memory_budget,
+        terrain,
+    )
+    jobs = [indices[start : start + job_size] for start in range(0, len(indices), job_size)]
+    campaign = {name: state[name] for name in CAMPAIGN_SETTINGS}
+    campaign["heartbeat"] = timeout / 4
+    campaign["fingerprint"] = campaign_fingerprint(state)
+    queue = JobQueue.create(directory, campaign, jobs)
+    print(
+        f"Starting Monte Carlo analysis: {len(jobs)} jobs in {directory}, "
+        f"{local_workers} local worker(s)"
+    )
+    processes = _start_local_workers(queue, state, local_workers, poll)
+    throughput = {}
+    try:
+        results = _collect(queue, state, jobs, timeout, retries, poll, throughput)
+        completed, failures, worker_cpu_time, peaks = _write(
+            monte_carlo,
+            results,
+            append,
+            unstable,
+            profiler,
+            flight_data,
+            statistics,
+            memory_budget,
+        )
+    finally:
+        queue.close()
+        for process in processes:
+            process.join()
+    wall_time = time() - start_wall
+    # worker CPU time is not seen by this process, sum the samples' instead
+    cpu_time = process_time() - start_cpu + worker_cpu_time
+    _finish(
+        monte_carlo,
+        number_of_simulations,
+        wall_time,
+        cpu_time,
+        completed,
+        failures,
+        flight_data,
+        statistics,
+        peaks,
+        memory_budget,
+    )
+    print_throughput(throughput, wall_time)
+    return failures
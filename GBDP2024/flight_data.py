@@ -0,0 +1,346 @@
+"""Flight time series resampled onto one time grid and saved as CSV, NPZ or
+Parquet.
+
+``resample`` evaluates any number of Flight attributes on a common grid, one
+vectorized call per attribute, and returns plain columns. ``save_columns``
+writes them in the format given by the file extension. ``FlightDataExport``
+does the same for every flight of a Monte Carlo campaign and stores them all
+in one long-format columnar file, with a ``sample`` column. A large campaign
+can spill its flights to a ``TrajectoryStore`` on disk as they arrive instead
+of keeping them in memory until the file is saved.
+"""
+
+import json
+import os
+
+import numpy as np
+
+FORMATS = (".csv", ".npz", ".parquet")
+
+# rows written at a time to .csv and .parquet files
+SAVE_CHUNK = 1 << 18
+
+
+def time_grid(flight, time_step=None, start=None, end=None):
+    """Times ``start``, ``start + time_step``, ... up to ``end`` (inclusive),
+    defaulting to the whole flight. Without ``time_step`` the solver time
+    steps are used."""
+    start = flight.t_initial if start is None else start
+    end = flight.t_final if end is None else end
+    if time_step is None:
+        times = np.asarray(flight.time, dtype=float)
+        return times[(times >= start) & (times <= end)]
+    times = np.arange(start, end, time_step)
+    return np.append(times, end) if end - times[-1] > 1e-9 else times
+
+
+def resample(flight, attributes, time_step=None, times=None):
+    """Evaluates Flight attributes on one time grid.
+
+    Parameters
+    ----------
+    flight : Flight
+        Integrated flight.
+    attributes : list[str]
+        Flight attributes that are Functions of time, e.g. "mach_number".
+    time_step : float, optional
+        Grid step in seconds. Without it the solver time steps are used.
+    times : array, optional
+        Explicit time grid, overrides ``time_step``.
+
+    Returns
+    -------
+    dict
+        "time" and one column per attribute, as float arrays.
+    """
+    times = time_grid(flight, time_step) if times is None else np.asarray(times, dtype=float)
+    columns = {"time": times}
+    for attribute in attributes:
+        function = getattr(flight, attribute, None)
+        if not callable(getattr(function, "get_value", None)):
+            raise AttributeError(f"'{attribute}' is not a Flight Function of time.")
+        columns[attribute] = np.asarray(function.get_value(times), dtype=float)
+    return columns
+
+
+def save_columns(columns, filename):
+    """Writes equal length columns to ``filename``. The format is given by
+    its extension: .csv, .npz (compressed) or .parquet (needs pyarrow).
+    Rows are written in chunks, so memory-mapped columns are never loaded
+    whole."""
+    extension = os.path.splitext(filename)[1].lower()
+    rows = len(next(iter(columns.values()), []))
+    chunks = range(0, max(rows, 1), SAVE_CHUNK)
+    if extension == ".csv":
+        with open(filename, "w", encoding="utf-8") as file:
+            file.write(",".join(columns) + "\n")
+            for start in chunks:
+                block = [column[start : start + SAVE_CHUNK] for column in columns.values()]
+                np.savetxt(file, np.column_stack(block), fmt="%.6g", delimiter=",")
+    elif extension == ".npz":
+        np.savez_compressed(filename, **columns)
+    elif extension == ".parquet":
+        try:
+            import pyarrow  # pylint: disable=import-outside-toplevel
+            import pyarrow.parquet  # pylint: disable=import-outside-toplevel
+        except ImportError as error:
+            raise ImportError(
+                "Saving .parquet files requires pyarrow, use .npz or .csv otherwise."
+            ) from error
+        writer = None
+        try:
+            for start in chunks:
+                table = pyarrow.table(
+                    {
+                        name: np.asarray(column[start : start + SAVE_CHUNK])
+                        for name, column in columns.items()
+                    }
+                )
+                if writer is None:
+                    writer = pyarrow.parquet.ParquetWriter(filename, table.schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        raise ValueError(f"Unknown extension '{extension}', use one of {FORMATS}.")
+
+
+def load_columns(filename):
+    """Reads a file written by ``save_columns`` back into a dict of arrays."""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == ".csv":
+        data = np.genfromtxt(filename, delimiter=",", names=True)
+        return {name: data[name] for name in data.dtype.names}
+    if extension == ".npz":
+        with np.load(filename) as data:
+            return {name: data[name] for name in data.files}
+    if extension == ".parquet":
+        import pyarrow.parquet  # pylint: disable=import-outside-toplevel
+
+        table = pyarrow.parquet.read_table(filename)
+        return {name: table[name].to_numpy() for name in table.column_names}
+    raise ValueError(f"Unknown extension '{extension}', use one of {FORMATS}.")
+
+
+def export_flight_data(flight, attributes, filename, time_step=None):
+    """Resamples Flight attributes and saves them, replacing one
+    ``Flight.export_data`` call per file. Returns the columns."""
+    columns = resample(flight, attributes, time_step)
+    save_columns(columns, filename)
+    return columns
+
+
+class TrajectoryStore:
+    """Flights appended to ``{path}.bin`` as rows of a sample index and
+    float64 columns, read back memory-mapped.
+
+    ``{path}.json`` holds the column names and the first row and number of
+    rows of each sample, so one flight is read without scanning the others.
+    Only this index is kept in memory while flights are appended.
+
+    Parameters
+    ----------
+    path : str
+        Store path, without extension.
+    names : list[str], optional
+        Columns of a new store, e.g. ["time", "altitude"]. Without them the
+        existing store at ``path`` is opened for reading.
+    """
+
+    def __init__(self, path, names=None):
+        self.path = path
+        if names is None:
+            with open(f"{path}.json", "r", encoding="utf-8") as file:
+                self.index = json.load(file)
+            self._file = None
+        else:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.index = {"names": list(names), "samples": [], "starts": [], "rows": []}
+            self._file = open(f"{path}.bin", "wb")  # pylint: disable=consider-using-with
+            self.flush()
+        self.dtype = np.dtype([("sample", "<i8")] + [(name, "<f8") for name in self.names])
+        self._data = None
+
+    @property
+    def names(self):
+        """Names of the float columns."""
+        return self.index["names"]
+
+    def __len__(self):
+        return len(self.index["samples"])
+
+    @property
+    def row_count(self):
+        """Number of rows of all flights."""
+        return self.index["starts"][-1] + self.index["rows"][-1] if len(self) else 0
+
+    def append(self, sample, columns):
+        """Writes the columns of ``sample`` after the stored flights."""
+        block = np.empty(len(columns["time"]), dtype=self.dtype)
+        block["sample"] = sample
+        for name in self.names:
+            block[name] = columns[name]
+        self.index["starts"].append(self.row_count)
+        self.index["samples"].append(int(sample))
+        self.index["rows"].append(len(block))
+        block.tofile(self._file)
+
+    def flush(self):
+        """Writes the appended rows and the index to disk."""
+        if self._file is not None:
+            self._file.flush()
+        with open(f"{self.path}.json", "w", encoding="utf-8") as file:
+            json.dump(self.index, file)
+
+    @property
+    def data(self):
+        """All rows, memory-mapped, as a structured array."""
+        if self._file is not None:
+            self._file.flush()
+        if self._data is None or len(self._data) != self.row_count:
+            self._data = (
+                np.memmap(f"{self.path}.bin", dtype=self.dtype, mode="r", shape=(self.row_count,))
+                if self.row_count
+                else np.empty(0, dtype=self.dtype)
+            )
+        return self._data
+
+    def flight(self, sample):
+        """Columns of ``sample``, views of the memory map."""
+        position = self.index["samples"].index(sample)
+        start = self.index["starts"][position]
+        rows = self.data[start : start + self.index["rows"][position]]
+        return {name: rows[name] for name in self.names}
+
+    def columns(self):
+        """All flights as long-format columns, ordered by sample. They are
+        views of the memory map when the flights were appended in order."""
+        data = self.data
+        samples = self.index["samples"]
+        if any(later < earlier for earlier, later in zip(samples, samples[1:])):
+            order = np.argsort(samples, kind="stable")
+            data = np.concatenate(
+                [
+                    data[self.index["starts"][i] : self.index["starts"][i] + self.index["rows"][i]]
+                    for i in order
+                ]
+            )
+        return {name: data[name] for name in ("sample", *self.names)}
+
+    def close(self):
+        """Saves the index and releases the file and memory map."""
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+        mapping = getattr(self._data, "_mmap", None)
+        self._data = None
+        if mapping is not None:
+            mapping.close()
+
+
+class FlightDataExport:
+    """Collects the resampled time series of every flight of a campaign into
+    one long-format file.
+
+    Parameters
+    ----------
+    attributes : list[str]
+        Flight attributes to export.
+    filename : str
+        Output file, .csv, .npz or .parquet.
+    time_step : float, optional
+        Grid step in seconds, default 0.1. Each flight is resampled from its
+        start to its own final time.
+
+    Use ``data_collector`` with ``MonteCarlo.simulate``, or pass the object to
+    ``campaign.run_parallel`` which resamples each flight in its worker. The
+    flights are kept in memory until ``save``, unless ``spill`` moved them to
+    a ``TrajectoryStore``.
+    """
+
+    def __init__(self, attributes, filename, time_step=0.1):
+        self.attributes = list(attributes)
+        self.filename = filename
+        self.time_step = time_step
+        self.store = None
+        self._flights = {}
+
+    def __len__(self):
+        return len(self.store) if self.store is not None else len(self._flights)
+
+    def resample(self, flight):
+        return resample(flight, self.attributes, self.time_step)
+
+    def spill(self, path=None):
+        """Moves the stored flights to a new ``TrajectoryStore`` at ``path``
+        (default: the output file name with a .store extension), where the
+        next ones are appended too."""
+        if self.store is not None:
+            return self.store
+        path = path or f"{os.path.splitext(self.filename)[0]}.store"
+        self.store = TrajectoryStore(path, ["time", *self.attributes])
+        for sample in sorted(self._flights):
+            self.store.append(sample, self._flights[sample])
+        self._flights = {}
+        return self.store
+
+    def add(self, sample, columns):
+        """Stores the columns of ``sample``."""
+        if self.store is not None:
+            self.store.append(sample, columns)
+        else:
+            self._flights[sample] = columns
+
+    def load(self, filename=None):
+        """Adds the flights stored in ``filename`` (default: the one given at
+        creation) if it exists, e.g. before appending to a campaign. Returns
+        the number of flights added."""
+        filename = filename or self.filename
+        if not os.path.exists(filename):
+            return 0
+        columns = load_columns(filename)
+        samples, starts = np.unique(columns["sample"], return_index=True)
+        ends = np.append(starts[1:], len(columns["sample"]))
+        for sample, start, end in zip(samples, starts, ends):
+            self.add(int(sample), {name: columns[name][start:end] for name in ["time", *self.attributes]})
+        return len(samples)
+
+    def data_collector(self):
+        """``MonteCarlo`` data_collector entry that stores each flight's time
+        series and exports its number of rows."""
+
+        def collect(flight):
+            columns = self.resample(flight)
+            self.add(len(self), columns)
+            return len(columns["time"])
+
+        return {"flight_data_rows": collect}
+
+    def columns(self):
+        """All stored flights as long-format columns, ordered by sample."""
+        if self.store is not None:
+            return self.store.columns()
+        samples = sorted(self._flights)
+        flights = [self._flights[sample] for sample in samples]
+        columns = {
+            "sample": np.concatenate(
+                [np.full(len(flight["time"]), sample) for sample, flight in zip(samples, flights)]
+                or [np.empty(0, dtype=int)]
+            )
+        }
+        for name in ["time", *self.attributes]:
+            columns[name] = np.concatenate(
+                [flight[name] for flight in flights] or [np.empty(0)]
+            )
+        return columns
+
+    def save(self, filename=None):
+        """Writes all stored flights to ``filename`` (default: the one given
+        at creation)."""
+        save_columns(self.columns(), filename or self.filename)
+        if self.store is not None:
+            self.store.flush()
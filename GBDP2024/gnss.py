@@ -0,0 +1,503 @@
+"""Flown GNSS tracks against simulated trajectories and Monte Carlo impacts.
+
+The flight computers log GNSS fixes: time, latitude, longitude and number of
+satellites in data/rockets/astg, camoes and genesis, with the barometric
+height above the pad in the altimeter log next to them, and the GPS
+altitude in the AltOS logs of data/rockets/prometheus. rocketpy flies in a
+flat frame about the launch site (x east, y north, z above sea level), and
+``Flight.export_kml`` only writes the simulated side.
+
+``geodetic_to_enu`` and ``enu_to_geodetic`` convert whole tracks at once
+between WGS84 coordinates and a local east/north/up frame, through
+Earth-centered coordinates, so a flown track and a simulated trajectory are
+compared in the same frame (``compare_tracks``): the error along the flight,
+the apogee, the drift from the pad and the landing point error.
+``export_tracks`` writes any number of tracks to one KML or CSV file, and
+``check_campaigns`` places the observed landing in the impact dispersion of
+whole Monte Carlo campaigns: the sigma ellipse of ``RunningStatistics`` it
+falls in, and the share of samples landing closer to the mean.
+
+Usage, from the repository root::
+
+    python -m GBDP2024.gnss data/rockets/astg/gnss_halcyon.csv \\
+        --altimeter data/rockets/astg/altimeter_halcyon.csv --site Hybrid \\
+        --campaigns Hybrid/MonteCarlo/MonteCarlo_TestDispersion --output halcyon.kml
+"""
+
+import argparse
+import csv
+import os
+from dataclasses import dataclass
+from itertools import cycle
+
+import numpy as np
+
+from .compare import CampaignOutputs
+from .flight_data import load_columns, resample
+
+# WGS84 ellipsoid
+SEMI_MAJOR_AXIS = 6378137.0
+FLATTENING = 1 / 298.257223563
+ECCENTRICITY_SQUARED = FLATTENING * (2 - FLATTENING)
+
+# KML colors (aabbggrr) given to the tracks in turn
+KML_COLORS = ("ff0000ff", "ffff0000", "ff00ffff", "ff00ff00", "ffff00ff", "ffffff00")
+
+
+def geodetic_to_ecef(latitude, longitude, altitude):
+    """Earth-centered, Earth-fixed x, y, z (m) of WGS84 coordinates
+    (degrees, meters above the ellipsoid), for arrays of any shape."""
+    latitude, longitude = np.radians(latitude), np.radians(longitude)
+    altitude = np.asarray(altitude, dtype=float)
+    sin_latitude, cos_latitude = np.sin(latitude), np.cos(latitude)
+    normal = SEMI_MAJOR_AXIS / np.sqrt(1 - ECCENTRICITY_SQUARED * sin_latitude**2)
+    return (
+        (normal + altitude) * cos_latitude * np.cos(longitude),
+        (normal + altitude) * cos_latitude * np.sin(longitude),
+        (normal * (1 - ECCENTRICITY_SQUARED) + altitude) * sin_latitude,
+    )
+
+
+def ecef_to_geodetic(x, y, z, iterations=5):
+    """WGS84 latitude, longitude (degrees) and altitude (m) of ECEF points.
+    The latitude is refined by fixed-point iterations, a few are enough to
+    reach millimeters anywhere near the surface."""
+    x, y, z = (np.asarray(value, dtype=float) for value in (x, y, z))
+    distance = np.hypot(x, y)
+    latitude = np.arctan2(z, distance * (1 - ECCENTRICITY_SQUARED))
+    for _ in range(iterations):
+        normal = SEMI_MAJOR_AXIS / np.sqrt(1 - ECCENTRICITY_SQUARED * np.sin(latitude) ** 2)
+        altitude = distance / np.cos(latitude) - normal
+        latitude = np.arctan2(
+            z, distance * (1 - ECCENTRICITY_SQUARED * normal / (normal + altitude))
+        )
+    normal = SEMI_MAJOR_AXIS / np.sqrt(1 - ECCENTRICITY_SQUARED * np.sin(latitude) ** 2)
+    altitude = distance / np.cos(latitude) - normal
+    return np.degrees(latitude), np.degrees(np.arctan2(y, x)), altitude
+
+
+def _rotation(origin):
+    """Rows: east, north and up unit vectors at ``origin``, in ECEF."""
+    latitude, longitude = np.radians(origin[0]), np.radians(origin[1])
+    return np.array(
+        [
+            [-np.sin(longitude), np.cos(longitude), 0.0],
+            [
+                -np.sin(latitude) * np.cos(longitude),
+                -np.sin(latitude) * np.sin(longitude),
+                np.cos(latitude),
+            ],
+            [
+                np.cos(latitude) * np.cos(longitude),
+                np.cos(latitude) * np.sin(longitude),
+                np.sin(latitude),
+            ],
+        ]
+    )
+
+
+def geodetic_to_enu(latitude, longitude, altitude, origin):
+    """East, north and up (m) of WGS84 coordinates in the local tangent
+    frame at ``origin`` (latitude, longitude, altitude)."""
+    position = np.stack(np.broadcast_arrays(*geodetic_to_ecef(latitude, longitude, altitude)))
+    offset = position - np.reshape(geodetic_to_ecef(*origin), (3,) + (1,) * (position.ndim - 1))
+    return tuple(np.tensordot(_rotation(origin), offset, axes=1))
+
+
+def enu_to_geodetic(east, north, up, origin):
+    """WGS84 latitude, longitude (degrees) and altitude (m) of points east,
+    north and up of ``origin``, inverse of ``geodetic_to_enu``."""
+    axes = (np.asarray(axis, dtype=float) for axis in (east, north, up))
+    offset = np.stack(np.broadcast_arrays(*axes))
+    position = np.tensordot(_rotation(origin).T, offset, axes=1)
+    position += np.reshape(geodetic_to_ecef(*origin), (3,) + (1,) * (position.ndim - 1))
+    return ecef_to_geodetic(*position)
+
+
+@dataclass(frozen=True, eq=False)
+class Track:
+    """Positions of one flight over time. ``time`` counts from liftoff (or
+    ignition) in seconds, ``altitude`` is above sea level in meters, NaN
+    where it is not known."""
+
+    name: str
+    time: np.ndarray
+    latitude: np.ndarray
+    longitude: np.ndarray
+    altitude: np.ndarray
+
+    def __len__(self):
+        return len(self.time)
+
+    def enu(self, origin):
+        """East, north and up (m) of the track about ``origin``. Without
+        altitude the horizontal position is taken at the origin's altitude
+        and up is NaN."""
+        known = np.isfinite(self.altitude)
+        altitude = np.where(known, self.altitude, origin[2])
+        east, north, up = geodetic_to_enu(self.latitude, self.longitude, altitude, origin)
+        return east, north, np.where(known, up, np.nan)
+
+
+def _distinct(time, latitude, longitude, altitude, name):
+    """Track of the fixes that differ from the one before, loggers repeat the
+    last fix until the next one."""
+    unknown = np.isnan(altitude)
+    keep = np.ones(len(time), dtype=bool)
+    keep[1:] = (
+        (np.diff(latitude) != 0)
+        | (np.diff(longitude) != 0)
+        | ((np.diff(altitude) != 0) & ~(unknown[1:] & unknown[:-1]))
+    )
+    return Track(name, time[keep], latitude[keep], longitude[keep], altitude[keep])
+
+
+def read_gnss_csv(filename, altimeter=None, elevation=0.0, min_satellites=4, name=None):
+    """Track of a GNSS log with ts, latitude, longitude and satellites
+    columns.
+
+    Parameters
+    ----------
+    filename : str
+        GNSS log, e.g. data/rockets/astg/gnss_halcyon.csv.
+    altimeter : str, optional
+        Altimeter log of the same flight, with ts and filtered_altitude_AGL
+        columns. Its heights, interpolated at the fix times and added to
+        ``elevation``, are the altitudes of the track. Without it they are
+        NaN.
+    elevation : float, optional
+        Pad elevation above sea level, in meters.
+    min_satellites : int, optional
+        Fixes with fewer satellites are dropped, as are null positions.
+    name : str, optional
+        Track name, default: the file name.
+    """
+    columns = load_columns(filename)
+    valid = (
+        (columns["satellites"] >= min_satellites)
+        & (columns["latitude"] != 0)
+        & (columns["longitude"] != 0)
+        & np.isfinite(columns["latitude"])
+        & np.isfinite(columns["longitude"])
+    )
+    time = columns["ts"][valid]
+    altitude = np.full(len(time), np.nan)
+    if altimeter is not None:
+        heights = load_columns(altimeter)
+        altitude = elevation + np.interp(
+            time, heights["ts"], heights["filtered_altitude_AGL"], left=np.nan, right=np.nan
+        )
+    return _distinct(
+        time,
+        columns["latitude"][valid],
+        columns["longitude"][valid],
+        altitude,
+        name or os.path.splitext(os.path.basename(filename))[0],
+    )
+
+
+def read_altos_track(filename, min_satellites=4, name=None):
+    """Track of an AltOS (TeleMega, TeleMetrum) CSV export, with the GPS
+    altitude, the second of its two altitude columns."""
+    with open(filename, "r", encoding="utf-8") as file:
+        reader = csv.reader(file)
+        header = [column.strip().lstrip("#") for column in next(reader)]
+        columns = {
+            "time": header.index("time"),
+            "nsat": header.index("nsat"),
+            "latitude": header.index("latitude"),
+            "longitude": header.index("longitude"),
+            "altitude": len(header) - 1 - header[::-1].index("altitude"),
+        }
+        rows = []
+        for row in reader:
+            try:
+                rows.append([float(row[column]) for column in columns.values()])
+            except (ValueError, IndexError):
+                continue  # no fix yet
+    data = np.array(rows).reshape(-1, len(columns))
+    valid = (data[:, 1] >= min_satellites) & (data[:, 2] != 0) & (data[:, 3] != 0)
+    return _distinct(
+        *data[valid][:, [0, 2, 3, 4]].T, name or os.path.splitext(os.path.basename(filename))[0]
+    )
+
+
+def read_track(filename, altimeter=None, elevation=0.0, min_satellites=4, name=None):
+    """Track of an AltOS export or of a GNSS log, told apart by their
+    header."""
+    with open(filename, "r", encoding="utf-8") as file:
+        header = file.readline()
+    if "state_name" in header:
+        return read_altos_track(filename, min_satellites, name)
+    return read_gnss_csv(filename, altimeter, elevation, min_satellites, name)
+
+
+def simulated_track(flight, time_step=0.5, name="simulation"):
+    """Track of a rocketpy Flight, resampled every ``time_step`` seconds.
+    Its flat x, y and height above the launch site are placed in the tangent
+    frame of the launch site of its environment."""
+    columns = resample(flight, ["x", "y", "z"], time_step)
+    environment = flight.env
+    origin = (environment.latitude, environment.longitude, environment.elevation)
+    latitude, longitude, altitude = enu_to_geodetic(
+        columns["x"], columns["y"], columns["z"] - environment.elevation, origin
+    )
+    return Track(name, columns["time"], latitude, longitude, altitude)
+
+
+def compare_tracks(observed, simulated, origin):
+    """Compares a flown track with a simulated one in the tangent frame at
+    ``origin`` (latitude, longitude, altitude), e.g. the launch site.
+
+    The simulated positions are interpolated at the times of the observed
+    fixes within the simulated flight.
+
+    Returns
+    -------
+    dict
+        "horizontal_rms", "horizontal_max" and "vertical_rms" errors (m,
+        simulated minus observed) along the flight; observed and simulated
+        "apogee" (highest up, m) and "drift" (horizontal distance of the
+        landing from the origin, m); "landing_east", "landing_north" and
+        "landing_error" (m) of the simulated landing from the observed one;
+        and the "time", "horizontal_error" and "vertical_error" arrays.
+    """
+    observed_enu = observed.enu(origin)
+    simulated_enu = simulated.enu(origin)
+    common = (observed.time >= simulated.time[0]) & (observed.time <= simulated.time[-1])
+    time = observed.time[common]
+    errors = [
+        np.interp(time, simulated.time, simulated_axis) - observed_axis[common]
+        for observed_axis, simulated_axis in zip(observed_enu, simulated_enu)
+    ]
+    horizontal = np.hypot(errors[0], errors[1])
+    vertical = errors[2]
+    landing_east = simulated_enu[0][-1] - observed_enu[0][-1]
+    landing_north = simulated_enu[1][-1] - observed_enu[1][-1]
+    finite = np.isfinite(vertical)
+    observed_up = observed_enu[2][np.isfinite(observed_enu[2])]
+    return {
+        "observed": observed.name,
+        "simulated": simulated.name,
+        "samples": int(common.sum()),
+        "horizontal_rms": float(np.sqrt(np.mean(horizontal**2))) if len(time) else np.nan,
+        "horizontal_max": float(horizontal.max()) if len(time) else np.nan,
+        "vertical_rms": float(np.sqrt(np.mean(vertical[finite] ** 2))) if finite.any() else np.nan,
+        "observed_apogee": float(observed_up.max()) if len(observed_up) else np.nan,
+        "simulated_apogee": float(np.nanmax(simulated_enu[2])),
+        "observed_drift": float(np.hypot(observed_enu[0][-1], observed_enu[1][-1])),
+        "simulated_drift": float(np.hypot(simulated_enu[0][-1], simulated_enu[1][-1])),
+        "landing_east": float(landing_east),
+        "landing_north": float(landing_north),
+        "landing_error": float(np.hypot(landing_east, landing_north)),
+        "time": time,
+        "horizontal_error": horizontal,
+        "vertical_error": vertical,
+    }
+
+
+def print_comparison(comparison):
+    """Prints the scalars of ``compare_tracks``."""
+    print(
+        f"{comparison['simulated']} against {comparison['observed']} "
+        f"({comparison['samples']} fixes)"
+    )
+    print(
+        f"  error along the flight: horizontal rms {comparison['horizontal_rms']:.1f} m, "
+        f"max {comparison['horizontal_max']:.1f} m, vertical rms {comparison['vertical_rms']:.1f} m"
+    )
+    print(
+        f"  apogee: observed {comparison['observed_apogee']:.1f} m, simulated "
+        f"{comparison['simulated_apogee']:.1f} m"
+    )
+    print(
+        f"  drift: observed {comparison['observed_drift']:.1f} m, simulated "
+        f"{comparison['simulated_drift']:.1f} m"
+    )
+    print(
+        f"  landing error: {comparison['landing_error']:.1f} m "
+        f"({comparison['landing_east']:+.1f} m east, {comparison['landing_north']:+.1f} m north)"
+    )
+
+
+def export_tracks(tracks, filename, origin=None):
+    """Writes ``tracks`` to one file, given by its extension.
+
+    .kml: one line per track (at its altitudes, on the ground without them)
+    and its landing point. .csv: one row per fix with the track name, time,
+    latitude, longitude and altitude, and east, north and up about
+    ``origin`` if given.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == ".csv":
+        with open(filename, "w", newline="", encoding="utf-8") as file:
+            writer = csv.writer(file)
+            writer.writerow(
+                ["track", "time", "latitude", "longitude", "altitude"]
+                + (["east", "north", "up"] if origin is not None else [])
+            )
+            for track in tracks:
+                columns = [track.time, track.latitude, track.longitude, track.altitude]
+                if origin is not None:
+                    columns += list(track.enu(origin))
+                for row in zip(*columns):
+                    writer.writerow([track.name] + [f"{value:.10g}" for value in row])
+    elif extension == ".kml":
+        import simplekml  # pylint: disable=import-outside-toplevel
+
+        kml = simplekml.Kml()
+        for track, color in zip(tracks, cycle(KML_COLORS)):
+            known = np.isfinite(track.altitude)
+            line = kml.newlinestring(name=track.name)
+            if known.all():
+                line.coords = list(zip(track.longitude, track.latitude, track.altitude))
+                line.altitudemode = simplekml.AltitudeMode.absolute
+            else:
+                line.coords = list(zip(track.longitude, track.latitude))
+                line.altitudemode = simplekml.AltitudeMode.clamptoground
+            line.style.linestyle.color = color
+            line.style.linestyle.width = 3
+            landing = kml.newpoint(
+                name=f"{track.name} landing",
+                coords=[(track.longitude[-1], track.latitude[-1])],
+            )
+            landing.style.iconstyle.color = color
+        if origin is not None:
+            kml.newpoint(name="Launch Pad", coords=[(origin[1], origin[0])])
+        kml.save(filename)
+    else:
+        raise ValueError(f"Unknown extension '{extension}', use .kml or .csv.")
+
+
+def landing_sigma(landing, mean, covariance):
+    """Mahalanobis distance of a landing point from an impact dispersion:
+    the point lies on the ``sigma`` ellipse of ``RunningStatistics.ellipse``
+    for this value."""
+    offset = np.asarray(landing, dtype=float) - np.asarray(mean, dtype=float)
+    return float(np.sqrt(offset @ np.linalg.solve(covariance, offset)))
+
+
+def check_campaigns(landing, campaigns, names=None):
+    """Places an observed landing in the impact dispersions of Monte Carlo
+    campaigns.
+
+    Parameters
+    ----------
+    landing : tuple[float, float]
+        East and north (m) of the observed landing from the campaigns'
+        launch site, e.g. the last point of ``Track.enu``.
+    campaigns : list
+        Campaign filenames (their outputs files are read, see
+        ``compare.CampaignOutputs``) or ``RunningStatistics``, whose impact
+        moments are used without the samples.
+    names : list[str], optional
+        Labels of the campaigns.
+
+    Returns
+    -------
+    list[dict]
+        Per campaign: "samples", impact "mean" (east, north), "distance"
+        of the landing from it (m), "sigma" (Mahalanobis distance),
+        "inside" (the smallest of the 1, 2 and 3 sigma ellipses holding the
+        landing, None if outside them all), "closer" (share of samples
+        with a smaller Mahalanobis distance, NaN from statistics) and
+        "nearest" sample landing distance (m, NaN from statistics).
+    """
+    rows = []
+    for campaign, name in zip(campaigns, names or [None] * len(campaigns)):
+        if hasattr(campaign, "pairs"):
+            count, mean, comoment = campaign.pairs["impact"]
+            covariance = np.asarray(comoment) / count
+            points = None
+            name = name or campaign.filename
+        else:
+            outputs = CampaignOutputs(campaign, name)
+            points = outputs.impacts()
+            count, mean = len(points), points.mean(axis=0)
+            covariance = np.cov(points, rowvar=False, bias=True)
+            name = outputs.name
+        sigma = landing_sigma(landing, mean, covariance)
+        row = {
+            "campaign": name,
+            "samples": int(count),
+            "mean": tuple(float(value) for value in mean),
+            "distance": float(np.hypot(*(np.asarray(landing) - mean))),
+            "sigma": sigma,
+            "inside": next((level for level in (1, 2, 3) if sigma <= level), None),
+            "closer": np.nan,
+            "nearest": np.nan,
+        }
+        if points is not None:
+            offsets = points - mean
+            sample_sigmas = np.sqrt(
+                np.einsum("ij,ij->i", offsets, np.linalg.solve(covariance, offsets.T).T)
+            )
+            row["closer"] = float(np.mean(sample_sigmas < sigma))
+            row["nearest"] = float(np.hypot(*(points - np.asarray(landing)).T).min())
+        rows.append(row)
+    return rows
+
+
+def print_campaigns(rows):
+    """Prints the rows of ``check_campaigns``."""
+    print(
+        f"{'campaign':<40}{'samples':>9}{'distance [m]':>14}{'sigma':>8}{'ellipse':>9}"
+        f"{'closer':>8}{'nearest [m]':>13}"
+    )
+    for row in rows:
+        inside = f"{row['inside']}σ" if row["inside"] else "outside"
+        # without the samples (from statistics) only the ellipse is known
+        closer = f"{100 * row['closer']:.1f}%" if np.isfinite(row["closer"]) else "-"
+        nearest = f"{row['nearest']:.1f}" if np.isfinite(row["nearest"]) else "-"
+        print(
+            f"{row['campaign']:<40}{row['samples']:>9}{row['distance']:>14.1f}"
+            f"{row['sigma']:>8.2f}{inside:>9}{closer:>8}{nearest:>13}"
+        )
+
+
+def main():
+    # pylint: disable=import-outside-toplevel
+    from .config import launch_elevation
+    from .vehicles import VEHICLES
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("track", help="GNSS log or AltOS CSV export")
+    parser.add_argument("--altimeter", help="altimeter log with the heights of a GNSS log")
+    parser.add_argument(
+        "--site", choices=sorted(VEHICLES), help="vehicle whose launch site is the origin "
+        "(default: the first fix, at the pad elevation)"
+    )
+    parser.add_argument("--elevation", type=float, help="pad elevation (m), default: the site's pad")
+    parser.add_argument("--campaigns", nargs="+", default=[], help="Monte Carlo campaign filenames")
+    parser.add_argument("--min-satellites", type=int, default=4)
+    parser.add_argument("--output", help="save the track to this .kml or .csv file")
+    args = parser.parse_args()
+
+    site = VEHICLES[args.site].site if args.site else None
+    elevation = args.elevation
+    if elevation is None:
+        elevation = launch_elevation(site) if site else 0.0
+    track = read_track(args.track, args.altimeter, elevation, args.min_satellites)
+    if site is not None:
+        origin = (site.latitude, site.longitude, elevation)
+    else:
+        pad_altitude = track.altitude[0] if np.isfinite(track.altitude[0]) else elevation
+        origin = (track.latitude[0], track.longitude[0], pad_altitude)
+    east, north, up = track.enu(origin)
+    print(
+        f"{track.name}: {len(track)} fixes from {track.time[0]:.1f} s to {track.time[-1]:.1f} s, "
+        f"highest {np.nanmax(up) if np.isfinite(up).any() else np.nan:.1f} m above the origin"
+    )
+    print(
+        f"landing: {east[-1]:+.1f} m east, {north[-1]:+.1f} m north, "
+        f"drift {np.hypot(east[-1], north[-1]):.1f} m"
+    )
+    if args.campaigns:
+        print_campaigns(check_campaigns((east[-1], north[-1]), args.campaigns))
+    if args.output:
+        export_tracks([track], args.output, origin)
+        print(f"Track saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
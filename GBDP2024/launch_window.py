@@ -0,0 +1,286 @@
+"""Launch window scan over the dates and hours of a reanalysis/ensemble file.
+
+Every candidate slot gets a nominal flight plus a small dispersion over rail
+inclination, heading and wind magnitude. All slots are read from the NetCDF
+file in one pass (see ``AtmosphericProfiles``) and the flights of all slots run
+in parallel worker processes. Run it with
+``python -m GBDP2024.launch_window --vehicle COTS --first-day ... --last-day ...``.
+"""
+
+import argparse
+import csv
+from datetime import datetime
+
+import numpy as np
+from rocketpy import Flight
+
+from .parallel import parallel_map, worker_state
+
+METRICS = (
+    "apogee",
+    "drift",
+    "out_of_rail_velocity",
+    "out_of_rail_stability_margin",
+    "max_mach_number",
+    "frontal_surface_wind",
+    "lateral_surface_wind",
+)
+
+# motor option scanned when none is given, the one of each vehicle's flights
+DEFAULT_MOTORS = {"Hybrid": "Hybrid", "COTS": "Solid"}
+
+
+def _fly(task):
+    """Worker: flies one sample of one slot and returns its metrics."""
+    slot, profile_index, inclination, heading, wind_factor = task
+    state = worker_state()
+    try:
+        env = state["profiles"].environment(
+            profile_index, state["elevation"], wind_factor, wind_factor
+        )
+        flight = Flight(
+            rocket=state["rocket"],
+            environment=env,
+            rail_length=state["rail_length"],
+            inclination=inclination,
+            heading=heading,
+        )
+        return {
+            "slot": slot,
+            "apogee": flight.apogee - state["elevation"],
+            "drift": float(np.hypot(flight.x_impact, flight.y_impact)),
+            "out_of_rail_velocity": flight.out_of_rail_velocity,
+            "out_of_rail_stability_margin": flight.out_of_rail_stability_margin,
+            "max_mach_number": flight.max_mach_number,
+            "frontal_surface_wind": flight.frontal_surface_wind,
+            "lateral_surface_wind": flight.lateral_surface_wind,
+        }
+    except Exception as error:  # pylint: disable=broad-except
+        return {"slot": slot, "error": f"{type(error).__name__}: {error}"}
+
+
+def scan_launch_window(
+    rocket,
+    profiles,
+    slots,
+    elevation,
+    rail_length,
+    inclination,
+    heading,
+    samples=10,
+    inclination_std=1.0,
+    heading_std=2.0,
+    wind_factor_std=0.1,
+    seed=None,
+    workers=None,
+):
+    """Runs the nominal flight and ``samples`` dispersed flights for each slot.
+
+    Parameters
+    ----------
+    rocket : Rocket
+        Rocket to fly, shared by all slots.
+    profiles : AtmosphericProfiles
+        Profiles read from the reanalysis or ensemble file.
+    slots : list[int]
+        Indices of the candidate profiles, e.g. from ``profiles.select``.
+    elevation : float
+        Launch site elevation above sea level, in meters.
+    rail_length, inclination, heading : float
+        Nominal launch rail settings.
+    samples : int, optional
+        Dispersed flights per slot, besides the nominal one. Default is 10.
+    inclination_std, heading_std : float, optional
+        Standard deviations of the rail inclination and heading, in degrees.
+    wind_factor_std : float, optional
+        Standard deviation of the factor multiplying the wind profile.
+    seed : int, optional
+        Seed of the dispersion, for reproducible scans.
+    workers : int, optional
+        Number of worker processes, defaults to all cores.
+
+    Returns
+    -------
+    list[dict]
+        One row per slot with the nominal metrics, the dispersion statistics
+        and the number of failed flights.
+    """
+    rng = np.random.default_rng(seed)
+    tasks = []
+    for slot, profile_index in enumerate(slots):
+        tasks.append((slot, profile_index, inclination, heading, 1.0))
+        for _ in range(samples):
+            tasks.append(
+                (
+                    slot,
+                    profile_index,
+                    rng.normal(inclination, inclination_std),
+                    rng.normal(heading, heading_std),
+                    rng.normal(1.0, wind_factor_std),
+                )
+            )
+    state = {
+        "rocket": rocket,
+        "profiles": profiles,
+        "elevation": elevation,
+        "rail_length": rail_length,
+    }
+    results = parallel_map(_fly, tasks, state=state, workers=workers)
+
+    rows = []
+    for slot, profile_index in enumerate(slots):
+        slot_results = [result for result in results if result["slot"] == slot]
+        nominal, dispersed = slot_results[0], slot_results[1:]
+        flown = [result for result in dispersed if "error" not in result]
+        row = {
+            "time": profiles.times[profile_index],
+            "member": profiles.members[profile_index],
+            "failures": len(dispersed) - len(flown) + ("error" in nominal),
+        }
+        for metric in METRICS:
+            row[metric] = nominal.get(metric, np.nan)
+            values = np.array([result[metric] for result in flown])
+            row[f"{metric}_mean"] = values.mean() if len(values) else np.nan
+            row[f"{metric}_std"] = values.std() if len(values) else np.nan
+        values = np.array([result["drift"] for result in flown] or [np.nan])
+        row["drift_max"] = values.max()
+        values = np.array([result["out_of_rail_velocity"] for result in flown] or [np.nan])
+        row["out_of_rail_velocity_min"] = values.min()
+        rows.append(row)
+    return rows
+
+
+def print_table(rows):
+    """Prints one line per slot with the main launch window metrics."""
+    print(
+        f"{'time':<18}{'apogee [m]':>12}{'drift [m]':>11}{'max drift':>11}"
+        f"{'rail exit [m/s]':>17}{'min':>7}{'margin [c]':>12}{'mach':>7}{'failed':>8}"
+    )
+    for row in rows:
+        print(
+            f"{row['time']:%Y-%m-%d %H:%M}  {row['apogee']:>10.0f}{row['drift']:>11.0f}"
+            f"{row['drift_max']:>11.0f}{row['out_of_rail_velocity']:>17.1f}"
+            f"{row['out_of_rail_velocity_min']:>7.1f}"
+            f"{row['out_of_rail_stability_margin']:>12.2f}"
+            f"{row['max_mach_number']:>7.2f}{row['failures']:>8}"
+        )
+
+
+def save_csv(rows, filename):
+    """Writes all rows to a CSV file."""
+    with open(filename, "w", newline="", encoding="utf-8") as file:
+        writer = csv.DictWriter(file, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def plot_heatmaps(rows, filename=None):
+    """Plots day x hour heatmaps of the nominal apogee, the mean dispersion
+    drift and the minimum out of rail velocity.
+
+    Parameters
+    ----------
+    rows : list[dict]
+        Output of ``scan_launch_window``.
+    filename : str, optional
+        If given the figure is saved to this file instead of being shown.
+    """
+    import matplotlib.pyplot as plt  # pylint: disable=import-outside-toplevel
+
+    days = sorted({row["time"].date() for row in rows})
+    hours = sorted({row["time"].hour for row in rows})
+    panels = (
+        ("apogee", "Nominal apogee AGL (m)"),
+        ("drift_mean", "Mean drift (m)"),
+        ("out_of_rail_velocity_min", "Min. out of rail velocity (m/s)"),
+    )
+    fig, axes = plt.subplots(1, len(panels), figsize=(5 * len(panels), 0.5 * len(days) + 2))
+    for ax, (key, title) in zip(axes, panels):
+        grid = np.full((len(days), len(hours)), np.nan)
+        for row in rows:
+            grid[days.index(row["time"].date()), hours.index(row["time"].hour)] = row[key]
+        image = ax.imshow(grid, aspect="auto", cmap="viridis")
+        ax.set_xticks(range(len(hours)), [f"{hour:02d}h" for hour in hours])
+        ax.set_yticks(range(len(days)), [str(day) for day in days])
+        ax.set_title(title)
+        fig.colorbar(image, ax=ax)
+    fig.tight_layout()
+    if filename:
+        fig.savefig(filename)
+        plt.close(fig)
+    else:
+        plt.show()
+
+
+def main():
+    # pylint: disable=import-outside-toplevel
+    from .atmosphere import AtmosphericProfiles
+    from .config import build_rocket, data_path, launch_elevation
+    from .profiling import PROFILER
+    from .vehicles import VEHICLES
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--vehicle", choices=sorted(VEHICLES), default="Hybrid")
+    parser.add_argument("--motor", help="motor option of the vehicle, e.g. Solid")
+    parser.add_argument(
+        "--file",
+        default=data_path("weather/euroc_2023_all_windows.nc"),
+        help="reanalysis or ensemble file",
+    )
+    parser.add_argument("--first-day", required=True, help="YYYY-MM-DD")
+    parser.add_argument("--last-day", required=True, help="YYYY-MM-DD")
+    parser.add_argument("--first-hour", type=int, default=8)
+    parser.add_argument("--last-hour", type=int, default=18)
+    parser.add_argument("--samples", type=int, default=10, help="dispersion flights per slot")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument(
+        "--output", default="launch_window", help="prefix of the .csv, .png and .profile.json"
+    )
+    parser.add_argument("--show", action="store_true", help="also show the heatmaps")
+    args = parser.parse_args()
+
+    vehicle = VEHICLES[args.vehicle]
+    config = vehicle.with_motor(args.motor or DEFAULT_MOTORS.get(args.vehicle))
+    rocket, _ = build_rocket(config.rocket)
+
+    # all the times of the file are read in one pass
+    PROFILER.start("profiles")
+    profiles = AtmosphericProfiles.from_netcdf(
+        args.file, vehicle.site.latitude, vehicle.site.longitude
+    )
+    slots = profiles.select(
+        start=datetime.strptime(args.first_day, "%Y-%m-%d"),
+        end=datetime.strptime(args.last_day, "%Y-%m-%d").replace(hour=23, minute=59),
+        hours=range(args.first_hour, args.last_hour + 1),
+        member=0,  # first member only for ensembles
+    )
+    PROFILER.stop("profiles")
+    print(f"{len(slots)} launch slots found in {args.file}")
+
+    # same rail as the nominal flight of the sim scripts
+    PROFILER.start("launch window scan")
+    rows = scan_launch_window(
+        rocket,
+        profiles,
+        slots,
+        elevation=launch_elevation(vehicle.site),  # the terrain's pad height with a terrain file
+        rail_length=vehicle.rail_length,
+        inclination=vehicle.inclination,
+        heading=vehicle.heading,
+        samples=args.samples,
+        seed=args.seed,
+        workers=args.workers,
+    )
+    PROFILER.stop("launch window scan")
+
+    print_table(rows)
+    save_csv(rows, f"{args.output}.csv")
+    plot_heatmaps(rows, filename=f"{args.output}.png")
+    if args.show:
+        plot_heatmaps(rows)
+    PROFILER.report(f"{args.output}.profile.json")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+"""Monte Carlo dispersion pipeline of the vehicles.
+
+Hybrid/montecarlo.py and COTS/COTS_montecarlo.py were the same script with
+the sim module, the campaign file and the Hybrid's payload and air brakes
+changed. ``run_montecarlo`` is that script for any vehicle of
+``vehicles.VEHICLES``, around the nominal flight of its sim script: it asks
+for the campaign options, sets up the stochastic models and flies the
+campaign on this machine (``run_parallel`` or ``run_batch``) or on the job
+queue of ``distributed``. The payload and air brakes are drawn when the
+vehicle flies them. The scripts only pass their sim's objects, e.g.::
+
+    from sim import env, test_flight, parts, vehicle, terrain
+    run_montecarlo("Hybrid", env, test_flight, parts, vehicle=vehicle, terrain=terrain)
+"""
+
+import os
+
+from rocketpy.stochastic import (
+    StochasticFlight,
+    StochasticNoseCone,
+    StochasticParachute,
+    StochasticRailButtons,
+    StochasticRocket,
+    StochasticSolidMotor,
+    StochasticTail,
+    StochasticTrapezoidalFins,
+)
+
+from .air_brakes import StochasticAirBrakes
+from .campaign import DeferredMonteCarlo, next_index, run_batch, run_parallel
+from .climatology import ClimatologyStochasticEnvironment, ProfileBank
+from .config import build_rocket, data_path
+from .distributed import run_distributed, run_worker, worker_name
+from .flight_data import FlightDataExport
+from .profiling import PROFILER
+from .running_statistics import RunningStatistics
+from .shared_environment import SharedEnvironmentProfiles, SharedStochasticEnvironment
+from .vehicles import VEHICLES
+
+# reanalysis files of the climatology, all EuRoC launch windows
+CLIMATOLOGY_FILES = ("weather/euroc_2022_all_windows.nc", "weather/euroc_2023_all_windows.nc")
+
+
+def stochastic_environment(env, site, climatology=False, directory="MonteCarlo"):
+    """Stochastic environment of a campaign.
+
+    Parameters
+    ----------
+    env : Environment
+        Environment of the nominal flight.
+    site : SiteConfig
+        Launch site, for the climatology profiles.
+    climatology : bool, optional
+        If True, each sample draws one of the hourly profiles (10h to 17h)
+        of all the EuRoC launch windows, extracted once into a memory-mapped
+        bank in ``directory`` (rebuilt only when the files change).
+        Otherwise every ensemble member of ``env`` is tabulated once in
+        shared memory, so the parallel workers don't pickle or rebuild it.
+    directory : str, optional
+        Folder of the climatology bank.
+
+    Returns
+    -------
+    model : SharedStochasticEnvironment or ClimatologyStochasticEnvironment
+        Draws the profile or ensemble member and the wind factors.
+    profiles : SharedEnvironmentProfiles or None
+        Shared profiles to unlink once the campaign is done.
+    """
+    if climatology:
+        bank = ProfileBank.load(
+            [data_path(filename) for filename in CLIMATOLOGY_FILES],
+            site.latitude,
+            site.longitude,
+            os.path.join(directory, "euroc_climatology"),
+        )
+        model = ClimatologyStochasticEnvironment(
+            bank,
+            env.elevation,  # the terrain's height at the pad with a terrain file
+            profiles=bank.select(hours=range(10, 18)),  # e.g. years=[2023]
+            wind_velocity_x_factor=(1.0, 0.1),
+            wind_velocity_y_factor=(1.0, 0.1),
+        )
+        return model, None
+    profiles = SharedEnvironmentProfiles.create(env)
+    # all ensemble members of the profiles are used when ensemble_member isn't given
+    model = SharedStochasticEnvironment(
+        profiles=profiles,
+        wind_velocity_x_factor=(1.0, 0.1),
+        wind_velocity_y_factor=(1.0, 0.1),
+    )
+    return model, profiles
+
+
+def stochastic_rocket(rocket, parts):
+    """Stochastic model of ``rocket``, whose components ``parts`` are named as
+    in the sim scripts (see ``config.build_rocket``). The uncertainties are
+    the measurement ones of the vehicles' parts."""
+    model = StochasticRocket(
+        rocket=rocket,
+        radius=0.0127 / 2000,
+        mass=(15.426, 0.5, "normal"),
+        inertia_11=(6.321, 0),
+        inertia_22=0.01,
+        inertia_33=0.01,
+        center_of_mass_without_motor=0,
+    )
+    motor = StochasticSolidMotor(
+        solid_motor=parts["motor"],
+        burn_start_time=(0, 0.1, "binomial"),  # binomial uncertainty (mean, deviation, type)
+        grains_center_of_mass_position=0.001,  # linear uncertainties
+        grain_density=50,
+        grain_separation=1 / 1000,
+        grain_initial_height=1 / 1000,
+        grain_initial_inner_radius=0.375 / 1000,
+        grain_outer_radius=0.375 / 1000,
+        total_impulse=(6500, 1000),  # normally distributed uncertainty (mean, deviation)
+        throat_radius=0.5 / 1000,
+        nozzle_radius=0.5 / 1000,
+        nozzle_position=0.001,
+    )
+    model.add_motor(motor, position=0.001)
+    model.add_nose(
+        StochasticNoseCone(nosecone=parts["nose_cone"], length=0.001), position=(1.134, 0.001)
+    )
+    model.add_trapezoidal_fins(
+        StochasticTrapezoidalFins(
+            trapezoidal_fins=parts["fin_set"], root_chord=0.0005, tip_chord=0.0005, span=0.0005
+        ),
+        position=(0.001, "normal"),
+    )
+    model.add_tail(
+        StochasticTail(tail=parts["tail"], top_radius=0.001, bottom_radius=0.001, length=0.001)
+    )
+    model.set_rail_buttons(
+        StochasticRailButtons(rail_buttons=parts["rail_buttons"], buttons_distance=0.001),
+        lower_button_position=(0.001, "normal"),
+    )
+    model.add_parachute(StochasticParachute(parachute=parts["main"], cd_s=0.1, lag=0.1))
+    model.add_parachute(StochasticParachute(parachute=parts["drogue"], cd_s=0.07, lag=0.2))
+    return model
+
+
+def stochastic_payload(vehicle):
+    """Stochastic model of the payload of ``vehicle``, None without one. It
+    is flown from each sample's state at separation, its impact points are
+    extra columns of the outputs file."""
+    if vehicle.payload is None:
+        return None
+    payload, parts = build_rocket(vehicle.payload)
+    model = StochasticRocket(rocket=payload, mass=(1, 0.05, "normal"))
+    for parachute in vehicle.payload.parachutes:
+        model.add_parachute(StochasticParachute(parachute=parts[parachute.name], cd_s=0.02))
+    return model
+
+
+def stochastic_air_brakes(vehicle):
+    """Stochastic air brakes of ``vehicle``, None without air brakes.
+    ``StochasticRocket`` leaves them out, they are added to each sample with
+    a drawn controller."""
+    if vehicle.rocket.air_brakes is None:
+        return None
+    return StochasticAirBrakes(
+        vehicle.rocket.air_brakes,
+        gain=2,  # controller gains, deviation around the nominal value
+        altitude_noise=(1, 1, "uniform"),  # sensor noise std (m), uniform between 0 and 2
+        speed_noise=(0.5, 0.5, "uniform"),
+    )
+
+
+def run_montecarlo(
+    key,
+    env,
+    test_flight,
+    parts,
+    vehicle=None,
+    terrain=None,
+    filename="MonteCarlo/MonteCarlo",
+    queue_directory="MonteCarlo/queue",
+    batch=False,
+    **options,
+):
+    """Asks for the campaign options and runs the Monte Carlo campaign of a
+    vehicle around its nominal flight.
+
+    The dialogs ask whether to draw the atmosphere from the climatology, the
+    role of this machine in a distributed campaign (none, "coordinator" or
+    "worker" of the job queue in ``queue_directory``), whether to append to
+    the existing files and the number of simulations.
+
+    Parameters
+    ----------
+    key : str
+        Vehicle of ``VEHICLES``, e.g. "Hybrid".
+    env : Environment
+        Environment of the nominal flight.
+    test_flight : Flight
+        Nominal flight of the sim script, for the rail and initial solution.
+    parts : dict
+        Components of its rocket, see ``config.build_rocket``.
+    vehicle : VehicleConfig, optional
+        Configuration the sim script flew, e.g. with another motor or air
+        brakes. Defaults to ``VEHICLES[key]``.
+    terrain : ElevationGrid, optional
+        Terrain the flights impact on, None for the flat launch elevation.
+    filename : str, optional
+        Campaign files, saved or appended to.
+    queue_directory : str, optional
+        Job queue shared by the machines of a distributed campaign.
+    batch : bool, optional
+        If True, the samples are point-mass flights of the main scalars
+        (``run_batch``) on this machine, about 50 times faster for the apogee
+        and landing dispersion.
+    options : dict
+        ``run_parallel`` options replacing the defaults below, e.g.
+        ``memory_budget=8000`` or ``descents=20``.
+
+    Returns
+    -------
+    DeferredMonteCarlo
+        The campaign, whose results are in its running statistics.
+    """
+    # pylint: disable=import-outside-toplevel
+    import tkinter as tk
+    from tkinter import messagebox, simpledialog
+
+    vehicle = vehicle or VEHICLES[key]
+    # hidden root window, for the dialogs
+    root = tk.Tk()
+    root.withdraw()
+    # reanalysis environments have a single member
+    print(f"Number of ensemble members: {getattr(env, 'num_ensemble_members', 1)}")
+    climatology = messagebox.askyesno(
+        "Climatology?",
+        "Draw each sample's atmosphere from all the EuRoC launch windows instead of this date's?",
+    )
+
+    PROFILER.start("stochastic models")
+    environment, shared_profiles = stochastic_environment(
+        env, vehicle.site, climatology, directory=os.path.dirname(filename) or "."
+    )
+    rocket = stochastic_rocket(test_flight.rocket, parts)
+    payload = stochastic_payload(vehicle)
+    air_brakes = stochastic_air_brakes(vehicle)
+    flight = StochasticFlight(
+        flight=test_flight,
+        inclination=(84.7, 1),  # (mean, std)
+        heading=(53, 2),
+    )
+    PROFILER.stop("stochastic models")
+
+    # the existing files aren't parsed here, results come from the running statistics
+    monte_carlo = DeferredMonteCarlo(
+        filename=filename, environment=environment, rocket=rocket, flight=flight
+    )
+    role = (
+        simpledialog.askstring(
+            "Distributed?",
+            "Empty to fly on this machine only, or 'coordinator' / 'worker' of the job queue:",
+        )
+        or ""
+    ).strip().lower()
+    if role != "worker":
+        append = messagebox.askyesno("Append?", "Add the new simulations to the existing results?")
+        number_of_simulations = simpledialog.askinteger(
+            "Input",
+            "How many simulations would you like to run?" + (" (new ones)" if append else ""),
+        )
+        # only the new samples are read into the statistics kept next to the outputs file
+        statistics = RunningStatistics.for_campaign(monte_carlo)
+        if append:
+            number_of_simulations += next_index(monte_carlo)  # failed samples included
+    # time series of every flight, in one long-format file with a "sample" column
+    flight_data = FlightDataExport(
+        ["altitude", "speed", "mach_number", "x", "y"], f"{filename}.flights.npz", time_step=0.5
+    )
+    PROFILER.start("monte carlo")  # sampling, integration and JSON writing
+    try:
+        if role == "worker":
+            # same models as the coordinator's, the seed and export options come with the jobs
+            run_worker(
+                queue_directory,
+                monte_carlo,
+                payload=payload,
+                air_brakes=air_brakes,
+                flight_data=flight_data,
+                terrain=terrain,
+            )
+        elif batch:
+            run_batch(
+                monte_carlo,
+                number_of_simulations,
+                append=append,
+                statistics=statistics,
+                include_function_data=True,
+            )
+        else:
+            campaign_options = {
+                "append": append,
+                "profiler": PROFILER,
+                "flight_data": flight_data,
+                "statistics": statistics,
+                "include_function_data": True,
+                "static_margin": (1, 4),  # calibers, see the .unstable.txt file
+                "payload": payload,
+                "payload_separation": vehicle.payload_separation,
+                "air_brakes": air_brakes,  # controller timings are in the profile
+                "terrain": terrain,
+                **options,
+            }
+            if role == "coordinator":
+                # jobs of 100 samples, one without heartbeat for 2 minutes goes to another worker
+                run_distributed(
+                    monte_carlo,
+                    number_of_simulations,
+                    queue_directory,
+                    job_size=100,
+                    local_workers=0,
+                    **campaign_options,
+                )
+            else:
+                # one worker per core, failed samples go to the errors file
+                run_parallel(monte_carlo, number_of_simulations, **campaign_options)
+    finally:
+        if shared_profiles is not None:
+            shared_profiles.unlink()  # all workers are done, or the run was interrupted
+    PROFILER.stop("monte carlo")
+
+    print("STOCHASTIC ENV")
+    environment.visualize_attributes()
+    print("STOCHASTIC MOTOR")
+    rocket.motors[0].component.visualize_attributes()
+    print("STOCHASTIC ROCKET")
+    rocket.visualize_attributes()
+    print("STOCHASTIC FLIGHT")
+    flight.visualize_attributes()
+    # workers keep their own profile, next to the coordinator's
+    suffix = f".{worker_name()}" if role == "worker" else ""
+    PROFILER.report(f"{filename}{suffix}.profile.json")
+    return monte_carlo
@@ -0,0 +1,140 @@
+"""Results pipeline of a vehicle's Monte Carlo campaign.
+
+Hybrid/montecarlo_results.py and COTS/COTS_montecarlo_results.py were the
+same script with the vehicle and campaign file changed.
+``run_montecarlo_results`` is that script for any vehicle of
+``vehicles.VEHICLES``: summary, ellipses and histograms from the running
+statistics, impact ellipses KML, landing of a flown GNSS track against them,
+failure triage and sensitivity analysis. rocketpy (and matplotlib with it) is
+only imported for the plots and the sensitivity analysis, the statistics and
+triage don't need it, so the results open quickly.
+"""
+
+import os
+
+from .config import launch_elevation
+from .gnss import check_campaigns, print_campaigns, read_track
+from .profiling import PROFILER
+from .running_statistics import RunningStatistics
+from .triage import count_failures, load_samples, print_report, triage
+from .vehicles import VEHICLES
+
+# measurement uncertainty of the parameters of the sensitivity analysis
+SENSITIVITY_PARAMETERS = {
+    # Rocket
+    "mass": {"mean": 14.426, "std": 0.5},
+    "radius": {"mean": 127 / 2000, "std": 1 / 1000},
+    # Motor
+    "motors_dry_mass": {"mean": 1.815, "std": 1 / 100},
+    "motors_grain_density": {"mean": 1815, "std": 50},
+    "motors_total_impulse": {"mean": 5700, "std": 50},
+    "motors_burn_out_time": {"mean": 3.9, "std": 0.2},
+    "motors_nozzle_radius": {"mean": 33 / 1000, "std": 0.5 / 1000},
+    "motors_grain_separation": {"mean": 5 / 1000, "std": 1 / 1000},
+    "motors_grain_initial_height": {"mean": 120 / 1000, "std": 1 / 100},
+    "motors_grain_initial_inner_radius": {"mean": 15 / 1000, "std": 0.375 / 1000},
+    "motors_grain_outer_radius": {"mean": 33 / 1000, "std": 0.375 / 1000},
+    # Parachutes
+    "parachutes_cd_s": {"mean": 10, "std": 0.1},
+    "parachutes_lag": {"mean": 1.5, "std": 0.1},
+    # Flight
+    "heading": {"mean": 53, "std": 2},
+    "inclination": {"mean": 84.7, "std": 1},
+}
+
+
+def sensitivity_analysis(site, filename="MonteCarlo/SensitivityData"):
+    """Fits rocketpy's ``SensitivityModel`` of the apogee above ground level
+    to the ``SENSITIVITY_PARAMETERS`` of the campaign files ``filename``, and
+    prints and plots it."""
+    # pylint: disable=import-outside-toplevel
+    from rocketpy.sensitivity import SensitivityModel
+    from rocketpy.tools import load_monte_carlo_data
+
+    parameters = list(SENSITIVITY_PARAMETERS)
+    target_variables = ["apogee"]
+    parameters_matrix, target_variables_matrix = load_monte_carlo_data(
+        input_filename=f"{filename}.inputs.txt",
+        output_filename=f"{filename}.outputs.txt",
+        parameters_list=parameters,
+        target_variables_list=target_variables,
+    )
+    # the apogee was saved above sea level, the flights were launched from
+    # the terrain's height at the pad with a terrain file
+    target_variables_matrix -= launch_elevation(site)
+
+    model = SensitivityModel(parameters, target_variables)
+    # the target nominal values are predicted when they are not given
+    model.set_parameters_nominal(
+        [SENSITIVITY_PARAMETERS[name]["mean"] for name in parameters],
+        [SENSITIVITY_PARAMETERS[name]["std"] for name in parameters],
+    )
+    model.fit(parameters_matrix, target_variables_matrix)
+    model.plots.bar_plot()
+    model.prints.all()
+    return model
+
+
+def run_montecarlo_results(key, filename="MonteCarlo/MonteCarlo", gnss_file=None):
+    """Shows the results of the Monte Carlo campaign of a vehicle.
+
+    Parameters
+    ----------
+    key : str
+        Vehicle of ``VEHICLES``, whose launch site is the origin of the KML
+        ellipses and GNSS track.
+    filename : str, optional
+        Campaign files of ``montecarlo.run_montecarlo``. The impact ellipses
+        are saved next to them as ``MonteCarlo.kml``.
+    gnss_file : str, optional
+        Flown GNSS track whose landing is checked against the impact
+        ellipses of the campaign, e.g. "../data/rockets/astg/gnss_halcyon.csv".
+    """
+    site = VEHICLES[key].site
+    directory = os.path.dirname(filename)
+    print("RESULTS")
+    # saved by the campaign as each sample was written, loading them doesn't re-read the
+    # outputs file (campaigns without them get them once from it)
+    statistics = RunningStatistics.for_outputs(filename)
+    print(statistics.samples)
+
+    PROFILER.start("results prints")
+    statistics.print_summary()
+    PROFILER.stop("results prints")
+
+    PROFILER.start("results plots")
+    statistics.plot_ellipses(xlim=(-500, 4000), ylim=(-500, 3000))
+    statistics.plot_histograms()
+    PROFILER.stop("results plots")
+
+    # rocket and payload impact ellipses, those without samples are skipped
+    print("SAVING AS KML")
+    statistics.export_ellipses_to_kml(
+        os.path.join(directory, "MonteCarlo.kml"),
+        origin_lat=site.latitude,
+        origin_lon=site.longitude,
+        names=["impact", "payload_impact"],
+    )
+    if gnss_file:
+        east, north, _ = read_track(gnss_file).enu(
+            (site.latitude, site.longitude, launch_elevation(site))
+        )
+        names = [os.path.basename(filename)]
+        print_campaigns(check_campaigns((east[-1], north[-1]), [statistics], names=names))
+    print("MONTE CARLO COMPLETE")
+
+    # failed and precheck-skipped samples by exception and phase, with the input regions they
+    # cluster in. Reads the whole inputs file, only done when there are failures
+    print("FAILURE TRIAGE")
+    if count_failures(filename):
+        flown, failures = load_samples(filename)
+        print_report(flown, triage(flown, failures))
+
+    # variability due to the measurement uncertainty of the parameters
+    print("SENSITIVITY ANALYSIS")
+    PROFILER.start("sensitivity analysis")
+    sensitivity_analysis(site, os.path.join(directory, "SensitivityData"))
+    PROFILER.stop("sensitivity analysis")
+
+    PROFILER.report(os.path.join(directory, "results.profile.json"))
+    return statistics
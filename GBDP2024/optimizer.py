@@ -0,0 +1,349 @@
+"""Design optimization over fins, nose cone and motor placement.
+
+The dynamic stability section of sim_results.py flies five hand-picked fin
+positions. ``DesignOptimizer`` searches a box of design parameters (fin
+chords, span and position, nose length and kind, motor position) for a target
+apogee, a stability margin window and a Mach limit with differential
+evolution. Each generation is flown in parallel worker processes (see
+``parallel.parallel_map``), every evaluated design is cached (optionally in a
+JSON file, so an interrupted or repeated search does not fly it again), and
+designs whose static margin at ignition is far outside the window are scored
+without a flight.
+
+Designs are dictionaries of ``RocketConfig`` fields, with dotted names for the
+fields of its parts, e.g. ``{"fins.span": 0.2, "nose.kind": "ogive",
+"motor_position": 0.05}``. Rockets are built with ``config.build_rocket``, so
+the motor and the unchanged parts are shared by all candidates.
+"""
+
+import json
+import os
+from dataclasses import replace
+
+import numpy as np
+from rocketpy import Flight
+
+from .config import build_rocket
+from .parallel import parallel_map, worker_state
+
+NOSE_KINDS = ("von karman", "parabolic", "ogive", "conical", "lvhaack")
+
+METRICS = (
+    "apogee",
+    "static_margin",
+    "out_of_rail_stability_margin",
+    "max_mach_number",
+    "out_of_rail_velocity",
+)
+
+
+def default_space(config, chord_spread=0.3, position_spread=0.25, motor_spread=0.1):
+    """Search box around the current design of ``config``.
+
+    Fin chords, span and nose length vary by ``chord_spread`` (relative), the
+    fin position by ``position_spread`` and the motor position by
+    ``motor_spread`` (meters). The nose kind takes any of ``NOSE_KINDS``.
+
+    Returns
+    -------
+    dict
+        Parameter name to (low, high) bounds, or to a tuple of choices.
+    """
+    fins, nose = config.fins, config.nose
+    space = {}
+    for name in ("root_chord", "tip_chord", "span"):
+        value = getattr(fins, name)
+        space[f"fins.{name}"] = (value * (1 - chord_spread), value * (1 + chord_spread))
+    space["fins.position"] = (fins.position - position_spread, fins.position + position_spread)
+    space["nose.length"] = (nose.length * (1 - chord_spread), nose.length * (1 + chord_spread))
+    space["nose.kind"] = NOSE_KINDS
+    space["motor_position"] = (
+        config.motor_position - motor_spread,
+        config.motor_position + motor_spread,
+    )
+    return space
+
+
+def apply_design(config, design):
+    """``RocketConfig`` with the parameters of ``design`` replaced."""
+    changes, parts = {}, {}
+    for key, value in design.items():
+        part, _, name = key.rpartition(".")
+        if part:
+            parts.setdefault(part, {})[name] = value
+        else:
+            changes[name] = value
+    for part, values in parts.items():
+        changes[part] = replace(getattr(config, part), **values)
+    return replace(config, **changes)
+
+
+def _evaluate(design):
+    """Worker: builds and flies one design up to apogee."""
+    state = worker_state()
+    try:
+        rocket, _ = build_rocket(apply_design(state["config"], design))
+        static_margin = float(rocket.static_margin(0))
+        low, high = state["targets"].get("stability", (-np.inf, np.inf))
+        tolerance = state["precheck_tolerance"]
+        if not low - tolerance <= static_margin <= high + tolerance:
+            # the out of rail margin cannot end up in the window, skip the flight
+            return {"static_margin": static_margin, "skipped": True}
+        flight = Flight(
+            rocket=rocket,
+            environment=state["environment"],
+            rail_length=state["rail_length"],
+            inclination=state["inclination"],
+            heading=state["heading"],
+            terminate_on_apogee=True,
+            verbose=False,
+        )
+        return {
+            "apogee": float(flight.apogee - state["environment"].elevation),
+            "static_margin": static_margin,
+            "out_of_rail_stability_margin": float(flight.out_of_rail_stability_margin),
+            "max_mach_number": float(flight.max_mach_number),
+            "out_of_rail_velocity": float(flight.out_of_rail_velocity),
+        }
+    except Exception as error:  # pylint: disable=broad-except
+        return {"error": f"{type(error).__name__}: {error}"}
+
+
+def objectives(metrics, targets):
+    """Violations of each target by the metrics of a design, all zero for a
+    design meeting every target.
+
+    The apogee objective is the relative distance to ``targets["apogee"]``,
+    the stability one the distance (calibers) of the out of rail margin to the
+    ``targets["stability"]`` window, and the Mach one the excess over
+    ``targets["max_mach"]``. Failed and skipped designs get infinite values.
+    """
+    if "error" in metrics or metrics.get("skipped"):
+        return {name: np.inf for name in ("apogee", "stability", "mach")}
+    values = {"apogee": 0.0, "stability": 0.0, "mach": 0.0}
+    if targets.get("apogee"):
+        values["apogee"] = abs(metrics["apogee"] - targets["apogee"]) / targets["apogee"]
+    if targets.get("stability"):
+        low, high = targets["stability"]
+        margin = metrics["out_of_rail_stability_margin"]
+        values["stability"] = max(low - margin, margin - high, 0.0)
+    if targets.get("max_mach"):
+        values["mach"] = max(metrics["max_mach_number"] - targets["max_mach"], 0.0)
+    return values
+
+
+class DesignOptimizer:
+    """Differential evolution over a design space, flying each generation in
+    parallel.
+
+    Parameters
+    ----------
+    config : RocketConfig
+        Baseline rocket, e.g. ``vehicle.rocket`` of a sim script.
+    environment : Environment
+        Atmosphere of every flight. It is inherited by the forked workers.
+    targets : dict
+        Any of "apogee" (m above ground), "stability" (low, high) out of rail
+        stability margin window in calibers, and "max_mach".
+    space : dict, optional
+        Parameter bounds or choices, defaults to ``default_space(config)``.
+    weights : dict, optional
+        Weight of each objective in the score, default 1 each for "apogee"
+        and "mach" and 0.2 for "stability".
+    rail_length, inclination, heading : float, optional
+        Launch rail settings, default 5.2 m, 85° and 0°.
+    precheck_tolerance : float, optional
+        Designs whose static margin at ignition is further than this (in
+        calibers) from the stability window are not flown. Default 0.5.
+    cache_file : str, optional
+        JSON file of evaluated designs, read if it exists and rewritten after
+        each generation. Flown metrics do not depend on the targets, but do on
+        the baseline rocket and atmosphere: use one file for each.
+    workers : int, optional
+        Number of worker processes, defaults to all cores.
+    seed : int, optional
+        Seed of the search.
+    """
+
+    def __init__(
+        self,
+        config,
+        environment,
+        targets,
+        space=None,
+        weights=None,
+        rail_length=5.2,
+        inclination=85,
+        heading=0,
+        precheck_tolerance=0.5,
+        cache_file=None,
+        workers=None,
+        seed=None,
+    ):
+        self.config = config
+        self.environment = environment
+        self.targets = targets
+        self.space = space or default_space(config)
+        self.weights = weights or {"apogee": 1.0, "stability": 0.2, "mach": 1.0}
+        self.rail_length = rail_length
+        self.inclination = inclination
+        self.heading = heading
+        self.precheck_tolerance = precheck_tolerance
+        self.cache_file = cache_file
+        self.workers = workers
+        self.rng = np.random.default_rng(seed)
+        self.cache = {}
+        if cache_file and os.path.exists(cache_file):
+            with open(cache_file, "r", encoding="utf-8") as file:
+                for design, metrics in json.load(file):
+                    # skipped designs depend on the stability window and cost no flight
+                    if not metrics.get("skipped"):
+                        self.cache[self._key(design)] = (design, metrics)
+
+    @staticmethod
+    def _key(design):
+        return tuple(
+            (name, round(value, 6) if isinstance(value, float) else value)
+            for name, value in sorted(design.items())
+        )
+
+    def decode(self, vector):
+        """Design of a point of the unit hypercube."""
+        design = {}
+        for value, (name, bounds) in zip(vector, self.space.items()):
+            if isinstance(bounds[0], str):
+                design[name] = bounds[min(int(value * len(bounds)), len(bounds) - 1)]
+            else:
+                design[name] = float(bounds[0] + value * (bounds[1] - bounds[0]))
+        return design
+
+    def score(self, metrics):
+        """Weighted sum of the objectives, lower is better."""
+        values = objectives(metrics, self.targets)
+        return sum(self.weights[name] * value for name, value in values.items())
+
+    def evaluate(self, designs):
+        """Metrics of each design. Designs not in the cache are flown in
+        parallel and added to it."""
+        new, keys = [], set()
+        for design in designs:
+            key = self._key(design)
+            if key not in self.cache and key not in keys:
+                new.append(design)
+                keys.add(key)
+        if new:
+            state = {
+                "config": self.config,
+                "environment": self.environment,
+                "targets": self.targets,
+                "rail_length": self.rail_length,
+                "inclination": self.inclination,
+                "heading": self.heading,
+                "precheck_tolerance": self.precheck_tolerance,
+            }
+            for design, metrics in zip(
+                new, parallel_map(_evaluate, new, state=state, workers=self.workers)
+            ):
+                self.cache[self._key(design)] = (design, metrics)
+            self.save()
+        return [self.cache[self._key(design)][1] for design in designs]
+
+    def run(self, generations=10, population=16, mutation=0.7, crossover=0.8):
+        """Runs the search.
+
+        Parameters
+        ----------
+        generations : int, optional
+            Number of generations after the initial population.
+        population : int, optional
+            Designs per generation, flown as one parallel batch.
+        mutation, crossover : float, optional
+            Differential evolution weight and crossover probability.
+
+        Returns
+        -------
+        tuple[dict, dict, float]
+            Best design, its metrics and score.
+        """
+        dimensions = len(self.space)
+        vectors = self.rng.random((population, dimensions))
+        # the baseline design is always part of the first generation
+        vectors[0] = [self._encode(name, bounds) for name, bounds in self.space.items()]
+        scores = np.array(
+            [self.score(m) for m in self.evaluate([self.decode(v) for v in vectors])]
+        )
+        for generation in range(generations):
+            trials = np.empty_like(vectors)
+            for i in range(population):
+                a, b, c = vectors[self.rng.choice(np.delete(np.arange(population), i), 3, False)]
+                mask = self.rng.random(dimensions) < crossover
+                mask[self.rng.integers(dimensions)] = True
+                trials[i] = np.where(mask, np.clip(a + mutation * (b - c), 0, 1), vectors[i])
+            trial_scores = np.array(
+                [self.score(m) for m in self.evaluate([self.decode(v) for v in trials])]
+            )
+            better = trial_scores <= scores
+            vectors[better], scores[better] = trials[better], trial_scores[better]
+            print(
+                f"Generation {generation + 1}/{generations}: best score "
+                f"{scores.min():.4f}, {len(self.cache)} designs evaluated"
+            )
+        best = self.decode(vectors[np.argmin(scores)])
+        return best, self.cache[self._key(best)][1], float(scores.min())
+
+    def _encode(self, name, bounds):
+        part, _, attribute = name.rpartition(".")
+        value = getattr(getattr(self.config, part) if part else self.config, attribute)
+        if isinstance(bounds[0], str):
+            return (bounds.index(value) + 0.5) / len(bounds) if value in bounds else 0.0
+        return float(np.clip((value - bounds[0]) / (bounds[1] - bounds[0]), 0, 1))
+
+    def pareto_front(self):
+        """Evaluated designs not dominated in (apogee, stability, mach)
+        objectives, sorted by score."""
+        entries = [
+            (design, metrics, objectives(metrics, self.targets))
+            for design, metrics in self.cache.values()
+        ]
+        entries = [entry for entry in entries if np.isfinite(list(entry[2].values())).all()]
+        front = []
+        for design, metrics, values in entries:
+            point = np.array(list(values.values()))
+            dominated = any(
+                (np.array(list(other.values())) <= point).all()
+                and (np.array(list(other.values())) < point).any()
+                for _, _, other in entries
+            )
+            if not dominated:
+                front.append((design, metrics))
+        return sorted(front, key=lambda entry: self.score(entry[1]))
+
+    def print_summary(self, designs=None):
+        """Prints the parameters and metrics of ``designs`` (default: the
+        Pareto front)."""
+        designs = self.pareto_front() if designs is None else designs
+        print(f"{len(self.cache)} designs evaluated, showing {len(designs)}")
+        names = list(self.space)
+        print(
+            " ".join(f"{name:>16}" for name in names)
+            + " ".join(f"{name[:14]:>15}" for name in METRICS)
+            + f"{'score':>9}"
+        )
+        for design, metrics in designs:
+            print(
+                " ".join(
+                    f"{design[name]:>16}" if isinstance(design[name], str)
+                    else f"{design[name]:>16.4f}"
+                    for name in names
+                )
+                + " ".join(f"{metrics.get(name, np.nan):>15.3f}" for name in METRICS)
+                + f"{self.score(metrics):>9.4f}"
+            )
+
+    def save(self, filename=None):
+        """Writes the evaluated designs to ``filename`` (default: the cache
+        file), if any."""
+        filename = filename or self.cache_file
+        if filename:
+            with open(filename, "w", encoding="utf-8") as file:
+                json.dump(list(self.cache.values()), file)
@@ -0,0 +1,145 @@
+"""Process-parallel map for flight simulations.
+
+rocketpy objects hold lambdas and large Functions that are slow or impossible
+to pickle, so worker processes are forked and inherit a shared ``state``
+(rockets, environments, profiles) instead of receiving it with every task.
+Only the small task tuples and the results cross the process boundary. Where
+``fork`` is not available (Windows) the tasks run serially in this process.
+"""
+
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+
+_STATE = None
+
+
+def worker_state():
+    """Returns the ``state`` given to ``parallel_map`` inside a worker."""
+    return _STATE
+
+
+def default_workers():
+    """Number of usable cores."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def parallel_map(function, tasks, state=None, workers=None, initializer=None):
+    """Calls ``function(task)`` for every task and returns the results in
+    order.
+
+    Parameters
+    ----------
+    function : callable
+        Module-level function taking one task. It can read the shared state
+        with ``worker_state()``.
+    tasks : iterable
+        Picklable task arguments.
+    state : object, optional
+        Object made available to the workers through ``worker_state()``. It is
+        inherited by the forked workers, never pickled.
+    workers : int, optional
+        Number of processes. Defaults to the number of usable cores. With one
+        worker, or without ``fork`` support, the tasks run in this process.
+    initializer : callable, optional
+        Called once in each worker before its first task, e.g. to attach to
+        shared memory.
+
+    Returns
+    -------
+    list
+        ``function(task)`` for each task.
+    """
+    return list(parallel_imap(function, tasks, state, workers, initializer))
+
+
+def parallel_imap(
+    function, tasks, state=None, workers=None, initializer=None, chunksize=1, window=None
+):
+    """Same as ``parallel_map``, but yields the results in order as soon as
+    they are done, so the caller can write them out while the workers carry
+    on. ``chunksize`` tasks are sent to a worker at a time.
+
+    Results done ahead of a slow task wait in this process until it is
+    done. With ``window``, at most that many tasks are given out and not yet
+    yielded, which bounds the memory they take (``chunksize`` is then 1).
+    """
+    global _STATE  # pylint: disable=global-statement
+    tasks = list(tasks)
+    workers = min(workers or default_workers(), len(tasks)) or 1
+    _STATE = state
+    try:
+        if workers == 1 or "fork" not in multiprocessing.get_all_start_methods():
+            if initializer is not None:
+                initializer()
+            for task in tasks:
+                yield function(task)
+            return
+        context = multiprocessing.get_context("fork")
+        with context.Pool(workers, initializer=initializer) as pool:
+            if window is None:
+                yield from pool.imap(function, tasks, chunksize=chunksize)
+                return
+            pending = deque()
+            for task in tasks:
+                if len(pending) >= max(window, workers):
+                    yield pending.popleft().get()
+                pending.append(pool.apply_async(function, (task,)))
+            while pending:
+                yield pending.popleft().get()
+    finally:
+        _STATE = None
+
+
+def _initialize(state, initializer):
+    global _STATE  # pylint: disable=global-statement
+    _STATE = state
+    if initializer is not None:
+        initializer()
+
+
+class _SerialExecutor(Executor):
+    """Runs each task when it is submitted, in this process."""
+
+    def __init__(self, state, initializer):
+        self._state = state
+        self._initializer = initializer
+
+    def submit(self, fn, /, *args, **kwargs):  # pylint: disable=arguments-differ
+        global _STATE  # pylint: disable=global-statement
+        future = Future()
+        previous, _STATE = _STATE, self._state
+        try:
+            if self._initializer is not None:
+                self._initializer()
+                self._initializer = None
+            future.set_result(fn(*args, **kwargs))
+        except Exception as error:  # pylint: disable=broad-except
+            future.set_exception(error)
+        finally:
+            _STATE = previous
+        return future
+
+
+def parallel_executor(state=None, workers=None, initializer=None):
+    """Returns a ``concurrent.futures`` executor for tasks that run while
+    this process carries on, e.g. rendering figures during a long script.
+
+    Same arguments as ``parallel_map``. The workers are forked on the first
+    submission and inherit ``state`` as it is then, never pickled. Use the
+    executor as a context manager, or call ``shutdown``, once its futures are
+    done. Without ``fork`` support the tasks run in this process as soon as
+    they are submitted.
+    """
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return _SerialExecutor(state, initializer)
+    return ProcessPoolExecutor(
+        workers or default_workers(),
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=_initialize,
+        initargs=(state, initializer),
+    )
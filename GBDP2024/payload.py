@@ -0,0 +1,79 @@
+"""Payload descent, flown from the state of the vehicle at separation.
+
+The payload leaves the vehicle at a deployment event (apogee, or the
+deployment of one of the vehicle's parachutes) and both descend on their own
+parachutes. ``fly_payload`` takes the state of an integrated vehicle flight at
+that event and flies the payload from it, so the ascent is integrated once
+for both bodies. ``campaign.run_parallel`` does the same for every sample and
+writes the ``PAYLOAD_OUTPUTS`` columns next to the vehicle's.
+"""
+
+import numpy as np
+from rocketpy import Flight
+
+# outputs file column -> payload Flight attribute
+PAYLOAD_OUTPUTS = {
+    "payload_x_impact": "x_impact",
+    "payload_y_impact": "y_impact",
+    "payload_impact_velocity": "impact_velocity",
+    "payload_t_final": "t_final",
+}
+
+
+def separation_time(flight, event="apogee"):
+    """Time of ``event`` in ``flight``: "apogee" or the name of a parachute
+    of the vehicle, whose deployment (trigger plus lag) it is."""
+    if event == "apogee":
+        return float(flight.apogee_time)
+    for time, parachute in flight.parachute_events:
+        if parachute.name == event:
+            return float(time + parachute.lag)
+    raise ValueError(f"Parachute '{event}' was not deployed in this flight.")
+
+
+def separation_state(flight, event="apogee"):
+    """State [t, x, y, z, vx, vy, vz, e0, e1, e2, e3, w1, w2, w3] of
+    ``flight`` at ``event``, interpolated between solver steps."""
+    time = separation_time(flight, event)
+    solution = np.asarray(flight.solution, dtype=float)
+    state = np.array([np.interp(time, solution[:, 0], column) for column in solution.T])
+    state[7:11] /= np.linalg.norm(state[7:11])  # the attitude quaternion stays a unit one
+    return state.tolist()
+
+
+def fly_payload(flight, payload, event="apogee", environment=None, **kwargs):
+    """Flies ``payload`` from the state of ``flight`` at ``event``.
+
+    Parameters
+    ----------
+    flight : Flight
+        Integrated flight of the vehicle carrying the payload.
+    payload : Rocket
+        The payload with its own parachutes, e.g. ``build_rocket`` of
+        ``VehicleConfig.payload``.
+    event : str, optional
+        Separation event, see ``separation_time``.
+    environment : Environment, optional
+        Defaults to the one of ``flight``.
+    kwargs : dict
+        Other ``Flight`` arguments.
+
+    Returns
+    -------
+    Flight
+        The payload descent, from separation to impact.
+    """
+    return Flight(
+        rocket=payload,
+        environment=environment or flight.env,
+        rail_length=flight.rail_length,
+        inclination=flight.inclination,
+        heading=flight.heading,
+        initial_solution=separation_state(flight, event),
+        **kwargs,
+    )
+
+
+def payload_outputs(payload_flight):
+    """``PAYLOAD_OUTPUTS`` columns of a payload descent."""
+    return {name: getattr(payload_flight, item) for name, item in PAYLOAD_OUTPUTS.items()}
@@ -0,0 +1,263 @@
+"""Wall/CPU-time instrumentation for the GBDP sim, Monte Carlo and results
+scripts.
+
+A single module-level ``PROFILER`` is shared by every script running in the
+same process, so ``montecarlo_results.py`` reports the stages of the
+``montecarlo.py`` and ``sim.py`` modules it imports as well as its own.
+Monte Carlo samples also carry the peak resident memory of the worker process
+that flew them, so campaigns can be sized to the machine's memory.
+"""
+
+import json
+import os
+import sys
+from contextlib import contextmanager
+from time import perf_counter, process_time
+
+import numpy as np
+
+from .running_statistics import _Histogram
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process, in MB."""
+    try:
+        import resource  # pylint: disable=import-outside-toplevel
+    except ImportError:  # Windows
+        return float("nan")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def current_rss_mb():
+    """Resident set size of this process now, in MB. Falls back to the peak
+    where /proc is not available."""
+    try:
+        with open("/proc/self/statm", "r", encoding="ascii") as file:
+            pages = int(file.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return peak_rss_mb()
+    return pages * os.sysconf("SC_PAGE_SIZE") / 1024**2
+
+
+class Profiler:
+    """Collects per-stage, per-flight and per-sample timings.
+
+    Attributes
+    ----------
+    name : str
+        Label written to the profile file.
+    stages : dict
+        Maps a stage name to its number of calls and accumulated wall and CPU
+        time, in seconds.
+    flights : list[dict]
+        Solver statistics of the flights registered with ``record_flight``.
+    samples : list[dict]
+        Timings and solver statistics of each Monte Carlo sample, empty once
+        ``spill_samples`` writes them to a file instead.
+    processes : dict
+        Maps each worker process that flew samples to its peak resident
+        memory, in MB.
+    """
+
+    def __init__(self, name="GBDP"):
+        self.name = name
+        self.stages = {}
+        self.flights = []
+        self.samples = []
+        self.processes = {}
+        self.samples_file = None
+        self._sample_file = None
+        self._sample_count = 0
+        # what the summary needs of the samples, kept when they are spilled:
+        # count, sum and max of the wall times, and a bounded histogram of them
+        self._wall_time = {"samples": 0, "total": 0.0, "max": 0.0}
+        self._wall_histogram = _Histogram(64)
+        self._solver_steps = 0
+        self._controllers = {"samples": 0, "calls": 0, "busy": 0.0, "max": 0.0}
+        self._open = {}
+        self._start_wall = perf_counter()
+        self._start_cpu = process_time()
+
+    def start(self, name):
+        """Starts timing the stage ``name``. Scripts call ``start``/``stop``
+        around their top-level blocks, library code uses ``stage``."""
+        self._open[name] = (perf_counter(), process_time())
+
+    def stop(self, name):
+        """Stops timing the stage ``name`` and accumulates its wall and CPU
+        time."""
+        wall, cpu = self._open.pop(name)
+        record = self.stages.setdefault(
+            name, {"calls": 0, "wall_time": 0.0, "cpu_time": 0.0}
+        )
+        record["calls"] += 1
+        record["wall_time"] += perf_counter() - wall
+        record["cpu_time"] += process_time() - cpu
+
+    @contextmanager
+    def stage(self, name):
+        """Times the enclosed block and accumulates it under ``name``."""
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop(name)
+
+    @staticmethod
+    def flight_stats(flight):
+        """Returns solver step, function evaluation and event counts of an
+        integrated Flight, and the calls and compute time (mean and longest,
+        in seconds) of its timed controllers (see ``air_brakes``)."""
+        # pylint: disable=import-outside-toplevel
+        from .air_brakes import ControllerTimer
+
+        evaluations = np.asarray(flight.function_evaluations)
+        # the counter restarts from zero on each flight phase, so the total is
+        # the sum of the last value logged in each phase
+        phase_ends = np.append(evaluations[1:] < evaluations[:-1], True)
+        stats = {
+            "solver_steps": len(flight.solution) - 1,
+            "function_evaluations": int(evaluations[phase_ends].sum()),
+            "flight_phases": len(flight.flight_phases),
+            "parachute_events": len(flight.parachute_events),
+            "t_final": float(flight.t_final),
+        }
+        timers = [
+            controller.base_controller_function
+            for controller in flight.rocket._controllers  # pylint: disable=protected-access
+            if isinstance(controller.base_controller_function, ControllerTimer)
+        ]
+        if timers:
+            calls = sum(timer.calls for timer in timers)
+            stats["controller_calls"] = calls
+            stats["controller_mean_time"] = sum(timer.total_time for timer in timers) / max(calls, 1)
+            stats["controller_max_time"] = max(timer.max_time for timer in timers)
+        return stats
+
+    def record_flight(self, flight, label="flight"):
+        """Stores the solver statistics of a Flight under ``label``."""
+        record = {"label": label, **self.flight_stats(flight)}
+        self.flights.append(record)
+        return record
+
+    def add_sample(self, record):
+        """Stores the timings and solver statistics of a Monte Carlo sample,
+        measured in a worker process of ``campaign.run_parallel``. The record
+        may carry its own "sample" index, and the "process" that flew it with
+        its "peak_rss_mb"."""
+        record = {"sample": self._sample_count, **record}
+        self._sample_count += 1
+        wall_time = self._wall_time
+        wall_time["samples"] += 1
+        wall_time["total"] += record["wall_time"]
+        wall_time["max"] = max(wall_time["max"], record["wall_time"])
+        self._wall_histogram.add(np.array([record["wall_time"]]))
+        self._solver_steps += record.get("solver_steps", 0)
+        if "controller_calls" in record:
+            self._controllers["samples"] += 1
+            self._controllers["calls"] += record["controller_calls"]
+            self._controllers["busy"] += record["controller_mean_time"] * record["controller_calls"]
+            self._controllers["max"] = max(self._controllers["max"], record["controller_max_time"])
+        if "process" in record:
+            self.processes[record["process"]] = max(
+                self.processes.get(record["process"], 0.0), record["peak_rss_mb"]
+            )
+        if self._sample_file is not None:
+            self._sample_file.write(json.dumps(record) + "\n")
+        else:
+            self.samples.append(record)
+        return record
+
+    def spill_samples(self, filename):
+        """Writes the samples added from now on to ``filename``, one JSON
+        line each, instead of keeping them. The samples already added are
+        written first. The summary is unchanged."""
+        if self._sample_file is not None:
+            self._sample_file.close()
+        self._sample_file = open(filename, "w", encoding="utf-8")  # pylint: disable=consider-using-with
+        self.samples_file = filename
+        for record in self.samples:
+            self._sample_file.write(json.dumps(record) + "\n")
+        self.samples = []
+
+    def to_dict(self):
+        """Returns all collected data as a JSON serializable dictionary."""
+        if self._sample_file is not None:
+            self._sample_file.flush()
+        return {
+            "name": self.name,
+            "total_wall_time": perf_counter() - self._start_wall,
+            "total_cpu_time": process_time() - self._start_cpu,
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": self.stages,
+            "flights": self.flights,
+            "samples": self.samples,
+            "samples_file": self.samples_file,
+            "processes": self.processes,
+        }
+
+    def save(self, filename):
+        """Writes the profile to ``filename`` as JSON."""
+        with open(filename, "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+    def summary(self):
+        """Returns a text table of the stages and sample statistics."""
+        data = self.to_dict()
+        total = data["total_wall_time"] or 1.0
+        lines = [
+            f"PROFILE: {self.name} ({data['total_wall_time']:.2f} s wall, "
+            f"{data['total_cpu_time']:.2f} s CPU)",
+            f"{'stage':<28}{'calls':>7}{'wall [s]':>11}{'cpu [s]':>11}{'wall %':>8}",
+        ]
+        for name, record in self.stages.items():
+            lines.append(
+                f"{name:<28}{record['calls']:>7}{record['wall_time']:>11.3f}"
+                f"{record['cpu_time']:>11.3f}{100 * record['wall_time'] / total:>8.1f}"
+            )
+        for flight in self.flights:
+            lines.append(
+                f"flight '{flight['label']}': {flight['solver_steps']} steps, "
+                f"{flight['function_evaluations']} evaluations, "
+                f"{flight['parachute_events']} parachute events"
+            )
+            if "controller_calls" in flight:
+                lines.append(
+                    f"  controller: {flight['controller_calls']} calls, mean "
+                    f"{1e6 * flight['controller_mean_time']:.1f} us, max "
+                    f"{1e6 * flight['controller_max_time']:.1f} us per step"
+                )
+        wall_time = self._wall_time
+        if wall_time["samples"]:
+            count = wall_time["samples"]
+            p95 = min(self._wall_histogram.quantile(0.95), wall_time["max"])
+            lines.append(
+                f"{count} samples: mean {wall_time['total'] / count:.3f} s, "
+                f"p95 {p95:.3f} s, max {wall_time['max']:.3f} s, "
+                f"mean {self._solver_steps / count:.0f} solver steps"
+            )
+            controllers = self._controllers
+            if controllers["samples"]:
+                lines.append(
+                    f"controllers: {controllers['calls'] / controllers['samples']:.0f} calls per "
+                    f"sample, mean {1e6 * controllers['busy'] / max(controllers['calls'], 1):.1f} "
+                    f"us, max {1e6 * controllers['max']:.1f} us per step"
+                )
+        if self.processes:
+            peaks = np.array(list(self.processes.values()))
+            lines.append(
+                f"memory: {len(peaks)} worker processes, peak RSS mean {peaks.mean():.0f} MB, "
+                f"max {peaks.max():.0f} MB; this process {data['peak_rss_mb']:.0f} MB"
+            )
+        return "\n".join(lines)
+
+    def report(self, filename):
+        """Saves the profile to ``filename`` and prints the summary table."""
+        self.save(filename)
+        print(self.summary())
+        print(f"Profile saved to {filename}")
+
+
+PROFILER = Profiler()
@@ -0,0 +1,447 @@
+"""Headless flight report, rendered while the results script carries on.
+
+``Flight.plots`` draws one interactive window after the other and evaluates
+the Flight Functions again for every plot. ``FlightReport`` copies the time
+series the plots need once (the Flight Functions are already tabulated on the
+solver time steps), renders every figure with the Agg backend in forked worker
+processes, and bundles them into a single HTML and/or PDF file.
+
+Typical use::
+
+    report = FlightReport(test_flight, title="Hybrid flight").start()
+    ...  # anything else, the figures render in the background
+    report.add_curves("apogee_by_mass", "Apogee by mass", "Mass (kg)",
+                      "Apogee AGL (m)", [(mass, apogee, None)])
+    report.save(html_file="report.html", pdf_file="report.pdf")
+"""
+
+import base64
+import html
+import io
+import os
+import tempfile
+from datetime import datetime
+
+import numpy as np
+
+from .parallel import parallel_executor, worker_state
+
+# name, title, x axis label, event the time axis stops at, and panels of
+# (y axis label, Flight attributes)
+FIGURES = (
+    (
+        "linear_kinematics",
+        "Linear kinematics",
+        "Time (s)",
+        "t_final",
+        (
+            ("Velocity (m/s)", ("vx", "vy", "vz", "speed")),
+            ("Acceleration (m/s²)", ("ax", "ay", "az", "acceleration")),
+        ),
+    ),
+    (
+        "flight_path",
+        "Flight path and attitude angles",
+        "Time (s)",
+        "apogee_time",
+        (
+            ("Angle (°)", ("path_angle", "attitude_angle")),
+            ("Angle (°)", ("lateral_attitude_angle",)),
+        ),
+    ),
+    (
+        "attitude",
+        "Attitude",
+        "Time (s)",
+        "apogee_time",
+        (
+            ("Euler parameters", ("e0", "e1", "e2", "e3")),
+            ("Euler angles (°)", ("psi", "theta", "phi")),
+        ),
+    ),
+    (
+        "angular_kinematics",
+        "Angular kinematics",
+        "Time (s)",
+        "apogee_time",
+        (
+            ("Angular velocity (rad/s)", ("w1", "w2", "w3")),
+            ("Angular acceleration (rad/s²)", ("alpha1", "alpha2", "alpha3")),
+        ),
+    ),
+    (
+        "aerodynamic_forces",
+        "Aerodynamic forces and moments",
+        "Time (s)",
+        "apogee_time",
+        (
+            ("Force (N)", ("aerodynamic_lift", "aerodynamic_drag")),
+            ("Moment (N m)", ("aerodynamic_bending_moment", "aerodynamic_spin_moment")),
+        ),
+    ),
+    (
+        "rail_buttons_forces",
+        "Rail button forces",
+        "Time (s)",
+        "out_of_rail_time",
+        (
+            ("Normal force (N)", ("rail_button1_normal_force", "rail_button2_normal_force")),
+            ("Shear force (N)", ("rail_button1_shear_force", "rail_button2_shear_force")),
+        ),
+    ),
+    (
+        "energy",
+        "Energy and power",
+        "Time (s)",
+        "apogee_time",
+        (
+            ("Energy (J)", ("kinetic_energy", "potential_energy", "total_energy")),
+            ("Power (W)", ("thrust_power", "drag_power")),
+        ),
+    ),
+    (
+        "fluid_mechanics",
+        "Fluid mechanics",
+        "Time (s)",
+        "apogee_time",
+        (
+            ("Mach number", ("mach_number",)),
+            ("Reynolds number", ("reynolds_number",)),
+            ("Pressure (Pa)", ("dynamic_pressure", "total_pressure", "pressure")),
+            ("Angle (°)", ("angle_of_attack", "angle_of_sideslip")),
+        ),
+    ),
+    (
+        "stability",
+        "Stability margin",
+        "Time (s)",
+        "apogee_time",
+        (("Stability margin (c)", ("stability_margin",)),),
+    ),
+    (
+        "frequency_response",
+        "Frequency response",
+        "Frequency (Hz)",
+        None,
+        (
+            (
+                "Fourier amplitude",
+                (
+                    "attitude_frequency_response",
+                    "omega1_frequency_response",
+                    "omega2_frequency_response",
+                    "omega3_frequency_response",
+                ),
+            ),
+        ),
+    ),
+    (
+        "altitude_speed",
+        "Altitude and speed",
+        "Time (s)",
+        "t_final",
+        (
+            ("Altitude AGL (m)", ("altitude",)),
+            ("Speed (m/s)", ("speed",)),
+        ),
+    ),
+)
+
+SUMMARY = (
+    ("Apogee AGL (m)", "apogee_agl"),
+    ("Apogee time (s)", "apogee_time"),
+    ("Out of rail velocity (m/s)", "out_of_rail_velocity"),
+    ("Out of rail stability margin (c)", "out_of_rail_stability_margin"),
+    ("Max speed (m/s)", "max_speed"),
+    ("Max Mach number", "max_mach_number"),
+    ("Max acceleration (m/s²)", "max_acceleration"),
+    ("Impact X (m)", "x_impact"),
+    ("Impact Y (m)", "y_impact"),
+    ("Impact velocity (m/s)", "impact_velocity"),
+    ("Flight time (s)", "t_final"),
+)
+
+
+def flight_series(flight):
+    """Copies the tabulated Flight Functions used by ``FIGURES`` and the 3D
+    trajectory into plain arrays.
+
+    Returns
+    -------
+    dict
+        Maps an attribute name to (x, y, label) with the Function's input and
+        output arrays and its output label. Attributes the Flight cannot
+        compute (e.g. rail button forces without rail buttons) are left out.
+    """
+    names = {"x", "y", "altitude"}
+    for *_, panels in FIGURES:
+        for _, attributes in panels:
+            names.update(attributes)
+    series = {}
+    for name in sorted(names):
+        try:
+            function = getattr(flight, name)
+        except (AttributeError, IndexError, ValueError):
+            continue
+        source = np.array(function.source, dtype=float)
+        series[name] = (source[:, 0], source[:, 1], function.__outputs__[0])
+    return series
+
+
+def flight_summary(flight):
+    """Main scalar results of a Flight, with the ``SUMMARY`` keys."""
+    return {
+        "apogee_agl": flight.apogee - flight.env.elevation,
+        "apogee_time": flight.apogee_time,
+        "out_of_rail_velocity": flight.out_of_rail_velocity,
+        "out_of_rail_stability_margin": flight.out_of_rail_stability_margin,
+        "max_speed": flight.max_speed,
+        "max_mach_number": flight.max_mach_number,
+        "max_acceleration": flight.max_acceleration,
+        "x_impact": flight.x_impact,
+        "y_impact": flight.y_impact,
+        "impact_velocity": flight.impact_velocity,
+        "t_final": flight.t_final,
+    }
+
+
+def _figure_bytes(fig, dpi=110):
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=dpi)
+    return buffer.getvalue()
+
+
+def _headless():
+    """Worker initializer: switches matplotlib to the non-interactive Agg
+    backend, the parent process may be using an interactive one."""
+    import matplotlib.pyplot as plt  # pylint: disable=import-outside-toplevel
+
+    plt.switch_backend("Agg")
+
+
+def _render(task):
+    """Worker: renders one figure and returns its PNG bytes."""
+    from matplotlib.figure import Figure  # pylint: disable=import-outside-toplevel
+
+    kind, payload = task
+    state = worker_state()
+    series, events = state["series"], state["events"]
+
+    if kind == "panels":
+        _, title, xlabel, until, panels = payload
+        fig = Figure(figsize=(9, 3.2 * len(panels)))
+        axes = fig.subplots(len(panels), 1, squeeze=False)[:, 0]
+        end = events.get(until) if until else None
+        for ax, (ylabel, attributes) in zip(axes, panels):
+            for attribute in attributes:
+                if attribute not in series:
+                    continue
+                x, y, label = series[attribute]
+                visible = x <= end if end else slice(None)
+                ax.plot(x[visible], y[visible], label=label)
+            if xlabel == "Time (s)":
+                for event in ("out_of_rail_time", "burn_out_time", "apogee_time"):
+                    if event in events and (end is None or events[event] <= end):
+                        ax.axvline(events[event], color="gray", linestyle=":", linewidth=0.8)
+            ax.set_ylabel(ylabel)
+            ax.grid(True, alpha=0.3)
+            if ax.get_legend_handles_labels()[0]:
+                ax.legend(fontsize="small")
+        axes[-1].set_xlabel(xlabel)
+        fig.suptitle(title)
+        fig.tight_layout()
+        return _figure_bytes(fig)
+
+    if kind == "trajectory":
+        fig = Figure(figsize=(8, 7))
+        ax = fig.add_subplot(projection="3d")
+        x, y, altitude = (series[name][1] for name in ("x", "y", "altitude"))
+        ax.plot(x, y, altitude, linewidth=1.5)
+        ax.plot(x, y, np.zeros_like(altitude), color="gray", linestyle="--", linewidth=0.8)
+        ax.scatter(0, 0, 0, color="black", s=10)
+        ax.set_xlabel("X - East (m)")
+        ax.set_ylabel("Y - North (m)")
+        ax.set_zlabel("Altitude AGL (m)")
+        ax.set_title("Flight trajectory")
+        return _figure_bytes(fig)
+
+    if kind == "rocket":
+        # Rocket.draw only draws through pyplot, so it goes through a file
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "rocket.png")
+            state["rocket"].draw(filename=filename)
+            with open(filename, "rb") as file:
+                return file.read()
+
+    if kind == "curves":
+        title, xlabel, ylabel, curves, xlim = payload
+        fig = Figure(figsize=(9, 4.5))
+        ax = fig.subplots()
+        for x, y, label in curves:
+            ax.plot(x, y, label=label)
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel(ylabel)
+        ax.set_title(title)
+        if xlim is not None:
+            ax.set_xlim(*xlim)
+        ax.grid(True, alpha=0.3)
+        if any(label for *_, label in curves):
+            ax.legend(fontsize="small")
+        fig.tight_layout()
+        return _figure_bytes(fig)
+
+    raise ValueError(f"Unknown figure kind '{kind}'.")
+
+
+class FlightReport:
+    """Renders the flight figures in the background and writes them as one
+    HTML and/or PDF report.
+
+    Parameters
+    ----------
+    flight : Flight
+        Integrated flight. Its time series are copied once when the report
+        is created.
+    title : str, optional
+        Report title.
+    rocket : Rocket, optional
+        If given, the rocket drawing is added to the report.
+    workers : int, optional
+        Number of rendering processes, defaults to all cores.
+    """
+
+    def __init__(self, flight, title="Flight report", rocket=None, workers=None):
+        self.title = title
+        self.summary = flight_summary(flight)
+        self.events = {
+            "out_of_rail_time": flight.out_of_rail_time,
+            "burn_out_time": flight.rocket.motor.burn_out_time,
+            "apogee_time": flight.apogee_time,
+            "t_final": flight.t_final,
+        }
+        self.series = flight_series(flight)
+        self.rocket = rocket
+        self.workers = workers
+        self._executor = None
+        self._figures = []  # (name, title, future)
+
+    def start(self):
+        """Submits all the flight figures and returns immediately."""
+        self._executor = parallel_executor(
+            state={"series": self.series, "events": self.events, "rocket": self.rocket},
+            workers=self.workers,
+            initializer=_headless,
+        )
+        self._submit("trajectory_3d", "Flight trajectory", ("trajectory", None))
+        for figure in FIGURES:
+            self._submit(figure[0], figure[1], ("panels", figure))
+        if self.rocket is not None:
+            self._submit("rocket_drawing", "Rocket drawing", ("rocket", None))
+        return self
+
+    def _submit(self, name, title, task):
+        if self._executor is None:
+            raise RuntimeError("Call FlightReport.start() before adding figures.")
+        self._figures.append((name, title, self._executor.submit(_render, task)))
+
+    def add_curves(self, name, title, xlabel, ylabel, curves, xlim=None):
+        """Adds a figure of (x, y, label) curves computed by the script, e.g.
+        the mass sweeps. Labels can be None."""
+        curves = [
+            (np.asarray(x, dtype=float), np.asarray(y, dtype=float), label)
+            for x, y, label in curves
+        ]
+        self._submit(name, title, ("curves", (title, xlabel, ylabel, curves, xlim)))
+
+    def add_function(self, name, title, function, label=None):
+        """Adds a figure of a tabulated rocketpy Function."""
+        source = np.asarray(function.source, dtype=float)
+        self.add_curves(
+            name,
+            title,
+            function.__inputs__[0],
+            function.__outputs__[0],
+            [(source[:, 0], source[:, 1], label)],
+        )
+
+    def figures(self):
+        """Waits for the figures and returns a list of (name, title, PNG
+        bytes), in the order they were added."""
+        return [(name, title, future.result()) for name, title, future in self._figures]
+
+    def save(self, html_file=None, pdf_file=None, figures_dir=None):
+        """Waits for all the figures and writes the report.
+
+        Parameters
+        ----------
+        html_file : str, optional
+            Self-contained HTML report, with the figures embedded.
+        pdf_file : str, optional
+            PDF report, one page per figure after a summary page.
+        figures_dir : str, optional
+            If given, each figure is also saved there as ``<name>.png``.
+        """
+        figures = self.figures()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if figures_dir:
+            os.makedirs(figures_dir, exist_ok=True)
+            for name, _, image in figures:
+                with open(os.path.join(figures_dir, f"{name}.png"), "wb") as file:
+                    file.write(image)
+        if html_file:
+            self._write_html(html_file, figures)
+        if pdf_file:
+            self._write_pdf(pdf_file, figures)
+        return figures
+
+    def _summary_rows(self):
+        return [(label, f"{self.summary[key]:.2f}") for label, key in SUMMARY]
+
+    def _write_html(self, filename, figures):
+        rows = "".join(
+            f"<tr><td>{html.escape(label)}</td><td>{value}</td></tr>"
+            for label, value in self._summary_rows()
+        )
+        sections = "".join(
+            f'<h2 id="{name}">{html.escape(title)}</h2>'
+            f'<img src="data:image/png;base64,{base64.b64encode(image).decode()}" '
+            f'alt="{html.escape(title)}">'
+            for name, title, image in figures
+        )
+        contents = "".join(
+            f'<li><a href="#{name}">{html.escape(title)}</a></li>'
+            for name, title, _ in figures
+        )
+        with open(filename, "w", encoding="utf-8") as file:
+            file.write(
+                "<!DOCTYPE html><html><head><meta charset='utf-8'>"
+                f"<title>{html.escape(self.title)}</title><style>"
+                "body{font-family:sans-serif;max-width:1000px;margin:auto}"
+                "img{max-width:100%}td{padding:2px 12px}</style></head><body>"
+                f"<h1>{html.escape(self.title)}</h1>"
+                f"<p>Generated {datetime.now():%Y-%m-%d %H:%M}</p>"
+                f"<table>{rows}</table><ul>{contents}</ul>{sections}</body></html>"
+            )
+
+    def _write_pdf(self, filename, figures):
+        # pylint: disable=import-outside-toplevel
+        from matplotlib.backends.backend_pdf import PdfPages
+        from matplotlib.figure import Figure
+        from matplotlib.image import imread
+
+        with PdfPages(filename) as pdf:
+            page = Figure(figsize=(8.27, 11.69))
+            page.text(0.1, 0.92, self.title, fontsize=18)
+            for row, (label, value) in enumerate(self._summary_rows()):
+                page.text(0.1, 0.85 - 0.03 * row, label)
+                page.text(0.6, 0.85 - 0.03 * row, value)
+            pdf.savefig(page)
+            # the figures are already rendered, pages only place the images
+            for _, _, image in figures:
+                pixels = imread(io.BytesIO(image), format="png")
+                height, width = pixels.shape[:2]
+                page = Figure(figsize=(width / 110, height / 110))
+                page.figimage(pixels)
+                pdf.savefig(page, dpi=110)
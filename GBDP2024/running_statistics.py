@@ -0,0 +1,457 @@
+"""Incremental statistics of a Monte Carlo campaign.
+
+``MonteCarlo`` re-reads the whole outputs file and recomputes every statistic
+each time it is built or its files are set, so appending a batch to a large
+campaign costs as much as reading all of it. ``RunningStatistics`` keeps the
+running moments, a bounded histogram of every scalar output and the impact
+and apogee covariance next to the outputs file, together with the byte offset
+already consumed. ``campaign.run_parallel`` feeds it each sample as it is
+written, ``sync`` reads only the lines written since the last update, and the
+summary, percentiles and dispersion ellipses come from the stored state.
+"""
+
+import json
+import os
+
+import numpy as np
+
+PAIRS = {
+    "impact": ("x_impact", "y_impact"),
+    "apogee": ("apogee_x", "apogee_y"),
+    "payload_impact": ("payload_x_impact", "payload_y_impact"),  # see payload
+}
+
+# KML colors (aabbggrr) of the ellipses, impact and apogee as in MonteCarlo
+KML_COLORS = {"impact": "ffff0000", "apogee": "ff00ff00", "payload_impact": "ff00a5ff"}
+
+
+class _Histogram:
+    """Fixed number of equal bins whose range doubles to cover new values,
+    merging pairs of bins, so memory stays bounded for any campaign size.
+
+    The bins are sized from the spread of the first ``bins`` values, which
+    are kept as they are until then (samples are added one at a time as
+    they are written)."""
+
+    def __init__(self, bins, low=None, width=None, counts=None, pending=None):
+        self.bins = bins
+        self.low = low
+        self.width = width
+        self.counts = np.zeros(bins, dtype=np.int64) if counts is None else np.asarray(counts)
+        self.pending = [] if pending is None else list(pending)
+
+    @property
+    def high(self):
+        return self.low + self.bins * self.width
+
+    @property
+    def edges(self):
+        return self.low + self.width * np.arange(self.bins + 1)
+
+    def _grow(self, minimum, maximum):
+        while minimum < self.low:
+            merged = np.concatenate([np.zeros_like(self.counts), self.counts])
+            self.low -= self.bins * self.width
+            self.counts = merged[0::2] + merged[1::2]
+            self.width *= 2
+        while maximum >= self.high:
+            merged = np.concatenate([self.counts, np.zeros_like(self.counts)])
+            self.counts = merged[0::2] + merged[1::2]
+            self.width *= 2
+
+    def add(self, values):
+        if self.low is None:
+            self.pending.extend(values.tolist())
+            if len(self.pending) >= self.bins:
+                self.settle()
+            return
+        self._grow(values.min(), values.max())
+        self._count(values)
+
+    def settle(self):
+        """Sizes the bins from the values kept so far and counts them."""
+        if self.low is not None or not self.pending:
+            return
+        values, self.pending = np.asarray(self.pending, dtype=float), []
+        minimum, maximum = values.min(), values.max()
+        span = maximum - minimum
+        self.width = span / (self.bins - 1) if span > 0 else max(abs(minimum), 1.0) * 1e-3
+        self.low = minimum
+        self._count(values)
+
+    def _count(self, values):
+        index = np.clip(((values - self.low) // self.width).astype(int), 0, self.bins - 1)
+        np.add.at(self.counts, index, 1)
+
+    def quantile(self, q):
+        """Quantile interpolated linearly inside the bins, exact before the
+        bins are sized."""
+        if self.low is None:
+            return float(np.quantile(self.pending, q))
+        cumulative = np.concatenate([[0], np.cumsum(self.counts)])
+        return float(np.interp(q * cumulative[-1], cumulative, self.edges))
+
+    def to_dict(self):
+        return {
+            "low": self.low,
+            "width": self.width,
+            "counts": self.counts.tolist(),
+            "pending": self.pending,
+        }
+
+
+class RunningStatistics:
+    """Running statistics of the scalar outputs of a Monte Carlo campaign.
+
+    Parameters
+    ----------
+    filename : str, optional
+        JSON file the state is saved to, usually
+        ``f"{monte_carlo.filename}.stats.json"``.
+    bins : int, optional
+        Number of histogram bins per output, default 64.
+
+    Means and variances are merged batch by batch (Chan et al.), so they are
+    exact. Medians and 95% intervals come from the histograms and are
+    accurate to about one bin width.
+    """
+
+    def __init__(self, filename=None, bins=64):
+        self.filename = filename
+        self.bins = bins
+        self.reset()
+
+    def reset(self):
+        """Forgets all samples, e.g. before the outputs file is rewritten."""
+        self.samples = 0
+        self.offset = 0
+        self.moments = {}
+        self.histograms = {}
+        self.pairs = {}
+
+    @classmethod
+    def for_campaign(cls, monte_carlo, bins=64):
+        """Statistics stored next to the files of ``monte_carlo``, loaded if
+        they were saved before."""
+        filename = f"{monte_carlo.filename}.stats.json"
+        if os.path.exists(filename):
+            return cls.load(filename)
+        return cls(filename, bins)
+
+    @classmethod
+    def for_outputs(cls, filename, bins=64):
+        """Statistics of the campaign files ``filename`` (as
+        ``MonteCarlo.filename``), brought up to date with its outputs file
+        and saved to ``{filename}.stats.json``. Campaigns run without
+        statistics get them from their whole outputs file, once."""
+        statistics_file = f"{filename}.stats.json"
+        if os.path.exists(statistics_file):
+            statistics = cls.load(statistics_file)
+        else:
+            statistics = cls(statistics_file, bins)
+        if statistics.sync(f"{filename}.outputs.txt"):
+            statistics.save()
+        return statistics
+
+    def update(self, outputs):
+        """Adds a batch of samples.
+
+        Parameters
+        ----------
+        outputs : list[dict]
+            One outputs dictionary per sample, as in the outputs file. Only
+            numeric scalars are used.
+        """
+        if not outputs:
+            return
+        columns = {}
+        for output in outputs:
+            for key, value in output.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    columns.setdefault(key, []).append(value)
+        for key, values in columns.items():
+            values = np.asarray(values, dtype=float)
+            values = values[np.isfinite(values)]
+            if len(values) == 0:
+                continue
+            self._merge_moments(key, values)
+            if key not in self.histograms:
+                self.histograms[key] = _Histogram(self.bins)
+            self.histograms[key].add(values)
+        for name, (key_x, key_y) in PAIRS.items():
+            points = np.array(
+                [
+                    (output[key_x], output[key_y])
+                    for output in outputs
+                    if key_x in output and key_y in output
+                ],
+                dtype=float,
+            ).reshape(-1, 2)
+            if len(points):
+                self._merge_pair(name, points)
+        self.samples += len(outputs)
+
+    def _merge_moments(self, key, values):
+        count, mean, m2, minimum, maximum = self.moments.get(
+            key, (0, 0.0, 0.0, np.inf, -np.inf)
+        )
+        batch_count, batch_mean = len(values), values.mean()
+        batch_m2 = float(((values - batch_mean) ** 2).sum())
+        total = count + batch_count
+        delta = batch_mean - mean
+        self.moments[key] = (
+            total,
+            float(mean + delta * batch_count / total),
+            float(m2 + batch_m2 + delta**2 * count * batch_count / total),
+            float(min(minimum, values.min())),
+            float(max(maximum, values.max())),
+        )
+
+    def _merge_pair(self, name, points):
+        count, mean, comoment = self.pairs.get(name, (0, np.zeros(2), np.zeros((2, 2))))
+        batch_count, batch_mean = len(points), points.mean(axis=0)
+        centered = points - batch_mean
+        total = count + batch_count
+        delta = batch_mean - mean
+        self.pairs[name] = (
+            total,
+            mean + delta * batch_count / total,
+            comoment + centered.T @ centered + np.outer(delta, delta) * count * batch_count / total,
+        )
+
+    def sync(self, output_file):
+        """Adds the samples written to ``output_file`` since the last sync.
+
+        If the file is shorter than what was already read it was rewritten,
+        and the statistics start over.
+
+        Returns
+        -------
+        int
+            Number of new samples.
+        """
+        if not os.path.exists(output_file):
+            return 0
+        if os.path.getsize(output_file) < self.offset:
+            self.reset()
+        with open(output_file, "rb") as file:
+            file.seek(self.offset)
+            lines = file.readlines()
+        # an unterminated last line is still being written, leave it for later
+        if lines and not lines[-1].endswith(b"\n"):
+            lines.pop()
+        self.update([json.loads(line) for line in lines if line.strip()])
+        self.offset += sum(len(line) for line in lines)
+        return len(lines)
+
+    def add_line(self, line):
+        """Adds one sample from the outputs file line just written for it
+        (without its newline), keeping the offset in step with the file."""
+        self.update([json.loads(line)])
+        self.offset += len(line.encode("utf-8")) + 1
+
+    def mean(self, key):
+        return self.moments[key][1]
+
+    def std(self, key):
+        """Population standard deviation, as in ``MonteCarlo.processed_results``."""
+        count, _, m2, _, _ = self.moments[key]
+        return float(np.sqrt(m2 / count))
+
+    def quantile(self, key, q):
+        """Quantile from the histogram, within the exact range of the
+        samples (a constant output has no spread)."""
+        _, _, _, minimum, maximum = self.moments[key]
+        return float(np.clip(self.histograms[key].quantile(q), minimum, maximum))
+
+    def processed_results(self):
+        """(mean, median, std, 2.5% and 97.5% quantiles) of each output, like
+        ``MonteCarlo.processed_results``."""
+        return {
+            key: (
+                self.mean(key),
+                self.quantile(key, 0.5),
+                self.std(key),
+                self.quantile(key, 0.025),
+                self.quantile(key, 0.975),
+            )
+            for key in self.moments
+        }
+
+    def ellipse(self, name, sigma=1):
+        """Center, width, height and angle (deg) of the ``sigma`` dispersion
+        ellipse of "impact", "apogee" or "payload_impact"."""
+        count, mean, comoment = self.pairs[name]
+        eigenvalues, eigenvectors = np.linalg.eigh(comoment / count)
+        width, height = 2 * sigma * np.sqrt(np.maximum(eigenvalues[::-1], 0))
+        angle = np.degrees(np.arctan2(eigenvectors[1, 1], eigenvectors[0, 1]))
+        return tuple(mean), width, height, angle
+
+    def print_summary(self):
+        """Prints the table of ``MonteCarlo.prints.all`` from the stored state."""
+        print(f"Monte Carlo statistics of {self.samples} simulations (incremental)")
+        print(
+            f"{'Parameter':>25} {'Mean':>15} {'Median':>15} {'Std. Dev.':>15} "
+            f"{'95% PI Lower':>15} {'95% PI Upper':>15}"
+        )
+        print("-" * 105)
+        for key, values in self.processed_results().items():
+            print(f"{key:>25} " + " ".join(f"{value:>15.3f}" for value in values))
+
+    def plot_histograms(self, keys=None, filename=None):
+        """Plots the stored histograms of ``keys`` (default: all outputs).
+
+        If ``filename`` is given the figure is saved instead of shown.
+        """
+        import matplotlib.pyplot as plt  # pylint: disable=import-outside-toplevel
+
+        keys = list(self.histograms) if keys is None else keys
+        columns = min(3, len(keys))
+        rows = -(-len(keys) // columns)
+        fig, axes = plt.subplots(rows, columns, figsize=(5 * columns, 3.5 * rows), squeeze=False)
+        for ax, key in zip(axes.flat, keys):
+            histogram = self.histograms[key]
+            histogram.settle()
+            ax.stairs(histogram.counts, histogram.edges, fill=True)
+            ax.axvline(self.mean(key), color="k", linestyle="--")
+            ax.set_title(key)
+            ax.set_ylabel("Samples")
+        for ax in axes.flat[len(keys):]:
+            ax.axis("off")
+        fig.tight_layout()
+        if filename:
+            fig.savefig(filename)
+            plt.close(fig)
+        else:
+            plt.show()
+
+    def plot_ellipses(self, xlim=None, ylim=None, filename=None):
+        """Plots the 1, 2 and 3 sigma impact, apogee and payload impact
+        ellipses.
+
+        If ``filename`` is given the figure is saved instead of shown.
+        """
+        # pylint: disable=import-outside-toplevel
+        import matplotlib.pyplot as plt
+        from matplotlib.patches import Ellipse
+
+        fig, ax = plt.subplots(figsize=(8, 7))
+        for name, color in (
+            ("impact", "tab:red"), ("apogee", "tab:blue"), ("payload_impact", "tab:orange")
+        ):
+            if name not in self.pairs:
+                continue
+            for sigma in (1, 2, 3):
+                center, width, height, angle = self.ellipse(name, sigma)
+                ax.add_patch(
+                    Ellipse(center, width, height, angle=angle, color=color, alpha=0.4 / sigma,
+                            label=f"{name} {sigma}σ")
+                )
+            ax.plot(*self.ellipse(name)[0], "+", color=color)
+        ax.plot(0, 0, "k*", label="Launch site")
+        ax.autoscale_view()
+        ax.set_aspect("equal")
+        if xlim:
+            ax.set_xlim(*xlim)
+        if ylim:
+            ax.set_ylim(*ylim)
+        ax.set_xlabel("East (m)")
+        ax.set_ylabel("North (m)")
+        ax.set_title(f"Dispersion ellipses ({self.samples} simulations)")
+        ax.legend()
+        fig.tight_layout()
+        if filename:
+            fig.savefig(filename)
+            plt.close(fig)
+        else:
+            plt.show()
+
+    def export_ellipses_to_kml(self, filename, origin_lat, origin_lon, names=None, resolution=100):
+        """Saves the 1, 2 and 3 sigma ellipses as a KML file, like
+        ``MonteCarlo.export_ellipses_to_kml`` but from the stored state.
+
+        Parameters
+        ----------
+        filename : str
+            KML file.
+        origin_lat, origin_lon : float
+            Launch site coordinates, degrees.
+        names : list[str], optional
+            Ellipses to export among "impact", "apogee" and
+            "payload_impact", default: all. Those without samples are
+            skipped.
+        resolution : int, optional
+            Points per ellipse.
+        """
+        # pylint: disable=import-outside-toplevel
+        import simplekml
+        from matplotlib.patches import Ellipse
+        from rocketpy.tools import generate_monte_carlo_ellipses_coordinates
+
+        kml = simplekml.Kml()
+        for name in names or PAIRS:
+            if name not in self.pairs:
+                continue
+            ellipses = []
+            for sigma in (1, 2, 3):
+                center, width, height, angle = self.ellipse(name, sigma)
+                ellipses.append(Ellipse(center, width, height, angle=angle))
+            coordinates = generate_monte_carlo_ellipses_coordinates(
+                ellipses, origin_lat, origin_lon, resolution=resolution
+            )
+            for sigma, points in enumerate(coordinates, start=1):
+                label = f"{name.replace('_', ' ').capitalize()} Ellipse {sigma}"
+                geometry = kml.newmultigeometry(name=label)
+                geometry.newpolygon(
+                    outerboundaryis=[(lon, lat) for lat, lon in points], name=label
+                )
+                geometry.tessellate = 1
+                geometry.visibility = 1
+                geometry.style.linestyle.color = KML_COLORS[name]
+                geometry.style.linestyle.width = 3
+                geometry.style.polystyle.color = simplekml.Color.changealphaint(
+                    80, KML_COLORS[name]
+                )
+        kml.newpoint(
+            name="Launch Pad",
+            coords=[(origin_lon, origin_lat)],
+            description="Flight initial position",
+        )
+        kml.save(filename)
+
+    def to_dict(self):
+        return {
+            "bins": self.bins,
+            "samples": self.samples,
+            "offset": self.offset,
+            "moments": self.moments,
+            "histograms": {key: value.to_dict() for key, value in self.histograms.items()},
+            "pairs": {
+                name: (count, mean.tolist(), comoment.tolist())
+                for name, (count, mean, comoment) in self.pairs.items()
+            },
+        }
+
+    def save(self, filename=None):
+        """Writes the state to ``filename`` (default: the one given at
+        creation) as JSON."""
+        with open(filename or self.filename, "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file)
+
+    @classmethod
+    def load(cls, filename):
+        """Reads statistics saved by ``save``."""
+        with open(filename, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        statistics = cls(filename, data["bins"])
+        statistics.samples = data["samples"]
+        statistics.offset = data["offset"]
+        statistics.moments = {key: tuple(value) for key, value in data["moments"].items()}
+        statistics.histograms = {
+            key: _Histogram(data["bins"], **value) for key, value in data["histograms"].items()
+        }
+        statistics.pairs = {
+            name: (count, np.array(mean), np.array(comoment))
+            for name, (count, mean, comoment) in data["pairs"].items()
+        }
+        return statistics
@@ -0,0 +1,261 @@
+"""Environment profiles in shared memory for parallel Monte Carlo workers.
+
+The wind, pressure, temperature and gravity Functions of an Environment (one
+set per ensemble member) are tabulated once into a single
+``multiprocessing.shared_memory`` block. Worker processes attach to the block
+by name and build their Environments from views of it, instead of unpickling
+or re-parsing the atmospheric model. ``SharedStochasticEnvironment`` samples
+only the ensemble member and the wind factors on top of those profiles.
+"""
+
+import atexit
+from multiprocessing import resource_tracker, shared_memory
+from random import choice
+
+import numpy as np
+from rocketpy import Environment
+from rocketpy.tools import get_distribution
+
+FIELDS = ("wind_velocity_x", "wind_velocity_y", "pressure", "temperature", "gravity")
+
+
+class SharedEnvironmentProfiles:
+    """Tabulated Environment profiles stored in a shared memory block.
+
+    The block holds a float64 array of shape (n_members, n_fields, 2,
+    max_points) with the heights and values of each field, so every field
+    keeps the exact data points of its original Function.
+
+    Use ``create`` in the main process and ``attach`` with its ``handle`` in
+    the workers. The creator must call ``unlink`` (or use the profiles as a
+    context manager) once all workers are done; a block still linked when
+    the creating process exits is freed then.
+    """
+
+    def __init__(self, shm, handle, owner=False):
+        self._shm = shm
+        self.handle = handle
+        self.owner = owner
+        self.data = np.ndarray(handle["shape"], dtype=np.float64, buffer=shm.buf)
+        self._environments = {}
+
+    @classmethod
+    def create(cls, env):
+        """Tabulates all ensemble members of ``env`` into a new shared block.
+
+        Parameters
+        ----------
+        env : Environment
+            Environment with its atmospheric model already set. For ensembles,
+            the currently selected member is restored afterwards.
+
+        Returns
+        -------
+        SharedEnvironmentProfiles
+        """
+        ensemble = env.atmospheric_model_type.lower() == "ensemble"
+        n_members = env.num_ensemble_members if ensemble else 1
+        selected = getattr(env, "ensemble_member", 0)
+        tables = []
+        for member in range(n_members):
+            if ensemble:
+                env.select_ensemble_member(member)
+            tables.append([_tabulate(getattr(env, field), env) for field in FIELDS])
+        if ensemble:
+            env.select_ensemble_member(selected)
+
+        counts = [[len(table) for table in member] for member in tables]
+        shape = (n_members, len(FIELDS), 2, max(max(row) for row in counts))
+        shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * 8)
+        handle = {
+            "name": shm.name,
+            "shape": shape,
+            "counts": counts,
+            "interpolation": [
+                getattr(env, field).__interpolation__ for field in FIELDS
+            ],
+            "date": tuple(env.date) if env.date is not None else None,
+            "latitude": env.latitude,
+            "longitude": env.longitude,
+            "elevation": env.elevation,
+            "datum": env.datum,
+            "timezone": env.timezone,
+        }
+        profiles = cls(shm, handle, owner=True)
+        # safety net for scripts interrupted before their own unlink
+        atexit.register(profiles.unlink)
+        profiles.data[:] = np.nan
+        for member, member_tables in enumerate(tables):
+            for field, table in enumerate(member_tables):
+                profiles.data[member, field, :, : len(table)] = table.T
+        return profiles
+
+    @classmethod
+    def attach(cls, handle):
+        """Attaches to a block created by another process, without copying.
+
+        Forked workers inherit the creator's mapping and do not need to
+        attach; this is for processes started independently.
+        """
+        # the creator owns the block, attached processes must not unlink it
+        try:
+            shm = shared_memory.SharedMemory(name=handle["name"], track=False)
+        except TypeError:  # Python < 3.13
+            shm = shared_memory.SharedMemory(name=handle["name"])
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return cls(shm, handle)
+
+    @property
+    def num_members(self):
+        return self.handle["shape"][0]
+
+    def profile(self, field, member=0):
+        """Zero-copy (heights, values) views of a tabulated field."""
+        count = self.handle["counts"][member][FIELDS.index(field)]
+        table = self.data[member, FIELDS.index(field)]
+        return table[0, :count], table[1, :count]
+
+    def environment(self, member=0):
+        """Environment of ensemble ``member`` built from the shared profiles.
+
+        Environments are cached per member in each process, so they are built
+        at most once per worker.
+        """
+        if member not in self._environments:
+            gravity = np.column_stack(self.profile("gravity", member))
+            env = Environment(
+                gravity=gravity,
+                date=self.handle["date"],
+                latitude=self.handle["latitude"],
+                longitude=self.handle["longitude"],
+                elevation=self.handle["elevation"],
+                datum=self.handle["datum"],
+                timezone=self.handle["timezone"],
+            )
+            env.set_atmospheric_model(
+                type="custom_atmosphere",
+                pressure=np.column_stack(self.profile("pressure", member)),
+                temperature=np.column_stack(self.profile("temperature", member)),
+                wind_u=np.column_stack(self.profile("wind_velocity_x", member)),
+                wind_v=np.column_stack(self.profile("wind_velocity_y", member)),
+            )
+            # keep the original interpolation of each profile
+            for field, interpolation in zip(FIELDS, self.handle["interpolation"]):
+                getattr(env, field).set_interpolation(interpolation)
+            env.ensemble_member = member
+            env._base_wind = (env.wind_velocity_x, env.wind_velocity_y)
+            self._environments[member] = env
+        return self._environments[member]
+
+    def close(self):
+        """Releases this process' view of the block. Calling it again does
+        nothing."""
+        if self.data is None:
+            return
+        self.data = None
+        self._environments.clear()
+        self._shm.close()
+
+    def unlink(self):
+        """Closes and frees the block. Only the creating process may call it,
+        and calling it again does nothing."""
+        self.close()
+        if self.owner:
+            self.owner = False
+            self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.unlink()
+
+
+def _tabulate(function, env):
+    """Data points of a Function, sampled on a height grid if its source is
+    a callable."""
+    if isinstance(function.source, np.ndarray):
+        return np.asarray(function.source[:, :2], dtype=np.float64)
+    heights = np.linspace(0, env.max_expected_height, 500)
+    return np.column_stack([heights, function.get_value(heights)])
+
+
+class SharedStochasticEnvironment:
+    """Stochastic environment drawing only the ensemble member and the wind
+    factors, with Environments built from shared profiles.
+
+    It can replace ``rocketpy.stochastic.StochasticEnvironment`` in a
+    ``MonteCarlo``. Its sampled inputs do not include the Functions of the
+    nominal environment, which keeps the inputs file small.
+
+    Parameters
+    ----------
+    profiles : SharedEnvironmentProfiles
+        Shared profiles, created from the nominal environment.
+    ensemble_member : list[int], optional
+        Members to choose from. Defaults to all members of the profiles.
+    wind_velocity_x_factor, wind_velocity_y_factor : tuple, optional
+        (mean, std) or (mean, std, distribution name) of the factors
+        multiplying the wind components. Default is (1, 0).
+    """
+
+    def __init__(
+        self,
+        profiles,
+        ensemble_member=None,
+        wind_velocity_x_factor=(1, 0),
+        wind_velocity_y_factor=(1, 0),
+    ):
+        self.profiles = profiles
+        self.ensemble_member = (
+            list(range(profiles.num_members)) if ensemble_member is None else ensemble_member
+        )
+        self.wind_velocity_x_factor = _distribution(wind_velocity_x_factor)
+        self.wind_velocity_y_factor = _distribution(wind_velocity_y_factor)
+        self.last_rnd_dict = {}
+
+    def attach(self):
+        """Attaches to the shared profiles from an independently started
+        process that received this object by pickling."""
+        self.profiles = SharedEnvironmentProfiles.attach(self.profiles.handle)
+
+    def __getstate__(self):
+        # only the handle of the shared block is pickled, see ``attach``
+        state = self.__dict__.copy()
+        state["profiles"] = self.profiles.handle
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.profiles = SharedEnvironmentProfiles.attach(state["profiles"])
+
+    def create_object(self):
+        """Returns the Environment of a randomly drawn member with randomly
+        scaled wind."""
+        member = choice(self.ensemble_member)
+        factor_x = self.wind_velocity_x_factor[2](*self.wind_velocity_x_factor[:2])
+        factor_y = self.wind_velocity_y_factor[2](*self.wind_velocity_y_factor[:2])
+        env = self.profiles.environment(member)
+        wind_x, wind_y = env._base_wind
+        env.wind_velocity_x = wind_x * factor_x
+        env.wind_velocity_y = wind_y * factor_y
+        self.last_rnd_dict = {
+            "ensemble_member": member,
+            "wind_velocity_x_factor": factor_x,
+            "wind_velocity_y_factor": factor_y,
+        }
+        return env
+
+    def visualize_attributes(self):
+        print("Shared environment profiles:")
+        print(f"\tensemble_member: {self.ensemble_member}")
+        for name in ("wind_velocity_x_factor", "wind_velocity_y_factor"):
+            mean, std, function = getattr(self, name)
+            print(f"\t{name}: {mean:.5f} ± {std:.5f} ({function.__name__})")
+
+
+def _distribution(value):
+    if isinstance(value, (int, float)):
+        value = (value, 0)
+    mean, std, *name = value
+    return (mean, std, get_distribution(name[0] if name else "normal"))
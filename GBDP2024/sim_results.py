@@ -0,0 +1,279 @@
+"""Results pipeline of a vehicle's nominal flight.
+
+Hybrid/sim_results.py and COTS/COTS_sim_results.py were the same script with
+the sim module, the fin set, the payload and the output folder changed.
+``run_sim_results`` is that script for any vehicle of ``vehicles.VEHICLES``,
+from the objects of its sim script: flight prints and plots (or a headless
+HTML/PDF report, see ``report``), KML and flight data exports, comparison
+with a flown GNSS track, mass sweeps, the dynamic stability fin position
+sweep of the vehicle's fin set and the design optimization.
+"""
+
+import copy
+import os
+
+from rocketpy import Environment, Flight, Function, TrapezoidalFins
+from rocketpy.utilities import apogee_by_mass, liftoff_speed_by_mass
+
+from .flight_data import export_flight_data, save_columns
+from .gnss import compare_tracks, export_tracks, print_comparison, read_track, simulated_track
+from .profiling import PROFILER
+from .report import FlightReport
+from .vehicles import VEHICLES
+
+# fin position factors of the dynamic stability sweep
+FIN_POSITION_FACTORS = (-0.5, -0.2, 0.1, 0.4, 0.7)
+
+
+def fin_position_sweep(rocket, fins, factors=FIN_POSITION_FACTORS):
+    """Attitude angle of a vertical launch without wind shear for the fin set
+    ``fins`` (a ``FinsConfig``) moved to ``position * factor``, to check how
+    static stability affects dynamic stability. Positions whose static margin
+    at ignition is outside (0, 5) calibers are not flown.
+
+    Returns
+    -------
+    list[tuple[Function, str]]
+        Attitude angle of each flight and its static margin at ignition, out
+        of rail and steady state, as ``Function.compare_plots`` takes them.
+    """
+    rocket = copy.deepcopy(rocket)
+    fin_set = rocket.aerodynamic_surfaces.get_by_type(TrapezoidalFins)[0]
+    env = Environment()
+    env.set_atmospheric_model(type="custom_atmosphere", wind_v=-5)
+    results = []
+    for factor in factors:
+        rocket.aerodynamic_surfaces.remove(fin_set)
+        fin_set = rocket.add_trapezoidal_fins(
+            n=fins.n,
+            root_chord=fins.root_chord,
+            tip_chord=fins.tip_chord,
+            span=fins.span,
+            position=fins.position * factor,
+        )
+        # the flight fails if it's negative, or too high
+        margin_at_ignition = rocket.static_margin(0)
+        if not 0 < margin_at_ignition < 5:
+            print(f"Fin position factor {factor}: margin {margin_at_ignition:.2f} c, not flown")
+            continue
+        flight = Flight(
+            rocket=rocket,
+            environment=env,
+            rail_length=5.2,
+            inclination=90,
+            heading=0,
+            max_time_step=0.01,
+            max_time=5,
+            terminate_on_apogee=True,
+            verbose=False,
+        )
+        PROFILER.record_flight(flight, f"fin position factor {factor}")
+        margins = (
+            margin_at_ignition,
+            rocket.static_margin(flight.out_of_rail_time),
+            rocket.static_margin(flight.t_final),
+        )
+        results.append((flight.attitude_angle, " | ".join(f"{m:1.2f} c" for m in margins)))
+    return results
+
+
+def run_sim_results(
+    key,
+    rocket,
+    test_flight,
+    env,
+    vehicle=None,
+    payload_flight=None,
+    output_dir=".",
+    gnss_file=None,
+    altimeter_file=None,
+):
+    """Shows and exports the results of the nominal flight of a vehicle.
+
+    Dialogs ask whether to write a report instead of showing the plots, and
+    whether to run the design optimization.
+
+    Parameters
+    ----------
+    key : str
+        Vehicle of ``VEHICLES``, e.g. "COTS".
+    rocket : Rocket
+    test_flight : Flight
+        Nominal flight of the sim script.
+    env : Environment
+        Its environment.
+    vehicle : VehicleConfig, optional
+        Configuration the sim script flew, e.g. with another motor or air
+        brakes. Defaults to ``VEHICLES[key]``.
+    payload_flight : Flight, optional
+        Payload descent, from separation to its own impact.
+    output_dir : str, optional
+        Folder of the KML, flight data, plot, report and profile files.
+    gnss_file : str, optional
+        Flown GNSS track compared with the simulated trajectory in the launch
+        site's east/north/up frame, e.g. "../data/rockets/astg/gnss_halcyon.csv".
+    altimeter_file : str, optional
+        Altimeter log of the same flight, for GNSS logs without altitude.
+    """
+    # pylint: disable=import-outside-toplevel
+    from tkinter import messagebox
+
+    vehicle = vehicle or VEHICLES[key]
+
+    def path(filename):
+        return os.path.join(output_dir, filename)
+
+    # headless report: all figures render in background processes while the rest runs, and
+    # are bundled into one HTML/PDF file at the end instead of opening a window per plot
+    report_mode = messagebox.askyesno(
+        "Report?", "Write an HTML/PDF report instead of showing the plots?"
+    )
+    if report_mode:
+        report = FlightReport(test_flight, title=f"{key} flight report", rocket=rocket).start()
+
+    # all of these are in test_flight.info() and test_flight.all_info()
+    PROFILER.start("prints")
+    test_flight.prints.initial_conditions()
+    test_flight.prints.surface_wind_conditions()
+    test_flight.prints.launch_rail_conditions()
+    test_flight.prints.out_of_rail_conditions()
+    test_flight.prints.burn_out_conditions()
+    test_flight.prints.apogee_conditions()
+    test_flight.prints.events_registered()  # parachute ejection
+    test_flight.prints.impact_conditions()
+    test_flight.prints.maximum_values()
+    PROFILER.stop("prints")
+
+    PROFILER.start("plots")
+    if not report_mode:  # the report has all of these
+        test_flight.plots.trajectory_3d()
+        test_flight.plots.linear_kinematics_data()
+        # flight path angle: velocity vs horizontal. Attitude angle: rocket axis vs horizontal
+        # plane, close to the flight path for a stable rocket. Lateral attitude angle: rocket
+        # axis vs launch rail plane, deviation from the heading
+        test_flight.plots.flight_path_angle_data()
+        test_flight.plots.attitude_data()  # Euler parameters (Euler angles or quaternions)
+        test_flight.plots.angular_kinematics_data()  # expect a sudden change at burn out
+        test_flight.plots.aerodynamic_forces()  # lift in two directions perpendicular to drag
+        test_flight.plots.rail_buttons_forces()
+        test_flight.plots.energy_data()
+        test_flight.plots.fluid_mechanics_data()
+        test_flight.plots.stability_and_control_data()  # margin and frequency response
+    PROFILER.stop("plots")
+
+    PROFILER.start("exports")
+    # trajectory for Google Earth
+    test_flight.export_kml(
+        file_name=path("trajectory.kml"), extrude=True, altitude_mode="relative_to_ground"
+    )
+    if payload_flight is not None:
+        payload_flight.export_kml(
+            file_name=path("payload_trajectory.kml"),
+            extrude=True,
+            altitude_mode="relative_to_ground",
+        )
+        print(
+            f"Rocket impact: ({test_flight.x_impact:.0f}, {test_flight.y_impact:.0f}) m, "
+            f"payload impact: ({payload_flight.x_impact:.0f}, {payload_flight.y_impact:.0f}) m "
+            f"at {payload_flight.impact_velocity:.1f} m/s"
+        )
+    if gnss_file:
+        origin = (env.latitude, env.longitude, env.elevation)
+        observed_track = read_track(gnss_file, altimeter_file, elevation=env.elevation)
+        flight_track = simulated_track(test_flight)
+        print_comparison(compare_tracks(observed_track, flight_track, origin))
+        export_tracks([observed_track, flight_track], path("gnss_comparison.kml"), origin)
+
+    if not report_mode:
+        # speed up to the first parachute deployment (apogee)
+        test_flight.speed.plot(0, test_flight.apogee_time)
+    print(
+        f"Max speed: {test_flight.max_speed:.1f} m/s at {test_flight.max_speed_time:.2f} s, "
+        f"{len(test_flight.speed.source)} solver points"
+    )
+
+    # resampled onto one time grid, every second, all attributes evaluated in one pass
+    flight_data = export_flight_data(
+        test_flight,
+        ["angle_of_attack", "mach_number", "speed", "altitude"],
+        path("rocket_flight_data.csv"),  # the extension sets the format (.csv, .npz, .parquet)
+        time_step=1.0,
+    )
+    save_columns(flight_data, path("rocket_flight_data.npz"))
+
+    # in report mode these are saved with the report figures
+    if not report_mode:
+        rocket.draw(filename=path("rocket_drawing.png"))
+        test_flight.speed.plot(filename=path("speed_plot.jpg"))
+        test_flight.plots.trajectory_3d(filename=path("trajectory_plot.jpg"))
+    PROFILER.stop("exports")
+
+    PROFILER.start("mass sweeps")
+    apogee_by_mass_function = apogee_by_mass(
+        flight=test_flight, min_mass=5, max_mass=20, points=10, plot=not report_mode
+    )
+    liftoff_speed_by_mass_function = liftoff_speed_by_mass(
+        flight=test_flight, min_mass=5, max_mass=20, points=10, plot=not report_mode
+    )
+    if report_mode:
+        report.add_function("apogee_by_mass", "Apogee by mass", apogee_by_mass_function)
+        report.add_function(
+            "liftoff_speed_by_mass", "Out of rail speed by mass", liftoff_speed_by_mass_function
+        )
+    PROFILER.stop("mass sweeps")
+
+    PROFILER.start("dynamic stability")
+    simulation_results = fin_position_sweep(rocket, vehicle.rocket.fins)
+    PROFILER.stop("dynamic stability")
+    if report_mode:
+        report.add_curves(
+            "dynamic_stability",
+            "Attitude angle by static margin (ignition | out of rail | steady state)",
+            "Time (s)",
+            "Attitude Angle (deg)",
+            [(angle.x_array, angle.y_array, label) for angle, label in simulation_results],
+            xlim=(0, 1.5),
+        )
+        PROFILER.start("report")  # waiting for the figures still rendering
+        report.save(
+            html_file=path("flight_report.html"),
+            pdf_file=path("flight_report.pdf"),
+            figures_dir=path("report"),
+        )
+        PROFILER.stop("report")
+        print(f"Report saved to {path('flight_report.html')} and {path('flight_report.pdf')}")
+    else:
+        Function.compare_plots(
+            simulation_results,
+            lower=0,
+            upper=1.5,
+            xlabel="Time (s)",
+            ylabel="Attitude Angle (deg)",
+        )
+
+    # searches fin chords, span and position, nose length and kind and motor position for the
+    # targets instead of trying fin positions by hand, see optimizer
+    optimize = messagebox.askyesno(
+        "Optimize?", "Search fins, nose and motor position for a better design?"
+    )
+    if optimize:
+        from .optimizer import DesignOptimizer
+
+        PROFILER.start("design optimization")
+        optimizer = DesignOptimizer(
+            vehicle.rocket,
+            env,
+            # apogee AGL (m), out of rail margin (calibers)
+            targets={"apogee": 3000, "stability": (1.5, 2.5), "max_mach": 0.9},
+            rail_length=vehicle.rail_length,
+            inclination=vehicle.inclination,
+            heading=vehicle.heading,
+            cache_file=path("designs.json"),  # a repeated search doesn't fly designs again
+            seed=2024,
+        )
+        best_design, _, best_score = optimizer.run(generations=10, population=16)
+        PROFILER.stop("design optimization")
+        optimizer.print_summary()  # designs no other design beats on every target
+        print(f"Best design (score {best_score:.4f}): {best_design}")
+
+    PROFILER.report(path("sim_results.profile.json"))
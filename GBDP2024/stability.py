@@ -0,0 +1,245 @@
+"""Static stability of sampled rockets, without building them.
+
+A Monte Carlo sample whose geometry gives a negative or very large static
+margin fails or flies a meaningless trajectory, and only ends up in the errors
+file after its whole integration. ``draw_rocket`` replays the draws of
+``StochasticRocket.create_object`` for one sample (same random numbers, so the
+worker that flies the sample gets the same rocket), and ``static_margins``
+evaluates the center of mass, center of pressure and static margin at
+ignition of many draws at once with the formulas rocketpy uses (Barrowman
+surfaces at Mach 0, solid motor grains at ignition).
+
+Nose cones, trapezoidal fins, tails and solid motors are evaluated from their
+drawn parameters. Other surfaces and motors are built for the draw, which is
+exact but slower.
+"""
+
+from functools import lru_cache
+
+import numpy as np
+from rocketpy import Function
+from rocketpy.stochastic import (
+    StochasticNoseCone,
+    StochasticSolidMotor,
+    StochasticTail,
+    StochasticTrapezoidalFins,
+)
+
+# center of pressure factor of the nose cone kinds whose factor does not
+# depend on the geometry (see rocketpy.NoseCone.kind)
+_NOSE_K = {
+    "conical": 2 / 3,
+    "lvhaack": 0.563,
+    "elliptical": 1 / 3,
+    "vonkarman": 0.5,
+    "parabolic": 0.5,
+}
+
+
+def _csys(orientation, positive):
+    return 1 if orientation == positive else -1
+
+
+def draw_rocket(stochastic_rocket):
+    """Draws the inputs of one rocket of ``stochastic_rocket``.
+
+    The random generators are used exactly as by ``create_object`` up to the
+    aerodynamic surfaces, so seeding them as for a sample gives that sample's
+    geometry. Rail buttons and parachutes are not drawn, they do not change
+    the static margin.
+
+    Returns
+    -------
+    dict
+        The rocket inputs, with the drawn "motors" and "aerodynamic_surfaces"
+        (each with its "position" and the model "type").
+    """
+    draw = dict(next(stochastic_rocket.dict_generator()))
+    draw["motors"], draw["aerodynamic_surfaces"] = [], []
+    for component in stochastic_rocket.motors:
+        model = component.component
+        if isinstance(model, StochasticSolidMotor):
+            values = dict(next(model.dict_generator()))
+        else:
+            motor = model.create_object()
+            values = {
+                "total_mass": float(motor.total_mass(0)),
+                "center_of_mass": float(motor.center_of_mass(0)),
+                "coordinate_system_orientation": motor.coordinate_system_orientation,
+            }
+        values["position"] = _position(stochastic_rocket, component)
+        draw["motors"].append(values)
+    for component in stochastic_rocket.aerodynamic_surfaces:
+        model = component.component
+        values = dict(next(model.dict_generator()))
+        if not isinstance(model, (StochasticNoseCone, StochasticTrapezoidalFins, StochasticTail)):
+            surface = type(model.obj)(**values)
+            values = {
+                "clalpha": float(surface.clalpha(0)),
+                "cpz": float(surface.cpz),
+                "rocket_radius": surface.rocket_radius,
+            }
+        values["type"] = type(model).__name__
+        values["position"] = _position(stochastic_rocket, component)
+        draw["aerodynamic_surfaces"].append(values)
+    return draw
+
+
+def _position(stochastic_rocket, component):
+    position = stochastic_rocket._randomize_position(component.position)
+    # fixed positions are kept as a Vector
+    return float(getattr(position, "z", position))
+
+
+def _column(draws, key):
+    return np.array([draw[key] for draw in draws], dtype=float)
+
+
+def _motor(values):
+    """Mass and center of mass (motor coordinates) at ignition, and
+    coordinate system sign, of one motor over all draws."""
+    if "total_mass" in values[0]:
+        mass = _column(values, "total_mass")
+        center = _column(values, "center_of_mass")
+    else:
+        inner = _column(values, "grain_initial_inner_radius")
+        outer = _column(values, "grain_outer_radius")
+        propellant = (
+            _column(values, "grain_number") * _column(values, "grain_density")
+            * np.pi * (outer**2 - inner**2) * _column(values, "grain_initial_height")
+        )
+        dry = _column(values, "dry_mass")
+        mass = dry + propellant
+        center = (
+            propellant * _column(values, "grains_center_of_mass_position")
+            + dry * _column(values, "center_of_dry_mass_position")
+        ) / mass
+    sign = np.array(
+        [
+            _csys(value["coordinate_system_orientation"], "nozzle_to_combustion_chamber")
+            for value in values
+        ]
+    )
+    return mass, center, sign
+
+
+@lru_cache(maxsize=None)
+def _fin_clalpha2d(airfoil):
+    """Incompressible 2-D lift slope of a fin airfoil (file, unit), as
+    rocketpy gets it."""
+    if not airfoil:
+        return 2 * np.pi
+    slope = Function(airfoil[0], interpolation="linear").differentiate_complex_step(
+        x=1e-3, dx=1e-3
+    )
+    return slope * 180 / np.pi if airfoil[1] == "degrees" else slope
+
+
+def _surface(values):
+    """Lift slope at Mach 0, center of pressure (surface coordinates) and
+    reference radius of one surface over all draws."""
+    kind = values[0]["type"]
+    if kind == "StochasticNoseCone":
+        length = _column(values, "length")
+        base = _column(values, "base_radius")
+        radius = _column(values, "rocket_radius")
+        k = np.empty(len(values))
+        for i, value in enumerate(values):
+            name = value["kind"].replace(" ", "").lower()
+            if name in _NOSE_K:
+                k[i] = _NOSE_K[name]
+            elif name == "powerseries":
+                k[i] = 2 * value["power"] / (2 * value["power"] + 1)
+            else:  # tangent ogive
+                rho = (base[i] ** 2 + length[i] ** 2) / (2 * base[i])
+                volume = np.pi * (
+                    length[i] * rho**2 - length[i] ** 3 / 3
+                    - (rho - base[i]) * rho**2 * np.arcsin(length[i] / rho)
+                )
+                k[i] = 1 - volume / (np.pi * base[i] ** 2 * length[i])
+        return 2 * (base / radius) ** 2, k * length, radius
+    if kind == "StochasticTrapezoidalFins":
+        n = _column(values, "n")
+        root, tip = _column(values, "root_chord"), _column(values, "tip_chord")
+        span, radius = _column(values, "span"), _column(values, "rocket_radius")
+        sweep = np.array(
+            [
+                value["sweep_length"] if value.get("sweep_length") is not None
+                else np.tan(np.radians(value["sweep_angle"])) * value["span"]
+                if value.get("sweep_angle") is not None
+                else value["root_chord"] - value["tip_chord"]
+                for value in values
+            ]
+        )
+        slope_2d = np.array(
+            [_fin_clalpha2d(value.get("airfoil") and tuple(value["airfoil"])) for value in values]
+        )
+        area = (root + tip) * span / 2
+        aspect_ratio = 2 * span**2 / area
+        gamma = np.arctan((sweep + 0.5 * tip - 0.5 * root) / span)
+        planform = 2 * np.pi * aspect_ratio / (slope_2d * np.cos(gamma))
+        single = (
+            slope_2d * planform * (area / (np.pi * radius**2)) * np.cos(gamma)
+            / (2 + planform * np.sqrt(1 + (2 / planform) ** 2))
+        )
+        tau = (span + radius) / radius
+        # fin number correction of rocketpy.Fins.fin_num_correction
+        correction = np.where(
+            (n >= 5) & (n <= 8),
+            np.take([2.37, 2.74, 2.99, 3.24], np.clip(n - 5, 0, 3).astype(int)),
+            n / 2,
+        )
+        cpz = (
+            sweep / 3 * (root + 2 * tip) / (root + tip)
+            + (root + tip - root * tip / (root + tip)) / 6
+        )
+        return (1 + 1 / tau) * correction * single, cpz, radius
+    if kind == "StochasticTail":
+        top, bottom = _column(values, "top_radius"), _column(values, "bottom_radius")
+        radius = _column(values, "rocket_radius")
+        ratio = top / bottom
+        cpz = _column(values, "length") / 3 * (1 + (1 - ratio) / (1 - ratio**2))
+        return 2 * ((bottom / radius) ** 2 - (top / radius) ** 2), cpz, radius
+    return _column(values, "clalpha"), _column(values, "cpz"), _column(values, "rocket_radius")
+
+
+def static_margins(draws):
+    """Static margin at ignition of many draws of one stochastic rocket.
+
+    Parameters
+    ----------
+    draws : list[dict]
+        Outputs of ``draw_rocket``, all of the same stochastic rocket.
+
+    Returns
+    -------
+    static_margin, center_of_pressure, center_of_mass : numpy.ndarray
+        Static margin (calibers), center of pressure at Mach 0 and center of
+        mass at ignition (rocket coordinates) of each draw.
+    """
+    radius = _column(draws, "radius")
+    sign = np.array(
+        [_csys(draw["coordinate_system_orientation"], "tail_to_nose") for draw in draws]
+    )
+    mass = _column(draws, "mass")
+    moment = mass * _column(draws, "center_of_mass_without_motor")
+    for j in range(len(draws[0]["motors"])):
+        values = [draw["motors"][j] for draw in draws]
+        motor_mass, center, motor_sign = _motor(values)
+        mass = mass + motor_mass
+        moment = moment + motor_mass * (center * sign * motor_sign + _column(values, "position"))
+    center_of_mass = moment / mass
+
+    lift = np.zeros(len(draws))
+    lift_moment = np.zeros(len(draws))
+    for j in range(len(draws[0]["aerodynamic_surfaces"])):
+        values = [draw["aerodynamic_surfaces"][j] for draw in draws]
+        clalpha, cpz, surface_radius = _surface(values)
+        slope = (surface_radius / radius) ** 2 * clalpha
+        lift += slope
+        lift_moment += slope * (_column(values, "position") - sign * cpz)
+    center_of_pressure = np.divide(
+        lift_moment, lift, out=np.zeros_like(lift), where=lift != 0
+    )
+    static_margin = sign * (center_of_mass - center_of_pressure) / (2 * radius)
+    return static_margin, center_of_pressure, center_of_mass
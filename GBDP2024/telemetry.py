@@ -0,0 +1,449 @@
+"""Live apogee and landing prediction from a telemetry stream.
+
+The flight computers send their state (AltOS state name, height, speed,
+acceleration and GNSS position) during the flight. A ``PredictionService``
+turns each received frame into a rocket state (``StateEstimator``) and flies
+the vehicle from it to the ground with the GBDP rocket model
+(``LandingPredictor``), so the predicted apogee and landing point follow the
+flight as it happens. The AltOS logs of data/rockets/prometheus replay such a
+stream (``read_altos_csv``, ``replay``).
+
+A prediction takes longer than the telemetry interval early in the flight,
+so the service never queues frames: a reader thread keeps only the newest
+one and each prediction starts from the newest state, skipping the frames
+received meanwhile. The phase rockets and the environment are built once and
+warmed up by a first flight, so only the integration is left per update.
+Each update is timed (``metrics``): compute latency, age of the prediction
+against its frame, skipped frames and updates slower than the deadline.
+
+Usage, from the repository root::
+
+    python -m GBDP2024.telemetry data/rockets/prometheus/2022-06-24-serial-6583-flight-0003-TeleMega.csv
+"""
+
+import argparse
+import csv
+import json
+import math
+import threading
+from dataclasses import dataclass, replace
+from time import monotonic, sleep
+
+import numpy as np
+from rocketpy import Environment, Flight
+from rocketpy.tools import euler313_to_quaternions
+
+from .config import build_rocket
+
+EARTH_RADIUS = 6371000
+
+# AltOS states with the parachutes deployed so far (GBDP parachute names)
+DEPLOYED = {"drogue": ("drogue",), "main": ("drogue", "main")}
+ASCENT_STATES = ("pad", "boost", "fast", "coast")
+
+
+@dataclass(frozen=True)
+class TelemetryFrame:
+    """One telemetry sample. ``time`` is the flight time (s), ``height``
+    is above the pad (m), ``speed`` the vertical speed (m/s, NaN if not
+    sent) and ``received`` the monotonic clock time it arrived at."""
+
+    time: float
+    state: str
+    height: float
+    speed: float
+    acceleration: float
+    latitude: float
+    longitude: float
+    altitude: float
+    received: float = 0.0
+
+
+def _number(value):
+    try:
+        return float(value)
+    except ValueError:
+        return math.nan
+
+
+def read_altos_csv(filename):
+    """Frames of an AltOS (TeleMega, TeleMetrum) CSV export. ``altitude``
+    is the barometric altitude above sea level, the first of the two
+    altitude columns."""
+    with open(filename, "r", encoding="utf-8") as file:
+        reader = csv.reader(file)
+        header = [name.strip().lstrip("#") for name in next(reader)]
+        columns = {name: header.index(name) for name in header}  # first of duplicates
+        frames = []
+        for row in reader:
+            if not row:
+                continue
+            frames.append(
+                TelemetryFrame(
+                    time=_number(row[columns["time"]]),
+                    state=row[columns["state_name"]].strip(),
+                    height=_number(row[columns["height"]]),
+                    speed=_number(row[columns["speed"]]),
+                    acceleration=_number(row[columns["acceleration"]]),
+                    latitude=_number(row[columns["latitude"]]),
+                    longitude=_number(row[columns["longitude"]]),
+                    altitude=_number(row[columns["altitude"]]),
+                )
+            )
+    return frames
+
+
+def replay(frames, rate=1.0):
+    """Yields ``frames`` at the pace of their flight times (``rate`` times
+    faster, as fast as possible if None), stamped with their arrival."""
+    start, first = monotonic(), frames[0].time
+    for frame in frames:
+        if rate:
+            delay = start + (frame.time - first) / rate - monotonic()
+            if delay > 0:
+                sleep(delay)
+        yield replace(frame, received=monotonic())
+
+
+class StateEstimator:
+    """Rocket state from the recent telemetry frames.
+
+    Positions are east/north of the pad (the first GNSS fix) on a local
+    tangent plane, and the altitude is the pad elevation plus the height.
+    The vertical speed is the sent one or, if missing, the slope of the
+    height over the last ``speed_window`` seconds; the horizontal velocity
+    is the slope of the GNSS fixes of the last ``gnss_window`` seconds. The
+    rocket points along its velocity, without rotation. ``apogee`` is the
+    highest (height, time) received.
+    """
+
+    def __init__(self, elevation, speed_window=0.2, gnss_window=2.0):
+        self.elevation = elevation
+        self.speed_window = speed_window
+        self.gnss_window = gnss_window
+        self.pad = None
+        self.frames = []
+        self.fixes = []
+        self.apogee = (-math.inf, None)
+
+    def update(self, frame):
+        """Adds a frame, forgetting the ones older than the windows."""
+        self.frames.append(frame)
+        if frame.height > self.apogee[0]:
+            self.apogee = (frame.height, frame.time)
+        while self.frames[0].time < frame.time - self.speed_window:
+            self.frames.pop(0)
+        if math.isfinite(frame.latitude) and math.isfinite(frame.longitude):
+            if self.pad is None:
+                self.pad = (frame.latitude, frame.longitude)
+            if not self.fixes or (frame.latitude, frame.longitude) != self.fixes[-1][1:]:
+                self.fixes.append((frame.time, frame.latitude, frame.longitude))
+            while self.fixes[0][0] < frame.time - self.gnss_window:
+                self.fixes.pop(0)
+
+    def position(self, latitude, longitude):
+        """East and north (m) of the pad."""
+        pad_latitude, pad_longitude = self.pad
+        east = math.radians(longitude - pad_longitude) * EARTH_RADIUS * math.cos(
+            math.radians(pad_latitude)
+        )
+        return east, math.radians(latitude - pad_latitude) * EARTH_RADIUS
+
+    def coordinates(self, east, north):
+        """Latitude and longitude of a point east and north of the pad."""
+        pad_latitude, pad_longitude = self.pad
+        latitude = pad_latitude + math.degrees(north / EARTH_RADIUS)
+        longitude = pad_longitude + math.degrees(
+            east / (EARTH_RADIUS * math.cos(math.radians(pad_latitude)))
+        )
+        return latitude, longitude
+
+    @staticmethod
+    def _slope(times, values):
+        if len(times) < 2 or times[-1] == times[0]:
+            return 0.0
+        return float(np.polyfit(times, values, 1)[0])
+
+    def state(self):
+        """[t, x, y, z, vx, vy, vz, e0, e1, e2, e3, w1, w2, w3] of the
+        newest frame, the ``Flight`` initial solution format."""
+        frame = self.frames[-1]
+        speed = frame.speed
+        if not math.isfinite(speed):
+            speed = self._slope(
+                [old.time for old in self.frames], [old.height for old in self.frames]
+            )
+        east = north = vx = vy = 0.0
+        if self.fixes:
+            east, north = self.position(*self.fixes[-1][1:])
+            positions = [self.position(latitude, longitude) for _, latitude, longitude in self.fixes]
+            times = [fix[0] for fix in self.fixes]
+            vx = self._slope(times, [position[0] for position in positions])
+            vy = self._slope(times, [position[1] for position in positions])
+        heading = math.atan2(vx, vy)
+        inclination = math.atan2(speed, math.hypot(vx, vy)) if (vx or vy or speed) else math.pi / 2
+        attitude = euler313_to_quaternions(0, inclination - math.pi / 2, -heading)
+        return [
+            frame.time, east, north, self.elevation + frame.height, vx, vy, speed,
+            *attitude, 0.0, 0.0, 0.0,
+        ]
+
+
+def _deployed(pressure, height, state):  # pylint: disable=unused-argument
+    return True
+
+
+class LandingPredictor:
+    """Flies a vehicle from a telemetry state to the ground.
+
+    One rocket is built per flight phase: the vehicle as configured during
+    the ascent, and with the parachutes of ``DEPLOYED`` open at once (no
+    lag) under drogue or main, so a descent flown from a frame starts under
+    the right canopy.
+
+    Parameters
+    ----------
+    config : VehicleConfig
+    environment : Environment
+        Atmosphere of the flight, its origin at the pad.
+    warm_up : bool, optional
+        Flies the nominal flight once, so the lazily evaluated curves of the
+        rocket and environment are ready before the first update.
+    """
+
+    def __init__(self, config, environment, warm_up=True):
+        self.config = config
+        self.environment = environment
+        self._rockets = {}
+        if warm_up:
+            Flight(
+                rocket=self.rocket("pad"),
+                environment=environment,
+                rail_length=config.rail_length,
+                inclination=config.inclination,
+                heading=config.heading,
+                terminate_on_apogee=True,
+            )
+
+    def rocket(self, phase):
+        """Rocket of an AltOS state, built once."""
+        deployed = DEPLOYED.get(phase, ())
+        if deployed not in self._rockets:
+            parachutes = []
+            for parachute in self.config.rocket.parachutes:
+                if parachute.name in deployed:
+                    if parachute.name != deployed[-1]:
+                        continue  # replaced by the later canopy
+                    parachute = replace(parachute, trigger=_deployed, lag=0)
+                parachutes.append(parachute)
+            # air brakes left out: rocketpy controllers need the rail phase
+            config = replace(self.config.rocket, parachutes=tuple(parachutes), air_brakes=None)
+            self._rockets[deployed] = build_rocket(config)[0]
+        return self._rockets[deployed]
+
+    def predict(self, state, phase):
+        """Flight from ``state`` (see ``StateEstimator.state``) in AltOS
+        ``phase``.
+
+        Returns
+        -------
+        dict
+            Predicted "apogee" (m above the pad) and its "apogee_time", None
+            once descending, landing "x", "y" (m east and north of the pad)
+            and "landing_time".
+        """
+        rocket = self.rocket(phase)
+        for parachute in rocket.parachutes:
+            # each flight appends its pressure samples to the parachutes
+            parachute.clean_pressure_signal.clear()
+            parachute.noisy_pressure_signal.clear()
+            del parachute.noise_signal[1:]
+        flight = Flight(
+            rocket=rocket,
+            environment=self.environment,
+            rail_length=self.config.rail_length,
+            inclination=self.config.inclination,
+            heading=self.config.heading,
+            initial_solution=state,
+        )
+        ascending = phase in ASCENT_STATES
+        return {
+            "apogee": float(flight.apogee - self.environment.elevation) if ascending else None,
+            "apogee_time": float(flight.apogee_time) if ascending else None,
+            "x": float(flight.x_impact),
+            "y": float(flight.y_impact),
+            "landing_time": float(flight.t_final),
+        }
+
+
+class PredictionService:
+    """Bounded latency prediction loop over a telemetry stream.
+
+    Parameters
+    ----------
+    predictor : LandingPredictor
+    estimator : StateEstimator
+    deadline : float, optional
+        Longest acceptable update (s), e.g. the telemetry interval. Slower
+        updates are counted as misses.
+    ground : float, optional
+        Height (m) under which a descending rocket is on the ground. AltOS
+        only reports "landed" a while after touchdown.
+    """
+
+    def __init__(self, predictor, estimator, deadline=1.0, ground=2.0):
+        self.predictor = predictor
+        self.estimator = estimator
+        self.deadline = deadline
+        self.ground = ground
+        self.predictions = []
+        self.received = 0
+        self._received = threading.Condition()
+        self._newest = None
+        self._done = False
+
+    def _read(self, stream):
+        try:
+            for frame in stream:
+                with self._received:
+                    self.estimator.update(frame)
+                    self.received += 1
+                    self._newest = (frame, self.estimator.state(), self.received)
+                    self._received.notify()
+        finally:
+            with self._received:
+                self._done = True
+                self._received.notify()
+
+    def _on_ground(self, frame):
+        if frame.state == "landed":
+            return True
+        return frame.state not in ASCENT_STATES and frame.height < self.ground
+
+    def run(self, stream, callback=None):
+        """Predicts from the newest frame of ``stream`` until it ends.
+
+        Parameters
+        ----------
+        stream : iterable[TelemetryFrame]
+            Frames stamped with their arrival, e.g. ``replay``.
+        callback : callable, optional
+            Called with each prediction as it is made.
+
+        Returns
+        -------
+        list[dict]
+            Predictions, each with its frame "time" and "state", landing
+            "latitude" and "longitude", compute "latency" (s), "age" of the
+            result against the frame arrival (s) and frames "skipped" since
+            the previous update.
+        """
+        reader = threading.Thread(target=self._read, args=(stream,), daemon=True)
+        reader.start()
+        last = 0
+        while True:
+            with self._received:
+                while self._newest is None and not self._done:
+                    self._received.wait()
+                newest, self._newest = self._newest, None
+            if newest is None:
+                break
+            frame, state, count = newest
+            # AltOS flight time starts at launch
+            if frame.time < 0 or self._on_ground(frame) or self.estimator.pad is None:
+                last = count
+                continue
+            start = monotonic()
+            try:
+                prediction = self.predictor.predict(state, frame.state)
+            except Exception as error:  # pylint: disable=broad-except
+                prediction = {"error": f"{type(error).__name__}: {error}"}
+            end = monotonic()
+            if prediction.get("apogee", 0) is None:  # descending: the one seen
+                prediction["apogee"], prediction["apogee_time"] = self.estimator.apogee
+            prediction.update(
+                time=frame.time,
+                state=frame.state,
+                latency=end - start,
+                age=end - frame.received,
+                skipped=count - last - 1,
+            )
+            if "x" in prediction:
+                prediction["latitude"], prediction["longitude"] = self.estimator.coordinates(
+                    prediction["x"], prediction["y"]
+                )
+            last = count
+            self.predictions.append(prediction)
+            if callback is not None:
+                callback(prediction)
+        reader.join()
+        return self.predictions
+
+    def metrics(self):
+        """Latency and age percentiles (s), updates, skipped frames and
+        deadline misses of the run."""
+        latency = np.array([prediction["latency"] for prediction in self.predictions])
+        age = np.array([prediction["age"] for prediction in self.predictions])
+        if not len(latency):
+            return {"updates": 0, "frames": self.received}
+        return {
+            "frames": self.received,
+            "updates": len(latency),
+            "skipped": int(sum(prediction["skipped"] for prediction in self.predictions)),
+            "errors": sum("error" in prediction for prediction in self.predictions),
+            "latency_p50": float(np.percentile(latency, 50)),
+            "latency_p95": float(np.percentile(latency, 95)),
+            "latency_max": float(latency.max()),
+            "age_p50": float(np.percentile(age, 50)),
+            "age_p95": float(np.percentile(age, 95)),
+            "deadline": self.deadline,
+            "deadline_misses": int((latency > self.deadline).sum()),
+        }
+
+
+def _print(prediction):
+    if "error" in prediction:
+        print(f"t={prediction['time']:7.2f} s {prediction['state']:>7}: {prediction['error']}")
+        return
+    print(
+        f"t={prediction['time']:7.2f} s {prediction['state']:>7}: apogee "
+        f"{prediction['apogee']:7.1f} m, landing {prediction['latitude']:.6f}, "
+        f"{prediction['longitude']:.6f} at {prediction['landing_time']:6.1f} s "
+        f"({1000 * prediction['latency']:.0f} ms, {prediction['skipped']} skipped)"
+    )
+
+
+def main():
+    # pylint: disable=import-outside-toplevel
+    from .vehicles import VEHICLES
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("telemetry", help="AltOS CSV export to replay")
+    parser.add_argument("--vehicle", choices=sorted(VEHICLES), default="Hybrid")
+    parser.add_argument("--motor", help="motor option of the vehicle, e.g. Solid")
+    parser.add_argument("--rate", type=float, default=1.0, help="replay speed, 0 for no pacing")
+    parser.add_argument("--deadline", type=float, default=1.0, help="update deadline (s)")
+    parser.add_argument("--json", help="save the predictions and metrics to this file")
+    args = parser.parse_args()
+
+    frames = read_altos_csv(args.telemetry)
+    pad = next(frame for frame in frames if math.isfinite(frame.latitude))
+    elevation = frames[0].altitude - frames[0].height
+    # no wind forecast here: standard atmosphere at the pad
+    environment = Environment(
+        latitude=pad.latitude, longitude=pad.longitude, elevation=elevation
+    )
+    config = VEHICLES[args.vehicle].with_motor(args.motor)
+    service = PredictionService(
+        LandingPredictor(config, environment), StateEstimator(elevation), args.deadline
+    )
+    service.run(replay(frames, args.rate or None), callback=_print)
+    metrics = service.metrics()
+    print(json.dumps(metrics, indent=2))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump({"metrics": metrics, "predictions": service.predictions}, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
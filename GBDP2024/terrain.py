@@ -0,0 +1,356 @@
+"""Terrain around the launch site: a memory-mapped elevation grid, and flight
+impacts on it instead of on a flat ground plane.
+
+rocketpy ends a flight when it crosses the launch elevation, so a flight
+landing on a hillside stops above or below the ground, and the recovery
+area's landing points are off by the slope times the height error. An
+``ElevationGrid`` resamples a digital elevation model around the launch site
+(a NASADEM 1 arc second netCDF file, the format of
+``Environment.set_topographic_profile``) onto a regular east/north grid in
+meters, rocketpy's x and y, and saves it as ``{path}.npy`` with a JSON index
+like ``climatology.ProfileBank``. Opening it memory-maps the array, so forked
+Monte Carlo workers share its pages. Heights are bilinear in the grid cells:
+``height`` for arrays, ``height_at`` for one point without numpy overhead.
+
+rocketpy's impact check is part of its integration loop, so ``land`` moves
+the impact of a flown Flight onto the terrain: its solver steps are checked
+against the terrain under them in one vectorized lookup, the first step
+below the ground is refined to the crossing, and a flight that reached the
+launch elevation above lower ground is flown on with the derivative of its
+last phase down to it. The flight's outputs (t_final, impact point and
+velocity, every Function of time) then describe the terrain impact. The
+launch elevation should be the grid's ``pad`` height (see
+``site_environment``), so heights above ground level (apogee, parachute
+triggers) and the impacts use the same ground.
+"""
+
+import json
+import os
+from functools import cached_property
+from math import floor
+
+import numpy as np
+
+from .gnss import enu_to_geodetic
+
+RADIUS = 10000.0
+SPACING = 30.0
+# bisection steps refining a terrain crossing between two solver steps
+REFINE_STEPS = 40
+
+
+def _interpolate(axis_0, axis_1, values, points_0, points_1):
+    """Bilinear interpolation of ``values`` on the regular ascending axes at
+    the given points, clamped to the edges."""
+    step_0, step_1 = axis_0[1] - axis_0[0], axis_1[1] - axis_1[0]
+    position_0 = np.clip((points_0 - axis_0[0]) / step_0, 0, len(axis_0) - 1)
+    position_1 = np.clip((points_1 - axis_1[0]) / step_1, 0, len(axis_1) - 1)
+    index_0 = np.minimum(position_0.astype(int), len(axis_0) - 2)
+    index_1 = np.minimum(position_1.astype(int), len(axis_1) - 2)
+    weight_0, weight_1 = position_0 - index_0, position_1 - index_1
+    return (
+        values[index_0, index_1] * (1 - weight_0) * (1 - weight_1)
+        + values[index_0 + 1, index_1] * weight_0 * (1 - weight_1)
+        + values[index_0, index_1 + 1] * (1 - weight_0) * weight_1
+        + values[index_0 + 1, index_1 + 1] * weight_0 * weight_1
+    )
+
+
+class ElevationGrid:
+    """Terrain heights above sea level on a regular grid about a launch
+    site, memory-mapped from ``{path}.npy``.
+
+    Row ``j`` and column ``i`` of ``data`` are at ``y = origin + j *
+    spacing`` north and ``x = origin + i * spacing`` east of the site, as
+    rocketpy's x and y. Points outside the grid get the height of its edge.
+
+    Attributes
+    ----------
+    data : numpy.memmap
+        The heights, float32, meters.
+    latitude, longitude : float
+        The launch site, degrees.
+    origin : float
+        East and north coordinate of the first column and row, meters.
+    spacing : float
+        Grid step, meters.
+    index : dict
+        The JSON index: site, grid, and the source file with its size and
+        modification time.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(f"{path}.json", "r", encoding="utf-8") as file:
+            self.index = json.load(file)
+        self.data = np.load(f"{path}.npy", mmap_mode="r")
+        self.latitude = self.index["latitude"]
+        self.longitude = self.index["longitude"]
+        self.origin = self.index["origin"]
+        self.spacing = self.index["spacing"]
+        self._last = len(self.data) - 1
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    @staticmethod
+    def _stamp(filename):
+        stat = os.stat(filename)
+        return {"file": os.path.abspath(filename), "size": stat.st_size, "mtime": stat.st_mtime}
+
+    @classmethod
+    def from_geodetic(
+        cls, latitudes, longitudes, heights, latitude, longitude, path, radius=RADIUS,
+        spacing=SPACING, source=None,
+    ):
+        """Resamples heights on a regular latitude/longitude grid (any
+        order of the axes) onto the east/north grid of the site and saves it
+        to ``{path}.npy`` and ``{path}.json``.
+
+        Parameters
+        ----------
+        latitudes, longitudes : array
+            Axes of ``heights``, degrees.
+        heights : array
+            (latitudes, longitudes) heights above sea level, meters. Voids
+            (masked or NaN) get the mean height.
+        latitude, longitude : float
+            Launch site, degrees.
+        path : str
+            Grid path, without extension.
+        radius : float, optional
+            Half width of the grid, meters.
+        spacing : float, optional
+            Grid step, meters.
+        source : dict, optional
+            Stamp of the source file, see ``load``.
+
+        Returns
+        -------
+        ElevationGrid
+            The saved grid, memory-mapped.
+        """
+        latitudes, longitudes = np.asarray(latitudes, float), np.asarray(longitudes, float)
+        heights = np.ma.filled(np.ma.masked_invalid(np.ma.asarray(heights, float)), np.nan)
+        if latitudes[0] > latitudes[-1]:
+            latitudes, heights = latitudes[::-1], heights[::-1]
+        if longitudes[0] > longitudes[-1]:
+            longitudes, heights = longitudes[::-1], heights[:, ::-1]
+        if np.isnan(heights).any():
+            heights = np.where(np.isnan(heights), np.nanmean(heights), heights)
+        count = int(round(2 * radius / spacing)) + 1
+        axis = -radius + spacing * np.arange(count)
+        east, north = np.meshgrid(axis, axis)
+        point_latitudes, point_longitudes, _ = enu_to_geodetic(
+            east, north, 0.0, (latitude, longitude, 0.0)
+        )
+        if not (
+            latitudes[0] <= point_latitudes.min() and point_latitudes.max() <= latitudes[-1]
+            and longitudes[0] <= point_longitudes.min() and point_longitudes.max() <= longitudes[-1]
+        ):
+            print(f"Warning: the elevation data does not cover {radius:.0f} m around the site")
+        data = _interpolate(latitudes, longitudes, heights, point_latitudes, point_longitudes)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        np.save(f"{path}.npy", data.astype(np.float32))
+        index = {
+            "latitude": latitude,
+            "longitude": longitude,
+            "origin": float(axis[0]),
+            "spacing": float(spacing),
+            "radius": float(radius),
+            "source": source,
+        }
+        with open(f"{path}.json", "w", encoding="utf-8") as file:
+            json.dump(index, file)
+        return cls(path)
+
+    @classmethod
+    def build(cls, filename, latitude, longitude, path, radius=RADIUS, spacing=SPACING):
+        """Grid of the site from a NASADEM netCDF file (lat, lon and
+        NASADEM_HGT variables), see ``from_geodetic``."""
+        import netCDF4  # pylint: disable=import-outside-toplevel
+
+        with netCDF4.Dataset(filename, "r") as dataset:
+            latitudes = dataset.variables["lat"][:]
+            longitudes = dataset.variables["lon"][:]
+            heights = dataset.variables["NASADEM_HGT"][:]
+        return cls.from_geodetic(
+            latitudes, longitudes, heights, latitude, longitude, path, radius, spacing,
+            source=cls._stamp(filename),
+        )
+
+    @classmethod
+    def load(cls, filename, latitude, longitude, path, radius=RADIUS, spacing=SPACING):
+        """Opens the grid at ``path``, built again first if it is missing or
+        was built for another file, file version, site or grid."""
+        try:
+            grid = cls(path)
+        except FileNotFoundError:
+            return cls.build(filename, latitude, longitude, path, radius, spacing)
+        current = (latitude, longitude, float(radius), float(spacing), cls._stamp(filename))
+        index = grid.index
+        if (
+            index["latitude"], index["longitude"], index["radius"], index["spacing"],
+            index["source"],
+        ) != current:
+            grid.close()
+            return cls.build(filename, latitude, longitude, path, radius, spacing)
+        return grid
+
+    def height(self, x, y):
+        """Terrain heights (m above sea level) at arrays of east ``x`` and
+        north ``y`` coordinates."""
+        axis = self.origin + self.spacing * np.arange(self._last + 1)
+        return _interpolate(axis, axis, self.data, np.asarray(y, float), np.asarray(x, float))
+
+    def height_at(self, x, y):
+        """Terrain height at one point, the same as ``height`` at a fraction
+        of its cost, for use at every solver step."""
+        column = min(max((x - self.origin) / self.spacing, 0.0), self._last)
+        row = min(max((y - self.origin) / self.spacing, 0.0), self._last)
+        i, j = min(floor(column), self._last - 1), min(floor(row), self._last - 1)
+        u, v = column - i, row - j
+        data = self.data
+        return float(
+            (data[j, i] * (1 - u) + data[j, i + 1] * u) * (1 - v)
+            + (data[j + 1, i] * (1 - u) + data[j + 1, i + 1] * u) * v
+        )
+
+    @cached_property
+    def pad(self):
+        """Terrain height at the launch site."""
+        return self.height_at(0.0, 0.0)
+
+    def close(self):
+        """Releases the memory map."""
+        mapping = getattr(self.data, "_mmap", None)
+        self.data = None
+        if mapping is not None:
+            mapping.close()
+
+
+def site_grid(site, path=None):
+    """``ElevationGrid`` of a ``SiteConfig`` with a ``terrain`` file, saved
+    next to it (``{file}_terrain``) unless ``path`` is given. None without
+    terrain."""
+    if site.terrain is None:
+        return None
+    # pylint: disable=import-outside-toplevel
+    from .config import data_path
+
+    filename = data_path(site.terrain)
+    path = path or f"{os.path.splitext(filename)[0]}_terrain"
+    return ElevationGrid.load(filename, site.latitude, site.longitude, path)
+
+
+def _state_between(row_0, row_1, fraction):
+    """State a ``fraction`` of the way between two solution rows [t, x, y,
+    z, vx, vy, vz, ...]: cubic Hermite positions from the velocities, linear
+    elsewhere."""
+    step = row_1[0] - row_0[0]
+    state = row_0 + fraction * (row_1 - row_0)
+    s2, s3 = fraction**2, fraction**3
+    state[1:4] = (
+        (2 * s3 - 3 * s2 + 1) * row_0[1:4]
+        + (s3 - 2 * s2 + fraction) * step * row_0[4:7]
+        + (-2 * s3 + 3 * s2) * row_1[1:4]
+        + (s3 - s2) * step * row_1[4:7]
+    )
+    return state
+
+
+def _clear_cache(flight):
+    """Forgets the Functions and properties a Flight computed from its
+    solution: the values of its cached properties and ``funcify_method``
+    Functions, both kept in its ``__dict__`` under their ``attrname``."""
+    for name in list(vars(flight)):
+        if getattr(getattr(type(flight), name, None), "attrname", None) == name:
+            del flight.__dict__[name]
+
+
+def land(flight, grid, max_time=600.0):
+    """Moves the impact of a flown ``Flight`` onto the terrain of ``grid``.
+
+    If the flight goes below the terrain before its end, it is cut at the
+    first crossing. If it ended at the launch elevation above lower ground,
+    it is flown on with the derivative of its last phase, for at most
+    ``max_time`` seconds, down to the terrain. The solution, t_final,
+    impact state, point and velocity and parachute events are updated, and
+    the Functions of time are computed again on first use. Flights that
+    did not end on the ground (terminated on apogee, out of time) are left
+    as they are.
+
+    Returns
+    -------
+    Flight
+        ``flight``, changed in place.
+    """
+    if len(flight.impact_state) < 13:
+        return flight
+    solution = np.array(flight.solution, dtype=float)
+    airborne = solution[:, 0] > flight.out_of_rail_time
+    clearance = solution[:, 3] - grid.height(solution[:, 1], solution[:, 2])
+    below = np.flatnonzero(airborne[1:] & (clearance[1:] < -1e-6)) + 1
+    if len(below):
+        # hit rising ground: bisection between the last step above and the first below
+        k = below[0]
+        low, high = 0.0, 1.0
+        for _ in range(REFINE_STEPS):
+            middle = (low + high) / 2
+            state = _state_between(solution[k - 1], solution[k], middle)
+            if state[3] - grid.height_at(state[1], state[2]) > 0:
+                low = middle
+            else:
+                high = middle
+        rows = [*solution[:k], _state_between(solution[k - 1], solution[k], high)]
+    elif clearance[-1] > 1e-6:
+        rows = [*solution, *_descend(flight, grid, solution[-1], max_time)]
+    else:
+        return flight
+    _set_impact(flight, rows)
+    return flight
+
+
+def _descend(flight, grid, row, max_time):
+    """Solution rows of the flight flown on from ``row`` down to the
+    terrain with the derivative of its last phase."""
+    from scipy.integrate import solve_ivp  # pylint: disable=import-outside-toplevel
+
+    derivative = flight.flight_phases[-2].derivative
+
+    def ground(_, state):
+        return state[2] - grid.height_at(state[0], state[1])
+
+    ground.terminal, ground.direction = True, -1
+    result = solve_ivp(
+        lambda time, state: derivative(time, state),
+        (row[0], row[0] + max_time),
+        row[1:],
+        rtol=flight.rtol,
+        atol=flight.atol,
+        events=ground,
+    )
+    rows = np.column_stack([result.t, result.y.T])[1:]
+    if len(result.t_events[0]):
+        rows[-1] = [result.t_events[0][0], *result.y_events[0][0]]
+    return rows
+
+
+def _set_impact(flight, rows):
+    """Makes the last of ``rows`` the flight's impact."""
+    impact = np.asarray(rows[-1], dtype=float)
+    flight.solution = [list(row) for row in rows]
+    flight.t = flight.t_final = float(impact[0])
+    flight.y_sol = flight.impact_state = impact[1:]
+    flight.x_impact, flight.y_impact, flight.z_impact = impact[1:4]
+    flight.impact_velocity = impact[6]
+    flight.flight_phases[-1].t = flight.t_final
+    flight.parachute_events = [
+        event for event in flight.parachute_events if event[0] <= flight.t_final
+    ]
+    _clear_cache(flight)
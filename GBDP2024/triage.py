@@ -0,0 +1,316 @@
+"""Where and why the samples of a Monte Carlo campaign fail.
+
+``run_parallel`` writes each failed sample to the errors file as its drawn
+inputs plus its sample "index" and an "error" record: exception type,
+message, the phase of the simulation it failed in (see ``failure_phase``) and
+the flight time reached. ``triage`` groups the failures of a campaign by type
+and phase and, for each group, finds the parameter regions where they
+cluster: every numeric input is split in quantile bins over all the drawn
+samples (flown, failed and, optionally, skipped by the static margin
+precheck), and regions of adjacent bins whose failure rate is well above the
+one of the other samples are reported, e.g. to tighten the stochastic bounds
+of montecarlo.py.
+
+Usage, from the repository root::
+
+    python -m GBDP2024.triage Hybrid/MonteCarlo/MonteCarlo_TestDispersion
+"""
+
+import argparse
+import json
+import traceback
+from collections import Counter
+
+import numpy as np
+
+# Flight phase derivative -> phase name
+_DERIVATIVE_PHASES = {
+    "udot_rail1": "rail",
+    "udot_rail2": "rail",
+    "u_dot": "flight",
+    "u_dot_generalized": "flight",
+    "u_dot_parachute": "parachute",
+}
+
+
+def failure_phase(error, stage):
+    """Simulation phase where ``error`` was raised and flight time reached.
+
+    Parameters
+    ----------
+    error : Exception
+        The exception, with its traceback.
+    stage : str
+        What the worker was doing, e.g. "sampling", "flight" or "outputs".
+
+    Returns
+    -------
+    phase : str
+        ``stage``, refined inside ``Flight`` to "flight setup" (before the
+        integration), "rail", "powered", "coast" or "parachute".
+    time : float or None
+        Last flight time reached, None if no flight was integrated.
+    """
+    from rocketpy import Flight  # pylint: disable=import-outside-toplevel
+
+    flight, phase = None, None
+    for frame, _ in traceback.walk_tb(error.__traceback__):
+        owner = frame.f_locals.get("self")
+        if isinstance(owner, Flight):
+            flight = owner
+            if phase is None and "phase" in frame.f_locals:
+                phase = frame.f_locals["phase"]
+    if flight is None or stage != "flight":
+        return stage, getattr(flight, "t", None)
+    time = getattr(flight, "t", None)
+    if phase is None:
+        return "flight setup", time
+    name = _DERIVATIVE_PHASES.get(getattr(phase.derivative, "__name__", None), "flight")
+    if name == "flight" and time is not None:
+        burn_out = flight.rocket.motor.burn_out_time
+        name = "powered" if time < burn_out else "coast"
+    return name, time
+
+
+def flatten(inputs, prefix=""):
+    """Numeric inputs of a sample as {name: value}.
+
+    Nested dictionaries are joined with "_" as in
+    ``rocketpy.tools.flatten_dict``, so single motors and surfaces get the
+    names of the sensitivity analysis (e.g. "motors_grain_density"). Lists of
+    several components get their index (e.g. "aerodynamic_surfaces_1_span").
+    Strings, booleans and curves are left out.
+    """
+    values = {}
+    for key, value in inputs.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            values.update(flatten(value, f"{name}_"))
+        elif isinstance(value, list) and value and isinstance(value[0], dict):
+            for i, item in enumerate(value):
+                values.update(flatten(item, f"{name}_{i}_" if len(value) > 1 else f"{name}_"))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[name] = float(value)
+    return values
+
+
+def _read(filename):
+    try:
+        with open(filename, "r", encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+    except FileNotFoundError:
+        return
+
+
+def count_failures(filename, unstable=True):
+    """Number of failed (and skipped, with ``unstable``) samples of a
+    campaign, without reading its inputs."""
+    count = 0
+    for name in [f"{filename}.errors.txt"] + ([f"{filename}.unstable.txt"] if unstable else []):
+        try:
+            with open(name, "r", encoding="utf-8") as file:
+                count += sum(1 for line in file if line.strip())
+        except FileNotFoundError:
+            pass
+    return count
+
+
+def load_samples(filename, unstable=True):
+    """Drawn samples of a campaign.
+
+    Parameters
+    ----------
+    filename : str
+        Campaign filename as given to ``MonteCarlo``.
+    unstable : bool, optional
+        Include the samples skipped by the static margin precheck, as
+        failures of type "StaticMargin" in phase "precheck".
+
+    Returns
+    -------
+    flown : list[dict]
+        Flattened inputs of each flown sample.
+    failures : list[dict]
+        "index", "type", "message", "phase", "time" and flattened
+        "parameters" of each failed sample. Errors files written before the
+        failures were recorded have no index, and type and phase "unknown".
+    """
+    flown = [flatten(inputs) for inputs in _read(f"{filename}.inputs.txt")]
+    failures = []
+    for line in _read(f"{filename}.errors.txt"):
+        error = line.pop("error", None) or {}
+        failures.append(
+            {
+                "index": line.pop("index", None),
+                "type": error.get("type", "unknown"),
+                "message": error.get("message", ""),
+                "phase": error.get("phase", "unknown"),
+                "time": error.get("time"),
+                "parameters": flatten(line),
+            }
+        )
+    if unstable:
+        for record in _read(f"{filename}.unstable.txt"):
+            failures.append(
+                {
+                    "index": record["index"],
+                    "type": "StaticMargin",
+                    "message": f"static margin {record['static_margin']:.2f} calibers",
+                    "phase": "precheck",
+                    "time": None,
+                    "parameters": flatten(record["inputs"]),
+                }
+            )
+    return flown, failures
+
+
+def failure_regions(flown, failures, bins=5, min_lift=1.5, min_failures=2):
+    """Parameter regions where ``failures`` cluster.
+
+    Parameters
+    ----------
+    flown, failures : list
+        As returned by ``load_samples``; ``failures`` may be one group.
+    bins : int, optional
+        Number of quantile bins of each parameter.
+    min_lift : float, optional
+        Adjacent bins whose failure rate is at least ``min_lift`` times the
+        rate outside of them make a region, reported if its own rate is at
+        least ``min_lift`` times the one outside of it.
+    min_failures : int, optional
+        Fewest failures in a reported region.
+
+    Returns
+    -------
+    list[dict]
+        "parameter", region "low" and "high" values, "failures" and
+        "samples" in the region, its failure "rate", the ratio of this rate
+        to the one outside the region ("lift", inf if every failure is in
+        it) and the share of all ``failures`` it holds ("coverage"), by
+        decreasing lift and coverage.
+    """
+    failed = [failure["parameters"] for failure in failures]
+    if not failed:
+        return []
+    regions = []
+    for parameter in sorted({name for sample in failed for name in sample}):
+        good = np.array([sample[parameter] for sample in flown if parameter in sample])
+        bad = np.array([sample[parameter] for sample in failed if parameter in sample])
+        values = np.concatenate([good, bad])
+        if np.ptp(values) == 0:
+            continue  # not drawn
+        edges = np.unique(np.quantile(values, np.linspace(0, 1, bins + 1)))
+        all_counts = np.histogram(values, edges)[0]
+        bad_counts = np.histogram(bad, edges)[0]
+        # runs of adjacent bins with a high failure rate make one region
+        bad_outside = len(bad) - bad_counts
+        rate_outside = bad_outside / np.maximum(len(values) - all_counts, 1)
+        high = bad_counts / np.maximum(all_counts, 1) >= min_lift * rate_outside
+        start = None
+        for i in range(len(high) + 1):
+            if i < len(high) and high[i]:
+                start = i if start is None else start
+                continue
+            if start is None:
+                continue
+            region = _region(parameter, edges, all_counts, bad_counts, start, i, len(bad))
+            start = None
+            if region["failures"] >= min_failures and region["lift"] >= min_lift:
+                regions.append(region)
+    return sorted(regions, key=lambda region: (-region["lift"], -region["coverage"]))
+
+
+def _region(parameter, edges, all_counts, bad_counts, start, stop, failed):
+    """Region of bins ``start`` to ``stop`` (excluded) of ``parameter``."""
+    inside, bad = all_counts[start:stop].sum(), bad_counts[start:stop].sum()
+    outside, bad_outside = all_counts.sum() - inside, bad_counts.sum() - bad
+    rate = bad / inside
+    rate_outside = bad_outside / outside if outside else 0
+    return {
+        "parameter": parameter,
+        "low": float(edges[start]),
+        "high": float(edges[stop]),
+        "failures": int(bad),
+        "samples": int(inside),
+        "rate": float(rate),
+        "lift": float(rate / rate_outside) if rate_outside else float("inf"),
+        "coverage": float(bad / failed),
+    }
+
+
+def triage(flown, failures, bins=5, top=5):
+    """Failures grouped by type and phase, each with its parameter regions.
+
+    Returns
+    -------
+    list[dict]
+        "type", "phase", "count", indices of the first failures ("indices"),
+        a sample "message" and the ``top`` "regions" of each group, by
+        decreasing count.
+    """
+    groups = {}
+    for failure in failures:
+        groups.setdefault((failure["type"], failure["phase"]), []).append(failure)
+    report = []
+    for (kind, phase), group in sorted(groups.items(), key=lambda item: -len(item[1])):
+        messages = Counter(failure["message"] for failure in group)
+        report.append(
+            {
+                "type": kind,
+                "phase": phase,
+                "count": len(group),
+                "indices": [failure["index"] for failure in group[:10]],
+                "message": messages.most_common(1)[0][0],
+                "regions": failure_regions(flown, group, bins)[:top],
+            }
+        )
+    return report
+
+
+def print_report(flown, report):
+    """Prints a ``triage`` report."""
+    failed = sum(group["count"] for group in report)
+    total = len(flown) + failed
+    print(f"{failed} of {total} drawn samples failed ({failed / max(total, 1):.1%})")
+    for group in report:
+        print(f"\n{group['type']} in {group['phase']}: {group['count']} samples")
+        if group["message"]:
+            print(f"  e.g. {group['message'][:100]}")
+        if any(index is not None for index in group["indices"]):
+            print(f"  indices {', '.join(str(index) for index in group['indices'])}")
+        if not group["regions"]:
+            print("  no parameter region stands out")
+            continue
+        print(f"  {'parameter':<45} {'region':>25} {'failed':>10} {'rate':>7} {'lift':>6}")
+        for region in group["regions"]:
+            bounds = f"[{region['low']:.5g}, {region['high']:.5g}]"
+            counts = f"{region['failures']}/{region['samples']}"
+            print(
+                f"  {region['parameter']:<45} {bounds:>25} {counts:>10} "
+                f"{region['rate']:>7.1%} {region['lift']:>6.1f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("campaign", help="campaign filename, as given to MonteCarlo")
+    parser.add_argument("--bins", type=int, default=5, help="quantile bins per parameter")
+    parser.add_argument("--top", type=int, default=5, help="regions shown per failure group")
+    parser.add_argument(
+        "--no-unstable", action="store_true", help="leave out the precheck skipped samples"
+    )
+    parser.add_argument("--json", help="save the report to this file")
+    args = parser.parse_args()
+
+    flown, failures = load_samples(args.campaign, unstable=not args.no_unstable)
+    report = triage(flown, failures, args.bins, args.top)
+    print_report(flown, report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""Configurations of the GBDP vehicles, see ``config``.
+
+``HYBRID`` is the rocket of Hybrid/sim.py and ``COTS`` the one of
+COTS/COTS_sim.py. Both offer the Cesaroni M1670 ("Solid") and their own N2O
+hybrid motor ("Hybrid"); the sim scripts ask which one to fly.
+``cots_vehicle`` and ``hybrid_vehicle`` build the options used by the launch
+window scans and the benchmarks, which need a rocket without the dialogs,
+atmosphere and nominal flight of the sim scripts. ``HYBRID_AIR_BRAKES`` are
+the air brakes Hybrid/sim.py can fly, see ``air_brakes``.
+"""
+
+from .air_brakes import ApogeeController
+from .config import (
+    AirBrakesConfig,
+    FinsConfig,
+    HybridMotorConfig,
+    NoseConfig,
+    ParachuteConfig,
+    RailButtonsConfig,
+    RocketConfig,
+    SiteConfig,
+    SolidMotorConfig,
+    TailConfig,
+    TankConfig,
+    VehicleConfig,
+    build_rocket,
+)
+
+CESARONI_M1670 = SolidMotorConfig(
+    thrust_source="motors/cesaroni/Cesaroni_M1670.eng",
+    dry_mass=1.815,
+    dry_inertia=(0.125, 0.125, 0.002),
+    nozzle_radius=33 / 1000,
+    grain_number=5,
+    grain_density=1815,
+    grain_outer_radius=33 / 1000,
+    grain_initial_inner_radius=15 / 1000,
+    grain_initial_height=120 / 1000,
+    grain_separation=5 / 1000,
+    grains_center_of_mass_position=0.397,
+    center_of_dry_mass_position=0.317,
+    burn_time=3.9,
+    throat_radius=11 / 1000,
+)
+
+# main at 800 m and drogue at apogee, same on both vehicles
+PARACHUTES = (
+    ParachuteConfig("main", cd_s=10.0, trigger=800, sampling_rate=105, lag=1.5, noise=(0, 8.3, 0.5)),
+    ParachuteConfig(
+        "drogue", cd_s=1.0, trigger="apogee", sampling_rate=105, lag=1.5, noise=(0, 8.3, 0.5)
+    ),
+)
+
+# launch site of last year's competition (EuRoC, Portugal). The two scripts
+# use different elevations for the same coordinates
+HYBRID_SITE = SiteConfig(latitude=39.389700, longitude=-8.288964, elevation=123.9)
+COTS_SITE = SiteConfig(latitude=39.389700, longitude=-8.288964, elevation=180)
+
+HYBRID_MOTOR = HybridMotorConfig(
+    thrust_source=((0, 2000), (7.43, 2000 - (2000 - 1400) / 5.2 * 7.43)),  # linear
+    dry_mass=3.11,
+    dry_inertia=(0.125, 0.125, 0.002),
+    nozzle_radius=0.014,
+    grain_number=1,
+    grain_separation=0,
+    grain_outer_radius=0.038,
+    grain_initial_inner_radius=0.0211354,
+    grain_initial_height=0.2531922,
+    grain_density=920,
+    grains_center_of_mass_position=0.28427,
+    center_of_dry_mass_position=0.28427,
+    burn_time=7.43,
+    throat_radius=0.012,
+    tank=TankConfig(
+        radius=0.074,
+        height=0.591,
+        flux_time=5.2,
+        initial_liquid_mass=4.11,
+        final_liquid_mass=0.5,
+        liquid_density=828.2592,
+        gas_density=131.7148,
+        position=1.11305,
+    ),
+)
+
+HYBRID = VehicleConfig(
+    name="Hybrid",
+    site=HYBRID_SITE,
+    rocket=RocketConfig(
+        radius=0.0805,
+        mass=25.025,
+        inertia=(16.33, 16.33, 0.099),
+        power_off_drag="rockets/calisto/powerOffDragCurve.csv",
+        power_on_drag="rockets/calisto/powerOnDragCurve.csv",
+        center_of_mass_without_motor=1.23903,
+        motor=CESARONI_M1670,
+        motor_position=0.0736,
+        rail_buttons=RailButtonsConfig(upper_button_position=0.1818, lower_button_position=0.8182),
+        nose=NoseConfig(length=0.5528, kind="parabolic", position=2.99),
+        # airfoil removed to simulate last year's fins
+        fins=FinsConfig(n=3, root_chord=0.302, tip_chord=0.13, span=0.202, position=0.3756),
+        tail=TailConfig(top_radius=0.0805, bottom_radius=0.058, length=0.0736, position=0),
+        parachutes=PARACHUTES,
+    ),
+    motors={"Solid": CESARONI_M1670, "Hybrid": HYBRID_MOTOR},
+    payload=RocketConfig(
+        radius=127 / 2000,
+        mass=1,
+        inertia=(0.1, 0.1, 0.001),
+        power_off_drag=0.5,
+        power_on_drag=0.5,
+        center_of_mass_without_motor=0,
+        parachutes=(ParachuteConfig("Main", cd_s=2.2 * 0.1379511112, trigger="apogee"),),
+    ),
+)
+
+# calisto air brakes (the drag curves of both vehicles are calisto's), braking
+# to the 3 km category apogee after the burn out of either motor
+HYBRID_AIR_BRAKES = AirBrakesConfig(
+    drag_coefficient="rockets/calisto/air_brakes_cd.csv",
+    controller=ApogeeController(target_apogee=3000, start_time=7.5, drag_per_mass=0.0005),
+    sampling_rate=20,
+)
+
+COTS = VehicleConfig(
+    name="COTS",
+    site=COTS_SITE,
+    rocket=RocketConfig(
+        radius=127 / 2000,
+        mass=14.426,
+        inertia=(6.321, 6.321, 0.034),
+        power_off_drag="rockets/calisto/powerOffDragCurve.csv",
+        power_on_drag="rockets/calisto/powerOnDragCurve.csv",
+        center_of_mass_without_motor=0,
+        motor=CESARONI_M1670,
+        motor_position=-1.255,
+        rail_buttons=RailButtonsConfig(upper_button_position=0.0818, lower_button_position=-0.6182),
+        nose=NoseConfig(length=0.55829, kind="von karman", position=1.278),
+        fins=FinsConfig(
+            n=4, root_chord=0.120, tip_chord=0.060, span=0.110, position=-1.04956,
+            cant_angle=0.5, airfoil=("airfoils/NACA0012-radians.txt", "radians"),
+        ),
+        tail=TailConfig(top_radius=0.0635, bottom_radius=0.0435, length=0.060, position=-1.194656),
+        parachutes=PARACHUTES,
+    ),
+    motors={
+        "Solid": CESARONI_M1670,
+        "Hybrid": HybridMotorConfig(
+            thrust_source=((0, 2000), (5.2, 1400)),  # linear
+            dry_mass=2,
+            dry_inertia=(0.125, 0.125, 0.002),
+            nozzle_radius=63.36 / 2000,
+            grain_number=4,
+            grain_separation=0,
+            grain_outer_radius=0.0575,
+            grain_initial_inner_radius=0.025,
+            grain_initial_height=0.1375,
+            grain_density=900,
+            grains_center_of_mass_position=0.384,
+            center_of_dry_mass_position=0.284,
+            burn_time=5.2,
+            throat_radius=26 / 2000,
+            tank=TankConfig(
+                radius=115 / 2000,
+                height=0.705,
+                flux_time=5.2,
+                initial_liquid_mass=4.11,
+                final_liquid_mass=0.5,
+                liquid_density=1220,
+                gas_density=1.9277,
+                position=1.0615,
+            ),
+        ),
+    },
+)
+
+VEHICLES = {"Hybrid": HYBRID, "COTS": COTS}
+
+
+def cots_vehicle():
+    """COTS rocket with the Cesaroni M1670 solid motor. Returns the rocket
+    and its components, named as in COTS_sim.py."""
+    return build_rocket(COTS.with_motor("Solid").rocket)
+
+
+def hybrid_vehicle():
+    """Hybrid rocket with the N2O hybrid motor of Hybrid/sim.py."""
+    return build_rocket(HYBRID.with_motor("Hybrid").rocket)
@@ -0,0 +1,201 @@
+"""Runs the GBDP benchmark scenarios and compares them against a stored
+baseline.
+
+Usage, from the repository root::
+
+    python benchmarks/run_benchmarks.py                    # all scenarios
+    python benchmarks/run_benchmarks.py fin_sweep --repeat 5
+    python benchmarks/run_benchmarks.py --update-baseline  # store new baseline
+
+Each scenario runs in a fresh interpreter so that its peak memory is not
+inflated by the previous ones. The CPU time includes the worker processes of
+the parallel scenarios, and their largest peak memory is recorded next to the
+scenario process'. The best wall time over the repetitions is compared
+against the baseline; a scenario whose wall time or peak memory (its own or
+its workers') grows past the threshold ratio is reported as a regression and
+the exit code is 1. Baselines are only meaningful on the machine they were
+recorded on.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from time import perf_counter, process_time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(HERE, ".."))  # GBDP2024 package
+
+BASELINE = os.path.join(HERE, "baseline.json")
+
+
+def peak_rss_mb(children=False):
+    """Peak resident set size of this process, or of the largest of its
+    finished child processes, in MB."""
+    try:
+        import resource  # pylint: disable=import-outside-toplevel
+    except ImportError:  # Windows
+        return float("nan")
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    peak = resource.getrusage(who).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 1024**2 if sys.platform == "darwin" else peak / 1024
+
+
+def children_cpu_time():
+    """CPU time of the finished child processes (e.g. pool workers), in s."""
+    try:
+        import resource  # pylint: disable=import-outside-toplevel
+    except ImportError:  # Windows
+        return 0.0
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def run_child(name):
+    """Runs one scenario in this process and prints its metrics as JSON."""
+    import warnings  # pylint: disable=import-outside-toplevel
+
+    warnings.filterwarnings("ignore")
+    from scenarios import SCENARIOS  # pylint: disable=import-outside-toplevel
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        start_wall = perf_counter()
+        start_cpu = process_time() + children_cpu_time()
+        stats = SCENARIOS[name](output_dir=output_dir)
+        wall_time = perf_counter() - start_wall
+        cpu_time = process_time() + children_cpu_time() - start_cpu
+    result = {
+        "wall_time": wall_time,
+        "cpu_time": cpu_time,
+        "peak_rss_mb": peak_rss_mb(),
+        "workers_peak_rss_mb": peak_rss_mb(children=True),
+        "flights": len(stats),
+        "flights_per_second": len(stats) / wall_time,
+        "solver_steps": sum(flight["solver_steps"] for flight in stats),
+    }
+    print("BENCHMARK " + json.dumps(result))
+
+
+def run_scenario(name, repeat):
+    """Runs a scenario ``repeat`` times, each in a fresh interpreter, and keeps
+    the best wall time and the largest peak memory."""
+    runs = []
+    for _ in range(repeat):
+        process = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", name],
+            capture_output=True, text=True, cwd=HERE, check=False,
+        )
+        lines = [
+            line for line in process.stdout.splitlines() if line.startswith("BENCHMARK ")
+        ]
+        if process.returncode != 0 or not lines:
+            raise RuntimeError(f"Scenario {name} failed:\n{process.stderr}")
+        runs.append(json.loads(lines[-1][len("BENCHMARK "):]))
+    best = min(runs, key=lambda run: run["wall_time"])
+    best["peak_rss_mb"] = max(run["peak_rss_mb"] for run in runs)
+    best["workers_peak_rss_mb"] = max(run["workers_peak_rss_mb"] for run in runs)
+    best["repeat"] = repeat
+    return best
+
+
+def compare(results, baseline, time_threshold, memory_threshold):
+    """Prints the comparison table and returns the names of the regressed
+    scenarios."""
+    regressions = []
+    print(
+        f"{'scenario':<20}{'wall [s]':>10}{'base [s]':>10}{'ratio':>8}"
+        f"{'RSS [MB]':>10}{'base':>8}{'ratio':>8}{'workers':>9}{'base':>8}{'ratio':>8}"
+        f"{'flights/s':>11}  status"
+    )
+    for name, result in results.items():
+        reference = baseline.get("scenarios", {}).get(name)
+        if reference is None:
+            print(
+                f"{name:<20}{result['wall_time']:>10.2f}{'-':>10}{'-':>8}"
+                f"{result['peak_rss_mb']:>10.0f}{'-':>8}{'-':>8}"
+                f"{result['workers_peak_rss_mb']:>9.0f}{'-':>8}{'-':>8}"
+                f"{result['flights_per_second']:>11.2f}  no baseline"
+            )
+            continue
+        time_ratio = result["wall_time"] / reference["wall_time"]
+        memory_ratio = result["peak_rss_mb"] / reference["peak_rss_mb"]
+        # scenarios without workers have no child peak, nothing to compare
+        workers_ratio = 0.0
+        if result["workers_peak_rss_mb"] and reference.get("workers_peak_rss_mb"):
+            workers_ratio = result["workers_peak_rss_mb"] / reference["workers_peak_rss_mb"]
+        status = "ok"
+        if (
+            time_ratio > time_threshold
+            or memory_ratio > memory_threshold
+            or workers_ratio > memory_threshold
+        ):
+            status = "REGRESSION"
+            regressions.append(name)
+        print(
+            f"{name:<20}{result['wall_time']:>10.2f}{reference['wall_time']:>10.2f}"
+            f"{time_ratio:>8.2f}{result['peak_rss_mb']:>10.0f}"
+            f"{reference['peak_rss_mb']:>8.0f}{memory_ratio:>8.2f}"
+            f"{result['workers_peak_rss_mb']:>9.0f}"
+            f"{reference.get('workers_peak_rss_mb', 0.0):>8.0f}{workers_ratio:>8.2f}"
+            f"{result['flights_per_second']:>11.2f}  {status}"
+        )
+    return regressions
+
+
+def main():
+    from scenarios import SCENARIOS  # pylint: disable=import-outside-toplevel
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", 1)[0])
+    parser.add_argument("scenarios", nargs="*", help="defaults to all scenarios")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--time-threshold", type=float, default=1.25)
+    parser.add_argument("--memory-threshold", type=float, default=1.25)
+    parser.add_argument("--output", help="also save the results to this JSON file")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child)
+        return 0
+
+    names = args.scenarios or list(SCENARIOS)
+    results = {}
+    for name in names:
+        print(f"Running {name}...", flush=True)
+        results[name] = run_scenario(name, args.repeat)
+
+    try:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+    except FileNotFoundError:
+        baseline = {}
+    regressions = compare(results, baseline, args.time_threshold, args.memory_threshold)
+
+    report = {
+        "machine": platform.platform(),
+        "python": platform.python_version(),
+        "scenarios": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    if args.update_baseline:
+        report["scenarios"] = {**baseline.get("scenarios", {}), **results}
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    if regressions:
+        print(f"Performance regressions: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
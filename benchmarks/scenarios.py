@@ -0,0 +1,232 @@
+"""Fixed, offline benchmark scenarios for the GBDP simulation pipelines.
+
+The vehicles come from ``GBDP2024.vehicles`` and mirror the constants of
+COTS/COTS_sim.py (solid motor option) and Hybrid/sim.py (hybrid motor option).
+The environment is built from a bundled reanalysis file, so no scenario needs
+network access or user input.
+"""
+
+import os
+import random
+
+import numpy as np
+from rocketpy import Environment, Flight, MonteCarlo
+from rocketpy.stochastic import (
+    StochasticFlight,
+    StochasticNoseCone,
+    StochasticParachute,
+    StochasticRailButtons,
+    StochasticRocket,
+    StochasticSolidMotor,
+    StochasticTail,
+    StochasticTrapezoidalFins,
+)
+
+from GBDP2024.batch_flight import BatchFlight
+from GBDP2024.campaign import run_parallel
+from GBDP2024.profiling import Profiler
+from GBDP2024.shared_environment import SharedEnvironmentProfiles, SharedStochasticEnvironment
+from GBDP2024.vehicles import cots_vehicle, hybrid_vehicle
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data")
+SEED = 2024
+
+
+def reanalysis_environment(elevation):
+    """EuRoC 2023 launch site at 12h on the 14th, from the bundled ERA5 file."""
+    env = Environment(
+        date=(2023, 10, 14, 12),
+        latitude=39.389700,
+        longitude=-8.288964,
+        elevation=elevation,
+    )
+    env.set_atmospheric_model(
+        type="Reanalysis",
+        file=os.path.join(DATA, "weather", "euroc_2023_all_windows.nc"),
+        dictionary="ECMWF_v0",
+    )
+    return env
+
+
+## SCENARIOS
+# Each scenario runs its workload and returns the solver statistics of every
+# integrated flight. Flights are not kept alive, so they do not inflate the
+# peak memory of the dispersion.
+
+
+def cots_reanalysis(output_dir=None):
+    rocket, _ = cots_vehicle()
+    env = reanalysis_environment(elevation=180)
+    flight = Flight(rocket=rocket, environment=env, rail_length=5.2, inclination=85, heading=0)
+    return [Profiler.flight_stats(flight)]
+
+
+def hybrid_reanalysis(output_dir=None):
+    rocket, _ = hybrid_vehicle()
+    env = reanalysis_environment(elevation=123.9)
+    flight = Flight(rocket=rocket, environment=env, rail_length=5.2, inclination=85, heading=0)
+    return [Profiler.flight_stats(flight)]
+
+
+def fin_sweep(output_dir=None):
+    """Dynamic stability fin position sweep of sim_results.py."""
+    rocket, _ = hybrid_vehicle()
+    env = Environment()
+    env.set_atmospheric_model(type="custom_atmosphere", wind_v=-5)
+    stats = []
+    for factor in [-0.5, -0.2, 0.1, 0.4, 0.7]:
+        rocket.aerodynamic_surfaces.pop(-1)
+        rocket.add_trapezoidal_fins(
+            n=3, root_chord=0.302, tip_chord=0.13, span=0.202,
+            position=0.3756 * factor,
+        )
+        flight = Flight(
+            rocket=rocket, environment=env, rail_length=5.2, inclination=90,
+            heading=0, max_time_step=0.01, max_time=5,
+            terminate_on_apogee=True, verbose=False,
+        )
+        stats.append(Profiler.flight_stats(flight))
+    return stats
+
+
+def dispersion(output_dir, number_of_simulations=100, workers=2):
+    """COTS solid Monte Carlo with the uncertainties of COTS_montecarlo.py,
+    run like the scripts: ``run_parallel`` on shared environment profiles."""
+    np.random.seed(SEED)
+    random.seed(SEED)
+    rocket, parts = cots_vehicle()
+    env = reanalysis_environment(elevation=180)
+    nominal = Flight(rocket=rocket, environment=env, rail_length=5.2, inclination=85, heading=0)
+
+    stochastic_rocket = StochasticRocket(
+        rocket=rocket, radius=0.0127 / 2000, mass=(14.426, 0.5, "normal"),
+        inertia_11=(6.321, 0), inertia_22=0.01, inertia_33=0.01,
+        center_of_mass_without_motor=0,
+    )
+    stochastic_rocket.add_motor(
+        StochasticSolidMotor(
+            solid_motor=parts["motor"],
+            burn_start_time=(0, 0.1, "binomial"),
+            grains_center_of_mass_position=0.001,
+            grain_density=50,
+            grain_separation=1 / 1000,
+            grain_initial_height=1 / 1000,
+            grain_initial_inner_radius=0.375 / 1000,
+            grain_outer_radius=0.375 / 1000,
+            total_impulse=(6500, 1000),
+            throat_radius=0.5 / 1000,
+            nozzle_radius=0.5 / 1000,
+            nozzle_position=0.001,
+        ),
+        position=0.001,
+    )
+    stochastic_rocket.add_nose(
+        StochasticNoseCone(nosecone=parts["nose_cone"], length=0.001),
+        position=(1.134, 0.001),
+    )
+    stochastic_rocket.add_trapezoidal_fins(
+        StochasticTrapezoidalFins(
+            trapezoidal_fins=parts["fin_set"], root_chord=0.0005,
+            tip_chord=0.0005, span=0.0005,
+        ),
+        position=(0.001, "normal"),
+    )
+    stochastic_rocket.add_tail(
+        StochasticTail(
+            tail=parts["tail"], top_radius=0.001, bottom_radius=0.001, length=0.001
+        )
+    )
+    stochastic_rocket.set_rail_buttons(
+        StochasticRailButtons(rail_buttons=parts["rail_buttons"], buttons_distance=0.001),
+        lower_button_position=(0.001, "normal"),
+    )
+    stochastic_rocket.add_parachute(
+        StochasticParachute(parachute=parts["main"], cd_s=0.1, lag=0.1)
+    )
+    stochastic_rocket.add_parachute(
+        StochasticParachute(parachute=parts["drogue"], cd_s=0.07, lag=0.2)
+    )
+
+    profiler = Profiler()
+    with SharedEnvironmentProfiles.create(env) as profiles:
+        monte_carlo = MonteCarlo(
+            filename=os.path.join(output_dir, "dispersion"),
+            environment=SharedStochasticEnvironment(
+                profiles, wind_velocity_x_factor=(1.0, 0.1), wind_velocity_y_factor=(1.0, 0.1)
+            ),
+            rocket=stochastic_rocket,
+            flight=StochasticFlight(flight=nominal, inclination=(84.7, 1), heading=(53, 2)),
+        )
+        run_parallel(
+            monte_carlo, number_of_simulations, workers=workers, seed=SEED,
+            profiler=profiler, include_function_data=False,
+        )
+    return profiler.samples
+
+
+def batch_dispersion(output_dir=None, number_of_simulations=1000):
+    """The main scalars of the COTS dispersion, flown by BatchFlight."""
+    rng = np.random.default_rng(SEED)
+    rocket, parts = cots_vehicle()
+    env = reanalysis_environment(elevation=180)
+    n = number_of_simulations
+    batch = BatchFlight(
+        rocket,
+        env,
+        rail_length=5.2,
+        inclination=rng.normal(84.7, 1, n),
+        heading=rng.normal(53, 2, n),
+        mass_offset=rng.normal(0, 0.5, n),
+        impulse_factor=rng.normal(6500, 1000, n) / parts["motor"].total_impulse,
+    )
+    # the batch steps all flights together, count its steps once
+    return [{"solver_steps": batch.steps}] + [{"solver_steps": 0}] * (n - 1)
+
+
+# agreement of BatchFlight with Flight, checked by batch_validation
+APOGEE_TOLERANCE = 1e-3  # relative, on the apogee above ground level
+IMPACT_TOLERANCE = 30  # m, distance between the landing points
+
+
+def batch_validation(output_dir=None):
+    """BatchFlight against Flight for the COTS vehicle at three rail
+    settings. Fails if the apogee or landing point drift past the
+    tolerances."""
+    rocket, _ = cots_vehicle()
+    env = reanalysis_environment(elevation=180)
+    settings = ((85, 0), (80, 53), (88, 200))
+    batch = BatchFlight(
+        rocket,
+        env,
+        rail_length=5.2,
+        inclination=np.array([inclination for inclination, _ in settings]),
+        heading=np.array([heading for _, heading in settings]),
+    )
+    stats = []
+    for index, (inclination, heading) in enumerate(settings):
+        flight = Flight(
+            rocket=rocket, environment=env, rail_length=5.2,
+            inclination=inclination, heading=heading,
+        )
+        apogee_error = abs(batch.apogee[index] - flight.apogee) / (flight.apogee - env.elevation)
+        impact_error = np.hypot(
+            batch.x_impact[index] - flight.x_impact, batch.y_impact[index] - flight.y_impact
+        )
+        if apogee_error > APOGEE_TOLERANCE or impact_error > IMPACT_TOLERANCE:
+            raise AssertionError(
+                f"BatchFlight disagrees with Flight at inclination {inclination}, heading "
+                f"{heading}: apogee error {100 * apogee_error:.3f} %, impact error "
+                f"{impact_error:.1f} m"
+            )
+        stats.append(Profiler.flight_stats(flight))
+    return stats
+
+
+SCENARIOS = {
+    "cots_reanalysis": cots_reanalysis,
+    "hybrid_reanalysis": hybrid_reanalysis,
+    "fin_sweep": fin_sweep,
+    "dispersion_100": dispersion,
+    "batch_dispersion_1000": batch_dispersion,
+    "batch_validation": batch_validation,
+}
@@ -0,0 +1,130 @@
+"""Startup time of the GBDP analysis scripts and command line tools.
+
+Short analysis runs (the Monte Carlo results scripts, triage, the campaign
+comparison) should not pay for rocketpy, matplotlib or NetCDF before they
+print anything. Each target is started in a fresh interpreter, like a user
+would: a script runs its leading imports (read with ``ast``, up to its first
+other statement, from its own folder), a module is imported. The best total
+wall time over the repetitions, interpreter start included, is compared
+against a budget, and the heavy modules the target loaded are listed.
+
+Usage, from the repository root::
+
+    python benchmarks/startup.py                 # all targets
+    python benchmarks/startup.py triage --repeat 10 --budget 0.5
+
+The exit code is 1 if a target is over budget.
+"""
+
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+from time import perf_counter
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+# name -> script file (relative to the repository) or package module
+TARGETS = {
+    "montecarlo_results": "Hybrid/montecarlo_results.py",
+    "COTS_montecarlo_results": "COTS/COTS_montecarlo_results.py",
+    "triage": "GBDP2024.triage",
+    "compare": "GBDP2024.compare",
+    "running_statistics": "GBDP2024.running_statistics",
+    "vehicles": "GBDP2024.vehicles",
+}
+HEAVY_MODULES = ("rocketpy", "matplotlib", "scipy", "netCDF4", "tkinter")
+
+
+def leading_imports(filename):
+    """Source of the imports at the top of a script, with the ``sys.path``
+    changes between them."""
+    with open(filename, encoding="utf-8") as file:
+        tree = ast.parse(file.read())
+    statements = []
+    for statement in tree.body:
+        if isinstance(statement, (ast.Import, ast.ImportFrom)):
+            statements.append(statement)
+        elif isinstance(statement, ast.Expr) and "sys.path" in ast.unparse(statement):
+            statements.append(statement)
+        elif not (isinstance(statement, ast.Expr) and isinstance(statement.value, ast.Constant)):
+            break  # docstrings are skipped, anything else ends the imports
+    return ast.unparse(ast.Module(body=statements, type_ignores=[]))
+
+
+def run_child(name):
+    """Starts target ``name`` in this process and prints its metrics as
+    JSON."""
+    target = TARGETS[name]
+    start = perf_counter()
+    if target.endswith(".py"):
+        filename = os.path.join(ROOT, target)
+        os.chdir(os.path.dirname(filename))
+        sys.path.insert(0, os.getcwd())
+        exec(compile(leading_imports(filename), filename, "exec"), {"__name__": "startup"})  # pylint: disable=exec-used
+    else:
+        sys.path.insert(0, ROOT)
+        __import__(target)
+    result = {
+        "import_time": perf_counter() - start,
+        "modules": len(sys.modules),
+        "heavy": [module for module in HEAVY_MODULES if module in sys.modules],
+    }
+    print("STARTUP " + json.dumps(result))
+
+
+def run_target(name, repeat):
+    """Starts a target ``repeat`` times and keeps the fastest start."""
+    runs = []
+    for _ in range(repeat):
+        start = perf_counter()
+        process = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", name],
+            capture_output=True, text=True, check=False,
+        )
+        wall_time = perf_counter() - start
+        lines = [line for line in process.stdout.splitlines() if line.startswith("STARTUP ")]
+        if process.returncode != 0 or not lines:
+            raise RuntimeError(f"Target {name} failed:\n{process.stderr}")
+        runs.append({"wall_time": wall_time, **json.loads(lines[-1][len("STARTUP "):])})
+    return min(runs, key=lambda run: run["wall_time"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n", 1)[0])
+    parser.add_argument("targets", nargs="*", help="defaults to all targets")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=1.0, help="seconds")
+    parser.add_argument("--output", help="also save the results to this JSON file")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child)
+        return 0
+
+    results = {name: run_target(name, args.repeat) for name in args.targets or TARGETS}
+    over = []
+    print(f"{'target':<26}{'start [s]':>10}{'imports [s]':>12}{'modules':>9}  heavy modules")
+    for name, result in results.items():
+        status = ""
+        if result["wall_time"] > args.budget:
+            status = "  OVER BUDGET"
+            over.append(name)
+        print(
+            f"{name:<26}{result['wall_time']:>10.3f}{result['import_time']:>12.3f}"
+            f"{result['modules']:>9}  {', '.join(result['heavy']) or '-'}{status}"
+        )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump({"budget": args.budget, "targets": results}, file, indent=2)
+    if over:
+        print(f"Over the {args.budget} s budget: {', '.join(over)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())